@@ -0,0 +1,232 @@
+"""
+Destilación de la CNN de producción (maestro) en modelos compactos (alumnos): MobileNet
+v1 de ancho reducido (alpha), menor resolución interna y cabeza densa pequeña. Cada
+alumno aprende de las etiquetas reales y de las probabilidades suavizadas del maestro
+(temperatura T); al final se imprime una tabla precisión vs. latencia.
+
+Los alumnos se exportan igual que TrainCNN.py: entrada uint8 de IMG_SIZE×IMG_SIZE, con el
+Resizing a su resolución y la capa "preprocess" dentro del grafo. Por eso basta con apuntar
+LECHUGA_MODEL_PATH al alumno elegido para que `classify_image` lo use sin cambios.
+
+Uso:
+    python DistillCNN.py --teacher ModeloFinal4.keras
+    python DistillCNN.py --teacher ModeloFinal4.keras --students 0.25:128:64,0.5:160:128 --max-drop 0.02
+    python DistillCNN.py --teacher viejo.keras --teacher-scale mobilenet --packed DatasetPacked/index.json
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers, ops
+from tensorflow.keras.applications import MobileNet
+from tensorflow.keras.callbacks import EarlyStopping
+
+from cnn_pipeline import (build_dataset, build_record_dataset, float_input_model, load_serving_model,
+                          preprocessing_layer, serving_model)
+
+DATA_DIR = "DatasetSplitHibrido"
+BATCH_SIZE = 16
+NUM_CLASSES = 3
+# alpha:resolución:neuronas de la cabeza
+DEFAULT_STUDENTS = "0.25:128:64,0.5:128:64,0.5:160:128,0.75:192:128"
+
+
+class Distiller(keras.Model):
+    """
+    Entrena `student` con alpha·CE(etiqueta, alumno) + (1-alpha)·T²·KL(maestro_T ‖ alumno_T).
+    Ambos modelos terminan en softmax; log(p) recupera los logits salvo una constante,
+    que softmax ignora.
+    """
+
+    def __init__(self, student: keras.Model, teacher: keras.Model, alpha: float = 0.3,
+                 temperature: float = 4.0):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.alpha = alpha
+        self.temperature = temperature
+        self.student_loss_fn = keras.losses.CategoricalCrossentropy()
+        self.distillation_loss_fn = keras.losses.KLDivergence()
+
+    def call(self, x, training=False):
+        return self.student(x, training=training)
+
+    def _soft(self, probs):
+        return ops.softmax(ops.log(ops.clip(probs, 1e-7, 1.0)) / self.temperature, axis=-1)
+
+    def compute_loss(self, x=None, y=None, y_pred=None, sample_weight=None, **kwargs):
+        teacher_pred = self.teacher(x, training=False)
+        student_loss = self.student_loss_fn(y, y_pred, sample_weight=sample_weight)
+        distill_loss = self.distillation_loss_fn(self._soft(teacher_pred), self._soft(y_pred),
+                                                 sample_weight=sample_weight)
+        return self.alpha * student_loss + (1 - self.alpha) * distill_loss * self.temperature ** 2
+
+
+def parse_students(spec: str) -> list[tuple[float, int, int]]:
+    out = []
+    for item in spec.split(","):
+        alpha, res, head = item.strip().split(":")
+        out.append((float(alpha), int(res), int(head)))
+    return out
+
+
+def build_student(alpha: float, res: int, head: int, img_size: int, weights: str) -> keras.Sequential:
+    """
+    MobileNet v1 reducida. La entrada sigue siendo img_size (lo que envía el bot) y se
+    redimensiona dentro del grafo; la normalización es la de MobileNet ([-1, 1]), la que
+    esperan los pesos de ImageNet.
+    """
+    try:
+        base = MobileNet(input_shape=(res, res, 3), alpha=alpha, include_top=False, weights=weights)
+    except Exception as e:   # sin red o combinación alpha/resolución sin pesos publicados
+        print(f"⚠️ Sin pesos '{weights}' para alpha={alpha} res={res} ({e}); se entrena desde cero")
+        base = MobileNet(input_shape=(res, res, 3), alpha=alpha, include_top=False, weights=None)
+    stack = [layers.Input(shape=(img_size, img_size, 3))]
+    if res != img_size:
+        stack.append(layers.Resizing(res, res, name="resize"))
+    stack += [
+        preprocessing_layer("mobilenet"),
+        base,
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.2),
+        layers.Dense(head, activation='relu'),
+        layers.Dropout(0.2),
+        layers.Dense(NUM_CLASSES, activation='softmax', name='predictions'),
+    ]
+    return keras.Sequential(stack, name=f"alumno_a{alpha:g}_r{res}_h{head}")
+
+
+def _as_uint8(ds: tf.data.Dataset) -> tf.data.Dataset:
+    # sin aumentos los píxeles son enteros 0–255: el cast es exacto
+    return ds.map(lambda x, y: (tf.cast(x, tf.uint8), y))
+
+
+def measure_latency(model: keras.Model, img_size: int, runs: int = 50) -> dict:
+    """Latencia de una imagen como en el bot (model.predict sobre un lote uint8 de 1)."""
+    x = np.random.default_rng(0).integers(0, 256, (1, img_size, img_size, 3), dtype=np.uint8)
+    for _ in range(5):
+        model.predict(x, verbose=0)
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        model.predict(x, verbose=0)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {"p50_ms": times[len(times) // 2], "p95_ms": times[int(len(times) * 0.95) - 1]}
+
+
+def evaluate(model: keras.Model, test_ds: tf.data.Dataset, img_size: int, path: str) -> dict:
+    model.compile(loss='categorical_crossentropy', metrics=['accuracy'])
+    _, acc = model.evaluate(_as_uint8(test_ds), verbose=0)
+    return {"accuracy": float(acc), "params": int(model.count_params()),
+            "size_mb": os.path.getsize(path) / 1e6, **measure_latency(model, img_size)}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Destilación de la CNN en alumnos compactos.")
+    p.add_argument("--teacher", required=True, help="modelo .keras de producción")
+    p.add_argument("--teacher-scale", choices=("unit", "mobilenet"), default="unit",
+                   help="normalización del maestro si no trae capa 'preprocess' (TrainCNN.py: unit)")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--packed", default=None, help="index.json de pack_dataset.py en lugar de las carpetas")
+    p.add_argument("--students", default=DEFAULT_STUDENTS, help="alpha:resolución:cabeza separados por comas")
+    p.add_argument("--epochs", type=int, default=20)
+    p.add_argument("--lr", type=float, default=5e-4)
+    p.add_argument("--alpha", type=float, default=0.3, help="peso de las etiquetas reales (resto: maestro)")
+    p.add_argument("--temperature", type=float, default=4.0)
+    p.add_argument("--weights", default="imagenet", help="pesos iniciales de los alumnos ('none' = aleatorios)")
+    p.add_argument("--max-drop", type=float, default=0.02,
+                   help="pérdida de precisión aceptable frente al maestro para elegir alumno")
+    p.add_argument("--out", default=None, help="carpeta de resultados")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    tf.config.set_visible_devices([], 'GPU')
+    out_dir = args.out or f"destilacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(out_dir, exist_ok=True)
+
+    teacher = load_serving_model(args.teacher, args.teacher_scale)
+    img_size = teacher.input_shape[1]
+    print(f"✓ Maestro: {args.teacher} ({teacher.count_params():,} parámetros, entrada {img_size}px)")
+
+    if args.packed:
+        make = lambda split, **kw: build_record_dataset(args.packed, split, BATCH_SIZE, NUM_CLASSES, **kw)
+    else:
+        make = lambda split, **kw: build_dataset(os.path.join(args.data_dir, split), img_size, BATCH_SIZE,
+                                                 NUM_CLASSES, **kw)
+    train_ds, class_labels, class_counts = make("train", training=True)
+    val_ds, _, _ = make("val")
+    test_ds, _, _ = make("test")
+    print(f"✓ Clases: {class_labels} · distribución {dict(zip(class_labels, class_counts.tolist()))}")
+    # pesos 'balanced', igual que compute_class_weight en TrainCNN.py
+    class_weight = {i: float(class_counts.sum() / (NUM_CLASSES * c)) if c else 1.0
+                    for i, c in enumerate(class_counts)}
+
+    teacher_path = os.path.join(out_dir, "maestro.keras")
+    teacher.save(teacher_path)
+    rows = [{"model": "maestro", "alpha": 1.0, "res": img_size, "head": None,
+             **evaluate(teacher, test_ds, img_size, teacher_path)}]
+    print(f"  maestro: acc={rows[0]['accuracy']:.4f} p50={rows[0]['p50_ms']:.1f} ms")
+
+    teacher_float = float_input_model(teacher)
+    weights = None if args.weights.lower() == "none" else args.weights
+    for alpha, res, head in parse_students(args.students):
+        student = build_student(alpha, res, head, img_size, weights)
+        print(f"\n[ALUMNO] {student.name}: {student.count_params():,} parámetros")
+        distiller = Distiller(student, teacher_float, alpha=args.alpha, temperature=args.temperature)
+        distiller.compile(optimizer=keras.optimizers.Adam(learning_rate=args.lr), metrics=['accuracy'])
+        t0 = time.time()
+        distiller.fit(train_ds, validation_data=val_ds, epochs=args.epochs, class_weight=class_weight,
+                      callbacks=[EarlyStopping(monitor='val_accuracy', patience=5, mode='max',
+                                               restore_best_weights=True)], verbose=2)
+        path = os.path.join(out_dir, f"{student.name}.keras")
+        exported = serving_model(student)
+        exported.save(path)
+        row = {"model": student.name, "alpha": alpha, "res": res, "head": head,
+               "train_min": (time.time() - t0) / 60, **evaluate(exported, test_ds, img_size, path)}
+        rows.append(row)
+        print(f"  {student.name}: acc={row['accuracy']:.4f} p50={row['p50_ms']:.1f} ms")
+
+    # Tabla precisión vs. latencia
+    base = rows[0]
+    print(f"\n=== Precisión vs. latencia (test, {os.cpu_count()} CPU, lote de 1 imagen) ===")
+    print(f"{'modelo':<26}{'acc':>8}{'Δacc':>8}{'p50 ms':>9}{'p95 ms':>9}{'x vel.':>8}{'parámetros':>13}{'MB':>7}")
+    for r in rows:
+        r["acc_drop"] = base["accuracy"] - r["accuracy"]
+        r["speedup"] = base["p50_ms"] / r["p50_ms"]
+        print(f"{r['model']:<26}{r['accuracy']:>8.4f}{-r['acc_drop']:>+8.4f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['speedup']:>8.2f}{r['params']:>13,}{r['size_mb']:>7.1f}")
+    with open(os.path.join(out_dir, "tabla.csv"), "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[-1].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # El alumno más rápido dentro de la pérdida aceptable
+    ok = [r for r in rows[1:] if r["acc_drop"] <= args.max_drop]
+    choice = min(ok, key=lambda r: r["p50_ms"]) if ok else None
+    summary = {"teacher": os.path.abspath(args.teacher), "rows": rows,
+               "chosen": choice["model"] if choice else None, "max_drop": args.max_drop}
+    with open(os.path.join(out_dir, "resumen.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+    if choice:
+        chosen_path = os.path.join(out_dir, "alumno_elegido.keras")
+        shutil.copyfile(os.path.join(out_dir, f"{choice['model']}.keras"), chosen_path)
+        print(f"\n✅ Elegido: {choice['model']} (x{choice['speedup']:.2f}, Δacc {-choice['acc_drop']:+.4f})")
+        print(f"   LECHUGA_MODEL_PATH={chosen_path}")
+    else:
+        print(f"\n⚠️ Ningún alumno queda a menos de {args.max_drop:.2%} del maestro")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
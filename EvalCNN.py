@@ -0,0 +1,246 @@
+"""
+Compara variantes de la CNN (.keras, .tflite, otra resolución de entrada) sobre el split
+de test con el mismo camino que el bot: decodificación de `functionality._load_image_array`
+(PIL + EXIF), normalización de `_get_preprocess` (capa "preprocess" o CNN_LEGACY_PREPROCESS)
+y los hilos de TF de `resource_profile`. Para cada variante: matriz de confusión, F1 por
+clase, latencia p50/p99 de una imagen, throughput por lotes y pico de memoria.
+
+Cada variante se evalúa en un proceso nuevo, así el pico de memoria es solo suyo.
+
+Uso:
+    python EvalCNN.py ModeloFinal4.keras alumno_elegido.keras
+    python EvalCNN.py actual=ModeloFinal4.keras lite=modelo.tflite --split test --json evaluacion.json
+    python EvalCNN.py viejo.keras --legacy-scale mobilenet --batch-size 64 --latency-runs 300
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot")
+DATA_DIR = "DatasetSplitHibrido"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_split(directory: str) -> tuple[list[str], list[int], list[str]]:
+    """Como `cnn_pipeline.list_image_files` (clases en orden alfabético), sin importar TF aquí."""
+    classes = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    paths, labels = [], []
+    for idx, name in enumerate(classes):
+        for root, _, files in sorted(os.walk(os.path.join(directory, name))):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, fname))
+                    labels.append(idx)
+    return paths, labels, classes
+
+
+def parse_variant(spec: str) -> tuple[str, str]:
+    """'nombre=ruta' o solo 'ruta' (el nombre es el archivo sin extensión)."""
+    name, sep, path = spec.partition("=")
+    if not sep:
+        path, name = spec, os.path.splitext(os.path.basename(spec))[0]
+    return name, path
+
+
+class KerasVariant:
+    """Modelo .keras cargado y servido exactamente como en el bot."""
+
+    def __init__(self, path: str):
+        from model_registry import load_cnn
+
+        self.model, _ = load_cnn(path)
+        self.input_size = self.model.input_shape[1] or 224
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        import functionality as f
+        return f._predict_probs(batch, self.model)
+
+
+class TFLiteVariant:
+    """
+    Intérprete TFLite. Entrada uint8 sin cuantizar = modelo exportado con la capa
+    "preprocess" (píxeles tal cual); entrada float o cuantizada = sin ella, se normaliza
+    con CNN_LEGACY_PREPROCESS como haría el bot.
+    """
+
+    def __init__(self, path: str):
+        import tensorflow as tf
+        import resource_profile
+
+        self.interpreter = tf.lite.Interpreter(model_path=path,
+                                               num_threads=resource_profile.configure().tf_intra_op)
+        self.interpreter.allocate_tensors()
+        self._in = self.interpreter.get_input_details()[0]
+        self._out = self.interpreter.get_output_details()[0]
+        self.input_size = int(self._in["shape"][1]) or 224
+        scale, _ = self._in["quantization"]
+        self._raw = self._in["dtype"] == np.uint8 and scale in (0.0, 1.0)
+
+    def _prepare(self, batch: np.ndarray) -> np.ndarray:
+        import functionality as f
+
+        if self._raw:
+            return batch
+        x = np.asarray(f._get_preprocess()(batch), dtype=np.float32)
+        scale, zero = self._in["quantization"]
+        if self._in["dtype"] != np.float32 and scale:
+            info = np.iinfo(self._in["dtype"])
+            x = np.clip(np.round(x / scale + zero), info.min, info.max)
+        return x.astype(self._in["dtype"])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        import functionality as f
+
+        if self._in["shape"][0] != len(batch):
+            self.interpreter.resize_tensor_input(self._in["index"], [len(batch), *self._in["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self._in = self.interpreter.get_input_details()[0]
+            self._out = self.interpreter.get_output_details()[0]
+        self.interpreter.set_tensor(self._in["index"], self._prepare(batch))
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self._out["index"]).astype(np.float64)
+        scale, zero = self._out["quantization"]
+        if scale:
+            out = (out - zero) * scale
+        return f._as_probs(out.reshape(len(batch), -1))
+
+
+def classification_metrics(labels: np.ndarray, preds: np.ndarray, n_classes: int) -> dict:
+    from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+
+    precision, recall, f1, support = precision_recall_fscore_support(
+        labels, preds, labels=list(range(n_classes)), zero_division=0)
+    return {
+        "accuracy": float((labels == preds).mean()),
+        "f1_macro": float(f1.mean()),
+        "precision": precision.tolist(),
+        "recall": recall.tolist(),
+        "f1": f1.tolist(),
+        "support": support.tolist(),
+        "confusion": confusion_matrix(labels, preds, labels=list(range(n_classes))).tolist(),
+    }
+
+
+def evaluate_variant(name: str, path: str, paths: list[str], labels: list[int], n_classes: int,
+                     batch_size: int, latency_runs: int) -> dict:
+    """(en un proceso propio) Carga, predice el split completo y mide latencia, throughput y memoria."""
+    sys.path.insert(0, BOT_DIR)
+    import resource_profile
+    resource_profile.configure()   # hilos de BLAS/oneDNN antes de importar TF, como el bot
+    import tensorflow as tf
+    import functionality as f
+    from cnn_pipeline import _memory_mb
+
+    tf.config.set_visible_devices([], 'GPU')
+    base_mb, _ = _memory_mb()
+    t0 = time.perf_counter()
+    variant = TFLiteVariant(path) if path.endswith(".tflite") else KerasVariant(path)
+    load_s = time.perf_counter() - t0
+    images = np.stack([f._load_image_array(p, variant.input_size) for p in paths])
+    data_mb = images.nbytes / 2**20
+
+    # throughput: el split completo en lotes, tras un lote de calentamiento
+    variant.predict(images[:batch_size])
+    probs = []
+    t0 = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        probs.append(variant.predict(images[i:i + batch_size]))
+    batch_s = time.perf_counter() - t0
+    probs = np.concatenate(probs)
+
+    # latencia: una imagen por llamada, como una foto en el bot
+    for i in range(5):
+        variant.predict(images[i % len(images)][None])
+    times = []
+    for i in range(latency_runs):
+        x = images[i % len(images)][None]
+        t0 = time.perf_counter()
+        variant.predict(x)
+        times.append((time.perf_counter() - t0) * 1000)
+
+    _, peak_mb = _memory_mb()
+    return {
+        "name": name,
+        "path": os.path.abspath(path),
+        "format": "tflite" if path.endswith(".tflite") else "keras",
+        "input_size": variant.input_size,
+        "size_mb": os.path.getsize(path) / 1e6,
+        "load_s": load_s,
+        **classification_metrics(np.asarray(labels), probs.argmax(axis=1), n_classes),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "images_per_second": len(images) / batch_s,
+        "peak_mb": peak_mb,
+        # pico del proceso menos lo que ya ocupaban TF/bot y las imágenes decodificadas
+        "model_mb": max(0.0, peak_mb - base_mb - data_mb),
+    }
+
+
+def print_report(rows: list[dict], classes: list[str], split: str, n_images: int, batch_size: int) -> None:
+    print(f"\n=== {split}: {n_images} imágenes · {os.cpu_count()} CPU · lotes de {batch_size} ===")
+    f1_cols = "".join(f"{'F1 ' + c[:10]:>14}" for c in classes)
+    print(f"{'variante':<22}{'px':>5}{'acc':>8}{'F1 macro':>10}{f1_cols}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'img/s':>8}{'pico MB':>9}{'Δ MB':>7}{'archivo MB':>11}")
+    for r in rows:
+        f1s = "".join(f"{v:>14.4f}" for v in r["f1"])
+        print(f"{r['name'][:21]:<22}{r['input_size']:>5}{r['accuracy']:>8.4f}{r['f1_macro']:>10.4f}{f1s}"
+              f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['images_per_second']:>8.1f}{r['peak_mb']:>9.0f}"
+              f"{r['model_mb']:>7.0f}{r['size_mb']:>11.1f}")
+    width = max(len(c) for c in classes) + 2
+    for r in rows:
+        print(f"\n{r['name']} — matriz de confusión (filas = real, columnas = predicha)")
+        print(" " * width + "".join(f"{c[:10]:>12}" for c in classes))
+        for cls, row in zip(classes, r["confusion"]):
+            print(f"{cls:<{width}}" + "".join(f"{v:>12}" for v in row))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Compara variantes de la CNN con el preprocesado del bot.")
+    p.add_argument("variants", nargs="+", help="[nombre=]ruta a .keras o .tflite")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--split", default="test")
+    p.add_argument("--batch-size", type=int, default=32, help="lote para medir throughput")
+    p.add_argument("--latency-runs", type=int, default=200, help="predicciones de una imagen para p50/p99")
+    p.add_argument("--legacy-scale", choices=("unit", "mobilenet"),
+                   default=os.getenv("CNN_LEGACY_PREPROCESS", "mobilenet"),
+                   help="normalización de variantes sin capa 'preprocess' (la misma que usa el bot)")
+    p.add_argument("--json", default=None, help="guardar resultados completos")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ["CNN_LEGACY_PREPROCESS"] = args.legacy_scale   # lo leen los procesos hijos
+    paths, labels, classes = list_split(os.path.join(args.data_dir, args.split))
+    if not paths:
+        raise SystemExit(f"❌ No hay imágenes en {os.path.join(args.data_dir, args.split)}")
+    print(f"✓ {args.split}: {len(paths)} imágenes · clases {classes}")
+
+    rows = []
+    for spec in args.variants:
+        name, path = parse_variant(spec)
+        print(f"[EVAL] {name}: {path}")
+        # spawn: proceso limpio por variante (memoria y grafo de TF sin restos de la anterior)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            row = pool.submit(evaluate_variant, name, path, paths, labels, len(classes),
+                              args.batch_size, args.latency_runs).result()
+        rows.append(row)
+        print(f"  acc={row['accuracy']:.4f} p50={row['p50_ms']:.1f} ms · {row['images_per_second']:.1f} img/s")
+
+    print_report(rows, classes, args.split, len(paths), args.batch_size)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"split": args.split, "classes": classes, "images": len(paths),
+                       "batch_size": args.batch_size, "variants": rows}, fh, ensure_ascii=False, indent=2)
+        print(f"\n✅ Resultados: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
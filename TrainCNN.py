@@ -5,6 +5,8 @@ from tensorflow.keras import layers
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNet
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
+from cnn_pipeline import (build_dataset, build_record_dataset, load_index, split_frozen_model, cache_features,
+                          ModelCheckpointFor, TrainingMonitor, preprocessing_layer, serving_model)
 from sklearn.utils.class_weight import compute_class_weight
 from sklearn.metrics import classification_report, confusion_matrix
 import numpy as np
@@ -24,60 +26,105 @@ EPOCHS = 30
 FINE_TUNE_EPOCHS = 15
 NUM_CLASSES = 3
 DATA_DIR = "DatasetSplitHibrido"
+# Entrada de datos: "tfdata" (cnn_pipeline.py, decodificación en paralelo + caché) o "generator" (ImageDataGenerator)
+INPUT_PIPELINE = os.getenv("INPUT_PIPELINE", "tfdata")
+# Caché de imágenes redimensionadas: "memory", prefijo de archivo en disco o "" (sin caché)
+TFDATA_CACHE = os.getenv("TFDATA_CACHE", "memory")
+# Conjunto empaquetado con pack_dataset.py (ruta a su index.json); vacío = leer las carpetas de DATA_DIR
+PACKED_DATA = os.getenv("PACKED_DATA", "")
+# Fase 1: "cache" entrena la cabeza sobre características de MobileNet calculadas una vez; "images" sobre imágenes
+PHASE1_FEATURES = os.getenv("PHASE1_FEATURES", "cache")
+# Pasadas aumentadas del conjunto de entrenamiento que se guardan en la caché de características
+FEATURE_PASSES = int(os.getenv("FEATURE_PASSES", "3"))
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "bottleneck_cache")
+# Traza del profiler de TF: pasos "inicio-fin" (p. ej. "20-30") de la fase PROFILE_PHASE; vacío = sin traza
+PROFILE_STEPS = os.getenv("PROFILE_STEPS", "")
+PROFILE_PHASE = os.getenv("PROFILE_PHASE", "2")
 
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 RESULTS_DIR = f"mobilenet_v1_resultados_{timestamp}"
 os.makedirs(RESULTS_DIR, exist_ok=True)
 print(f"✓ Carpeta de resultados: {RESULTS_DIR}\n")
 
+def _monitor(phase):
+    # rendimiento por época en RESULTS_DIR/rendimiento_entrenamiento.csv; traza en RESULTS_DIR/profile
+    steps = tuple(int(v) for v in PROFILE_STEPS.split("-")) if PROFILE_STEPS and phase == PROFILE_PHASE else None
+    return TrainingMonitor(f"fase{phase}", BATCH_SIZE, os.path.join(RESULTS_DIR, "rendimiento_entrenamiento.csv"),
+                           profile_dir=os.path.join(RESULTS_DIR, "profile"), profile_steps=steps)
+
 # PREPARACIÓN DE DATOS
 train_dir = os.path.join(DATA_DIR, 'train')
 val_dir = os.path.join(DATA_DIR, 'val')
 test_dir = os.path.join(DATA_DIR, 'test')
+# origen de cada split para la caché de características: carpeta o (index.json, split)
+train_source, val_source = train_dir, val_dir
 
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=30,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest',
-    brightness_range=[0.8, 1.2],
-    channel_shift_range=0.1
-)
+def _cache_for(split):
+    if TFDATA_CACHE in ("", "memory"):
+        return TFDATA_CACHE
+    return f"{TFDATA_CACHE}_{split}_{IMG_SIZE}"
 
-val_test_datagen = ImageDataGenerator(rescale=1./255)
+if INPUT_PIPELINE == "tfdata" and PACKED_DATA:
+    packed_size = load_index(PACKED_DATA)["img_size"]
+    if packed_size != IMG_SIZE:
+        raise ValueError(f"{PACKED_DATA} tiene imágenes de {packed_size}px y IMG_SIZE es {IMG_SIZE}")
+    train_generator, class_labels, class_counts = build_record_dataset(
+        PACKED_DATA, 'train', BATCH_SIZE, NUM_CLASSES, training=True, cache=_cache_for('train'), seed=42)
+    validation_generator, _, _ = build_record_dataset(PACKED_DATA, 'val', BATCH_SIZE, NUM_CLASSES, cache=_cache_for('val'))
+    test_generator, _, _ = build_record_dataset(PACKED_DATA, 'test', BATCH_SIZE, NUM_CLASSES, cache=_cache_for('test'))
+    class_counts = list(class_counts)
+    train_source, val_source = (PACKED_DATA, 'train'), (PACKED_DATA, 'val')
+elif INPUT_PIPELINE == "tfdata":
+    train_generator, class_labels, class_counts = build_dataset(
+        train_dir, IMG_SIZE, BATCH_SIZE, NUM_CLASSES, training=True, cache=_cache_for('train'), seed=42)
+    validation_generator, _, _ = build_dataset(val_dir, IMG_SIZE, BATCH_SIZE, NUM_CLASSES, cache=_cache_for('val'))
+    test_generator, _, _ = build_dataset(test_dir, IMG_SIZE, BATCH_SIZE, NUM_CLASSES, cache=_cache_for('test'))
+    class_counts = list(class_counts)
+else:
+    # sin rescale: la normalización es la capa "preprocess" del modelo
+    train_datagen = ImageDataGenerator(
+        rotation_range=30,
+        width_shift_range=0.2,
+        height_shift_range=0.2,
+        shear_range=0.2,
+        zoom_range=0.2,
+        horizontal_flip=True,
+        fill_mode='nearest',
+        brightness_range=[0.8, 1.2],
+        channel_shift_range=0.1
+    )
 
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=True,
-    seed=42
-)
-validation_generator = val_test_datagen.flow_from_directory(
-    val_dir,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=False,
-    seed=42
-)
-test_generator = val_test_datagen.flow_from_directory(
-    test_dir,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=False,
-    seed=42
-)
+    val_test_datagen = ImageDataGenerator()
+
+    train_generator = train_datagen.flow_from_directory(
+        train_dir,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        shuffle=True,
+        seed=42
+    )
+    validation_generator = val_test_datagen.flow_from_directory(
+        val_dir,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        shuffle=False,
+        seed=42
+    )
+    test_generator = val_test_datagen.flow_from_directory(
+        test_dir,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        shuffle=False,
+        seed=42
+    )
 
-class_labels = list(train_generator.class_indices.keys())
-class_counts = [sum(train_generator.classes == i) for i in range(NUM_CLASSES)]
+    class_labels = list(train_generator.class_indices.keys())
+    class_counts = [sum(train_generator.classes == i) for i in range(NUM_CLASSES)]
 
+print(f"✓ Entrada de datos: {INPUT_PIPELINE}{' (' + PACKED_DATA + ')' if PACKED_DATA and INPUT_PIPELINE == 'tfdata' else ''}")
 print(f"✓ Clases detectadas: {class_labels}")
 print(f"✓ Distribución: {dict(zip(class_labels, class_counts))}")
 
@@ -101,6 +148,8 @@ base_model = MobileNet(
 base_model.trainable = False
 
 model = keras.Sequential([
+    layers.Input(shape=(IMG_SIZE, IMG_SIZE, 3)),
+    preprocessing_layer('unit'),   # 0–255 -> [0, 1], la misma definición en entrenamiento y en el bot
     base_model,
     layers.GlobalAveragePooling2D(),
     layers.Dropout(0.3),
@@ -127,20 +176,48 @@ best_model_path = os.path.join(RESULTS_DIR, "best_mobilenet.keras")
 callbacks = [
     EarlyStopping(monitor='val_accuracy', patience=8, restore_best_weights=True, mode='max'),
     ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=4, min_lr=1e-7, verbose=1),
-    ModelCheckpoint(best_model_path, monitor='val_accuracy', save_best_only=True, mode='max', verbose=1)
+    # guarda siempre el modelo completo, también cuando en la fase 1 se entrena solo la cabeza
+    ModelCheckpointFor(model, best_model_path, monitor='val_accuracy', save_best_only=True, mode='max', verbose=1)
 ]
 
 print("\n[FASE 1/2] Entrenando capas superiores...")
 start_time = time.time()
+monitor = _monitor("1")
 
-history_frozen = model.fit(
-    train_generator,
-    validation_data=validation_generator,
-    epochs=EPOCHS,
-    class_weight=class_weight_dict,
-    callbacks=callbacks,
-    verbose=1
-)
+if PHASE1_FEATURES == "cache":
+    # La base está congelada: sus salidas se calculan una vez y la cabeza entrena sobre ellas
+    extractor, head = split_frozen_model(model)
+    head.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss='categorical_crossentropy',
+        metrics=['accuracy', keras.metrics.Precision(name='precision'), keras.metrics.Recall(name='recall')]
+    )
+    train_features, train_labels = cache_features(
+        extractor, train_generator, train_source,
+        os.path.join(FEATURE_CACHE_DIR, f"train_{IMG_SIZE}_x{FEATURE_PASSES}"), passes=FEATURE_PASSES)
+    val_features, val_labels = cache_features(
+        extractor, validation_generator, val_source, os.path.join(FEATURE_CACHE_DIR, f"val_{IMG_SIZE}"))
+    print(f"✓ Características listas en {(time.time() - start_time)/60:.2f} min: {train_features.shape}")
+
+    history_frozen = head.fit(
+        train_features, train_labels,
+        validation_data=(val_features, val_labels),
+        batch_size=BATCH_SIZE,
+        epochs=EPOCHS,
+        class_weight=class_weight_dict,
+        callbacks=callbacks + [monitor],
+        shuffle=True,
+        verbose=1
+    )
+else:
+    history_frozen = model.fit(
+        monitor.wrap(train_generator),
+        validation_data=validation_generator,
+        epochs=EPOCHS,
+        class_weight=class_weight_dict,
+        callbacks=callbacks + [monitor],
+        verbose=1
+    )
 
 print(f"\n✓ Fase 1 completada en {(time.time() - start_time)/60:.2f} min")
 print(f"  Mejor val_acc: {max(history_frozen.history['val_accuracy']):.4f}")
@@ -159,13 +236,14 @@ model.compile(
 
 print("\n[FASE 2/2] Fine-tuning desde capa:", fine_tune_at)
 start_time = time.time()
+monitor = _monitor("2")
 
 history_finetune = model.fit(
-    train_generator,
+    monitor.wrap(train_generator),
     validation_data=validation_generator,
     epochs=FINE_TUNE_EPOCHS,
     class_weight=class_weight_dict,
-    callbacks=callbacks,
+    callbacks=callbacks + [monitor],
     verbose=1
 )
 
@@ -184,7 +262,7 @@ print(f"✓ Test Precision: {test_precision:.4f}")
 print(f"✓ Test Recall: {test_recall:.4f}")
 print(f"✓ Test F1-Score: {f1:.4f}")
 
-# GUARDAR MODELO FINAL
+# GUARDAR MODELO FINAL (entrada uint8: el bot envía los píxeles sin normalizar)
 final_model_path = os.path.join(RESULTS_DIR, "modelo_final_mobilenet.keras")
-best_model.save(final_model_path)
+serving_model(best_model).save(final_model_path)
 print(f"\n✅ Modelo final guardado como: {final_model_path}")
@@ -0,0 +1,199 @@
+"""
+Encuesta adaptativa (SURVEY_MODE=adaptive): en vez de recorrer todas las preguntas en
+orden, se hace la que más información aporta sobre la clase del Random Forest y la
+encuesta termina en cuanto la clase más probable alcanza SURVEY_STOP_CONFIDENCE.
+
+Con N características binarias hay 2^N respuestas completas: el RF las predice todas en
+una sola llamada y, ponderándolas por su frecuencia en el dataset de entrenamiento, se
+precalculan para los 3^N estados posibles (cada pregunta: no, sí o sin responder)
+P(clase | respuestas parciales) y la ganancia de información de cada pregunta pendiente.
+Durante la encuesta cada paso es una consulta a esas tablas.
+
+Simulación sobre el dataset (cada fila responde como un agricultor):
+    python adaptive_survey.py [dataset.xlsx] [--thresholds 0.8,0.9,0.95]
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from randomforest import RandomForest
+
+logger = logging.getLogger(__name__)
+
+# "full": todas las preguntas en orden (comportamiento original); "adaptive": las más informativas
+SURVEY_MODE = os.getenv("SURVEY_MODE", "full").strip().lower()
+# Probabilidad de la clase más probable a partir de la cual se deja de preguntar
+SURVEY_STOP_CONFIDENCE = float(os.getenv("SURVEY_STOP_CONFIDENCE", "0.9"))
+# Preguntas mínimas antes de poder parar
+SURVEY_MIN_QUESTIONS = int(os.getenv("SURVEY_MIN_QUESTIONS", "2"))
+# Pseudo-conteo por combinación de respuestas: las que no aparecen en el dataset no pesan cero
+PRIOR_SMOOTHING = 0.5
+# Por encima de esto la tabla 3^N deja de ser barata (N = 12 -> 531441 estados)
+MAX_FEATURES = 12
+
+UNKNOWN = 2
+
+
+def _entropy(p: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=-1)
+
+
+class SurveyPlanner:
+    """Tablas de la encuesta adaptativa para un RF concreto (pregunta qn = característica qn-1)."""
+
+    def __init__(self, pipe, features: list[str], prior_counts: Optional[np.ndarray] = None):
+        n = len(features)
+        if n > MAX_FEATURES:
+            raise ValueError(f"{n} características: la tabla de estados tendría 3^{n} filas")
+        self.features = list(features)
+        self.n = n
+        clf = getattr(pipe, "named_steps", {}).get("clf", pipe)
+        self.classes = [str(c) for c in clf.classes_]
+
+        # todas las respuestas completas; el bit j de la fila i es la respuesta a la pregunta j+1
+        import pandas as pd
+
+        complete = (np.arange(2 ** n)[:, None] >> np.arange(n)) & 1
+        proba = pipe.predict_proba(pd.DataFrame(complete, columns=features))
+        weight = (prior_counts if prior_counts is not None else np.zeros(2 ** n)) + PRIOR_SMOOTHING
+
+        # tensor (2,)*n x (1 + C): masa y masa por clase; cada eje se amplía con "sin responder" = suma
+        table = np.zeros((2,) * n + (1 + len(self.classes),))
+        table[tuple(complete.T)] = np.column_stack([weight, weight[:, None] * proba])
+        for axis in range(n):
+            table = np.concatenate([table, table.sum(axis=axis, keepdims=True)], axis=axis)
+        table = table.reshape(3 ** n, -1)
+        self.mass = table[:, 0]
+        self.probs = table[:, 1:] / self.mass[:, None]
+        self.confidence = self.probs.max(axis=1)
+
+        # ganancia de información de cada pregunta en cada estado (-inf si ya está respondida)
+        entropy = _entropy(self.probs)
+        self._strides = 3 ** np.arange(n - 1, -1, -1)
+        digits = (np.arange(3 ** n)[None, :] // self._strides[:, None]) % 3
+        self.gains = np.full((n, 3 ** n), -np.inf, dtype=np.float32)
+        for j in range(n):
+            open_ = np.flatnonzero(digits[j] == UNKNOWN)
+            no, yes = open_ - UNKNOWN * self._strides[j], open_ - (UNKNOWN - 1) * self._strides[j]
+            expected = (self.mass[no] * entropy[no] + self.mass[yes] * entropy[yes]) / self.mass[open_]
+            self.gains[j, open_] = entropy[open_] - expected
+
+    @classmethod
+    def from_dataset(cls, pipe, features: list[str], data_path: Optional[str]) -> "SurveyPlanner":
+        """Planificador con la distribución de respuestas del dataset de entrenamiento como prior."""
+        counts = None
+        try:
+            df = RandomForest._coerce_binary(RandomForest._read_any(data_path), list(features))
+            index = (df[list(features)].to_numpy() << np.arange(len(features))).sum(axis=1)
+            counts = np.bincount(index, minlength=2 ** len(features)).astype(float)
+        except Exception as e:
+            logger.warning(f"[SURVEY] Sin prior del dataset ({data_path}): se usa uniforme. {e}")
+        return cls(pipe, features, counts)
+
+    def state(self, responses: dict) -> int:
+        """Índice del estado para {qn: respuesta}; lo que no es afirmativo cuenta como 'no', igual que el RF."""
+        digits = [UNKNOWN] * self.n
+        for qn, answer in responses.items():
+            if 1 <= qn <= self.n and answer is not None:
+                digits[qn - 1] = int(str(answer).strip().lower() in RandomForest.YES)
+        return int(np.dot(digits, self._strides))
+
+    def next_question(self, responses: dict, skip=(),
+                      threshold: float = SURVEY_STOP_CONFIDENCE,
+                      min_questions: int = SURVEY_MIN_QUESTIONS) -> Optional[int]:
+        """Siguiente pregunta (qn) o None si ya se puede diagnosticar."""
+        s = self.state(responses)
+        answered = sum(1 for qn in responses if 1 <= qn <= self.n)
+        if answered >= min_questions and self.confidence[s] >= threshold:
+            return None
+        gains = self.gains[:, s].copy()
+        for qn in skip:
+            if 1 <= qn <= self.n:
+                gains[qn - 1] = -np.inf
+        j = int(np.argmax(gains))
+        # sin preguntas pendientes o ninguna cambia la predicción esperada: no tiene sentido seguir
+        if not np.isfinite(gains[j]) or (answered >= min_questions and gains[j] <= 1e-9):
+            return None
+        return j + 1
+
+    def predict(self, responses: dict) -> dict:
+        """P(clase | respuestas dadas), promediando las no respondidas según el prior."""
+        p = self.probs[self.state(responses)]
+        idx = int(p.argmax())
+        return {"clase_predicha": self.classes[idx], "confianza": float(p[idx]),
+                "probabilidades": dict(zip(self.classes, p.tolist()))}
+
+
+_planners: dict[str, SurveyPlanner] = {}
+_lock = threading.Lock()
+
+
+def planner_for(rf) -> SurveyPlanner:
+    """Planificador de una versión del RF del registro (se construye una vez por versión)."""
+    planner = _planners.get(rf.version)
+    if planner is None:
+        with _lock:
+            planner = _planners.get(rf.version)
+            if planner is None:
+                t0 = time.perf_counter()
+                planner = SurveyPlanner.from_dataset(rf.model, rf.features, rf.path)
+                _planners.clear()   # solo interesa la versión activa
+                _planners[rf.version] = planner
+                logger.info(f"[SURVEY] Tablas adaptativas para {rf.version}: 3^{planner.n} estados "
+                            f"en {time.perf_counter() - t0:.2f}s")
+    return planner
+
+
+# =======================
+# Simulación sobre el dataset
+# =======================
+
+def simulate(planner: SurveyPlanner, rows: np.ndarray, pipe, thresholds, min_questions: int) -> list[dict]:
+    """Cada fila responde la encuesta; se compara con la predicción del RF con todas las respuestas."""
+    import pandas as pd
+
+    full = pipe.predict(pd.DataFrame(rows, columns=planner.features)).astype(str)
+    out = []
+    for threshold in thresholds:
+        lengths, agree = [], 0
+        for row, full_cls in zip(rows, full):
+            responses: dict = {}
+            while True:
+                qn = planner.next_question(responses, threshold=threshold, min_questions=min_questions)
+                if qn is None:
+                    break
+                responses[qn] = "sí" if row[qn - 1] else "no"
+            lengths.append(len(responses))
+            agree += planner.predict(responses)["clase_predicha"] == full_cls
+        out.append({"threshold": threshold, "mean_questions": float(np.mean(lengths)),
+                    "p95_questions": float(np.percentile(lengths, 95)), "agreement": agree / len(rows)})
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Simula la encuesta adaptativa sobre el dataset del RF.")
+    p.add_argument("dataset", nargs="?", default=os.getenv("DATASET_RF"))
+    p.add_argument("--thresholds", default="0.8,0.9,0.95,0.99")
+    p.add_argument("--min-questions", type=int, default=SURVEY_MIN_QUESTIONS)
+    args = p.parse_args()
+
+    pipe, features, label, info = RandomForest.initialize_ml_system(data_path=args.dataset)
+    if pipe is None:
+        sys.exit(f"❌ {info.get('message')}")
+    t0 = time.perf_counter()
+    planner = SurveyPlanner.from_dataset(pipe, features, args.dataset)
+    print(f"Tablas: 3^{planner.n} = {3 ** planner.n} estados en {time.perf_counter() - t0:.2f}s")
+    df = RandomForest._coerce_binary(RandomForest._read_any(args.dataset), features)
+    rows = df[features].to_numpy()
+    print(f"{'umbral':>8}{'preguntas':>11}{'p95':>6}{'acuerdo con encuesta completa':>32}")
+    for r in simulate(planner, rows, pipe, [float(t) for t in args.thresholds.split(",")], args.min_questions):
+        print(f"{r['threshold']:>8.2f}{r['mean_questions']:>11.2f}{r['p95_questions']:>6.0f}{r['agreement']:>32.1%}")
+    print(f"(encuesta completa: {planner.n} preguntas)")
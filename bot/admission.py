@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """La solicitud se descarta por límite de tasa o de capacidad."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason} (reintentar en {retry_after:.0f} s)")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_seconds(self) -> int:
+        return max(1, math.ceil(self.retry_after))
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` tokens por segundo, hasta `capacity` acumulados."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now: float, cost: float = 1.0) -> float:
+        """Consume `cost` tokens. Devuelve 0 si se admitió o los segundos a esperar."""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    Control de admisión de las etapas costosas del diagnóstico
+    (descarga, filtro Gemini, CNN y PDF).
+
+    - Límite de tasa por usuario (token bucket): `rate_per_minute`, ráfaga `burst`.
+    - Tope global de etapas costosas en curso: `max_concurrent`.
+    Lo que excede los límites se rechaza con `Overloaded` en lugar de encolarse.
+    """
+
+    def __init__(self, rate_per_minute: float = 6.0, burst: int = 3,
+                 max_concurrent: int = 4, max_tracked_users: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, int(burst))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_tracked_users = max_tracked_users
+        self._buckets: dict[int, TokenBucket] = {}
+        self._in_flight = 0
+        self._waiters = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._avg_stage_s = 5.0  # EWMA de la duración de una etapa, para estimar la espera
+        self.admitted = 0
+        self.shed = {"rate_limited": 0, "busy": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            rate_per_minute=float(os.getenv("RATE_LIMIT_PER_MINUTE", "6")),
+            burst=int(os.getenv("RATE_LIMIT_BURST", "3")),
+            max_concurrent=int(os.getenv("MAX_CONCURRENT_DIAGNOSES", "4")),
+        )
+
+    # ----------------- límite por usuario -----------------
+    def check_user(self, user_id: int, cost: float = 1.0) -> None:
+        """Consume tokens del usuario o lanza `Overloaded('rate_limited', ...)`."""
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tracked_users:
+                self._prune(now)
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, now)
+        wait = bucket.try_acquire(now, cost)
+        if wait > 0:
+            self.shed["rate_limited"] += 1
+            logger.warning(f"[ADMISSION] usuario {user_id} limitado; descartadas={self.shed}")
+            raise Overloaded("rate_limited", wait)
+
+    def refund_user(self, user_id: int, cost: float = 1.0) -> None:
+        """Devuelve tokens cobrados por una solicitud que al final no se atendió (p. ej. 'busy')."""
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            bucket._refill(time.monotonic())
+            bucket.tokens = min(bucket.capacity, bucket.tokens + cost)
+
+    def _prune(self, now: float) -> None:
+        # un bucket lleno equivale a uno nuevo: se puede olvidar sin cambiar el resultado
+        for uid in [u for u, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[uid]
+
+    # ----------------- tope global -----------------
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @asynccontextmanager
+    async def stage(self, name: str, wait_timeout: float = 0.0):
+        """
+        Ocupa un hueco de etapa costosa durante el bloque `async with`.
+        Con `wait_timeout` > 0 espera ese tiempo máximo por un hueco antes de descartar.
+        """
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            if self._in_flight >= self.max_concurrent and wait_timeout > 0:
+                self._waiters += 1
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self._in_flight < self.max_concurrent),
+                        timeout=wait_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self._waiters -= 1
+            if self._in_flight >= self.max_concurrent:
+                self.shed["busy"] += 1
+                logger.warning(f"[ADMISSION] etapa '{name}' sin capacidad; descartadas={self.shed}")
+                raise Overloaded("busy", self._avg_stage_s * (1 + self._waiters / self.max_concurrent))
+            self._in_flight += 1
+            self.admitted += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_stage_s = 0.8 * self._avg_stage_s + 0.2 * (time.monotonic() - started)
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "in_flight": self._in_flight,
+            "tracked_users": len(self._buckets),
+            **{f"shed_{k}": v for k, v in self.shed.items()},
+        }
@@ -0,0 +1,256 @@
+"""
+Diagnóstico por lotes de carpetas de fotos archivadas, sin pasar por Telegram. Recorre
+el directorio a medida que avanza, decodifica en un pool de procesos, clasifica en lotes
+con la misma CNN y preprocesado que el bot (LECHUGA_MODEL_PATH) y escribe una fila por
+imagen (probabilidad de cada clase) en CSV o Parquet conforme termina cada lote.
+
+Con --resume se omiten las imágenes que ya están en la salida, así que una corrida
+interrumpida continúa donde quedó.
+
+Uso (desde bot/):
+    python batch_diagnose.py /datos/fotos --out diagnosticos.csv
+    python batch_diagnose.py /datos/fotos --out diagnosticos.csv --resume --workers 6 --batch-size 64
+    python batch_diagnose.py /datos/fotos --out diagnosticos_parquet --format parquet   # requiere pyarrow
+"""
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+BATCH_DIAGNOSE_WORKERS = int(os.getenv("BATCH_DIAGNOSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Segundos entre avisos de progreso
+PROGRESS_INTERVAL = 10.0
+
+
+def iter_images(root: str) -> Iterator[str]:
+    """Rutas de imagen bajo `root` en orden estable, sin listar todo el árbol antes de empezar."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"[BATCH] No se pudo leer {directory}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+
+def _chunks(items: Iterator[str], size: int) -> Iterator[list[str]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decode_chunk(paths: list[str]):
+    """(en el pool) Decodifica un lote como el bot: EXIF, 224 px, uint8. Devuelve (rutas, lote, errores)."""
+    import numpy as np
+    from functionality import _load_image_array
+
+    ok, arrays, errors = [], [], []
+    for path in paths:
+        try:
+            arrays.append(_load_image_array(path))
+            ok.append(path)
+        except Exception as e:
+            errors.append((path, f"{type(e).__name__}: {e}"))
+    return ok, (np.stack(arrays) if arrays else None), errors
+
+
+class CsvSink:
+    """Añade filas a un CSV y hace flush por lote: lo escrito sobrevive a una interrupción."""
+
+    def __init__(self, path: str, columns: list[str]):
+        self.path = path
+        self.columns = columns
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not fresh:
+            _drop_partial_line(path)
+        self._fh = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._fh)
+        if fresh:
+            self._writer.writerow(columns)
+
+    @staticmethod
+    def done(path: str) -> set[str]:
+        if not os.path.exists(path):
+            return set()
+        with open(path, newline="", encoding="utf-8") as fh:
+            return {row["path"] for row in csv.DictReader(fh) if row.get("path")}
+
+    def write(self, rows: list[dict]) -> None:
+        self._writer.writerows([[row.get(c, "") for c in self.columns] for row in rows])
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class ParquetSink:
+    """
+    Carpeta de fragmentos part-*.parquet: cada corrida abre uno nuevo y escribe un
+    row group por lote (un Parquet no admite añadir filas a un archivo ya cerrado).
+    """
+
+    def __init__(self, path: str, columns: list[str]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        os.makedirs(path, exist_ok=True)
+        self.columns = columns
+        self.schema = pa.schema([(c, pa.float32() if c.startswith("p_") or c == "confidence" else pa.string())
+                                 for c in columns])
+        name = f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet"
+        self._writer = pq.ParquetWriter(os.path.join(path, name), self.schema)
+
+    @staticmethod
+    def done(path: str) -> set[str]:
+        import pyarrow.parquet as pq
+
+        done = set()
+        if not os.path.isdir(path):
+            return done
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                try:
+                    done.update(pq.read_table(os.path.join(path, name), columns=["path"]).column("path").to_pylist())
+                except Exception as e:   # fragmento sin pie (corrida cortada): sus filas se repiten
+                    logger.warning(f"[BATCH] {name} ilegible, se ignora: {e}")
+        return done
+
+    def write(self, rows: list[dict]) -> None:
+        table = self._pa.Table.from_pylist([{c: row.get(c) for c in self.columns} for row in rows],
+                                           schema=self.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _drop_partial_line(path: str) -> None:
+    """Si la corrida anterior murió a mitad de una fila, la recorta antes de seguir añadiendo."""
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+
+
+def _rows(paths: list[str], probs, classes: list[str], root: str, version: str) -> list[dict]:
+    rows = []
+    for path, p in zip(paths, probs):
+        top = int(p.argmax())
+        row = {"path": os.path.relpath(path, root), "prediction": classes[top],
+               "confidence": round(float(p[top]), 6), "model_version": version, "error": ""}
+        row.update({f"p_{cls}": round(float(v), 6) for cls, v in zip(classes, p)})
+        rows.append(row)
+    return rows
+
+
+def run(root: str, out: str, fmt: str = "csv", workers: int = BATCH_DIAGNOSE_WORKERS,
+        batch_size: int = 32, resume: bool = False, limit: Optional[int] = None) -> dict:
+    import functionality as f
+
+    classes = list(f._CNN_CLASSES)
+    columns = ["path", "prediction", "confidence", *[f"p_{c}" for c in classes], "model_version", "error"]
+    sink_cls = ParquetSink if fmt == "parquet" else CsvSink
+    done = sink_cls.done(out) if resume else set()
+    if not resume and os.path.exists(out):
+        raise SystemExit(f"❌ {out} ya existe: usa --resume para continuar o elige otra salida")
+
+    cnn = f._load_cnn_model()
+    pending_paths = (p for p in iter_images(root) if os.path.relpath(p, root) not in done)
+    if limit:
+        pending_paths = (p for _, p in zip(range(limit), pending_paths))
+
+    sink = sink_cls(out, columns)
+    stats = {"images": 0, "errors": 0, "skipped": len(done), "decode_wait_s": 0.0, "infer_s": 0.0}
+    t0 = last_report = time.perf_counter()
+    try:
+        # spawn: el proceso principal ya tiene TensorFlow cargado y no conviene hacer fork de él
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            chunks = _chunks(pending_paths, batch_size)
+            inflight = deque()
+            # hasta 2 lotes por proceso en vuelo: el pool no se vacía mientras la CNN trabaja
+            for chunk in chunks:
+                inflight.append(pool.submit(_decode_chunk, chunk))
+                if len(inflight) >= 2 * workers:
+                    break
+            while inflight:
+                t_wait = time.perf_counter()
+                paths, batch, errors = inflight.popleft().result()
+                stats["decode_wait_s"] += time.perf_counter() - t_wait
+                nxt = next(chunks, None)
+                if nxt is not None:
+                    inflight.append(pool.submit(_decode_chunk, nxt))
+
+                rows = [{"path": os.path.relpath(p, root), "model_version": cnn.version, "error": msg}
+                        for p, msg in errors]
+                if batch is not None:
+                    t_inf = time.perf_counter()
+                    probs = f._predict_probs(batch, cnn.model)
+                    stats["infer_s"] += time.perf_counter() - t_inf
+                    rows += _rows(paths, probs, classes, root, cnn.version)
+                sink.write(rows)
+                stats["images"] += len(paths)
+                stats["errors"] += len(errors)
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    print(f"… {stats['images']} imágenes · {stats['images'] / (now - t0):.1f} img/s "
+                          f"· {stats['errors']} errores", file=sys.stderr, flush=True)
+    finally:
+        sink.close()
+    stats["seconds"] = time.perf_counter() - t0
+    stats["images_per_second"] = stats["images"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["model_version"] = cnn.version
+    return stats
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Clasifica con la CNN todas las imágenes de una carpeta.")
+    p.add_argument("root", help="carpeta con imágenes (se recorre recursivamente)")
+    p.add_argument("--out", required=True, help="CSV, o carpeta de fragmentos con --format parquet")
+    p.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    p.add_argument("--workers", type=int, default=BATCH_DIAGNOSE_WORKERS, help="procesos de decodificación")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--resume", action="store_true", help="omitir las imágenes que ya están en la salida")
+    p.add_argument("--limit", type=int, default=None, help="procesar como mucho N imágenes nuevas")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("❌ --format parquet requiere pyarrow (pip install pyarrow)")
+    stats = run(args.root, args.out, args.format, args.workers, args.batch_size, args.resume, args.limit)
+    print(f"✅ {stats['images']} imágenes en {stats['seconds']:.1f} s ({stats['images_per_second']:.1f} img/s) "
+          f"· {stats['errors']} errores · {stats['skipped']} ya estaban en {args.out}")
+    print(f"   espera de decodificación {stats['decode_wait_s']:.1f} s · inferencia {stats['infer_s']:.1f} s "
+          f"· modelo {stats['model_version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
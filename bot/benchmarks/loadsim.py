@@ -0,0 +1,327 @@
+"""
+Simulación de carga de extremo a extremo: miles de usuarios sintéticos recorren los
+handlers reales de bot.py (foto -> detección -> CNN -> encuesta -> ubicación -> RF -> PDF)
+con Telegram, SQL Server y Gemini sustituidos por dobles locales (ver standins.py).
+
+Uso (desde bot/):
+    python benchmarks/loadsim.py --users 500 --arrival-rate 20 --llm-latency-ms 800
+    python benchmarks/loadsim.py --users 200 --cnn-stub-ms 40 --json resultados.json
+
+Reporta diagnósticos/s, p50/p95/p99 por etapa y por handler, y el tiempo que el event
+loop estuvo bloqueado. La CNN real se usa si LECHUGA_MODEL_PATH apunta a un modelo;
+si no, o con --cnn-stub-ms, se sustituye por una espera fija.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+if str(BOT_DIR) not in sys.path:
+    sys.path.insert(0, str(BOT_DIR))
+if str(Path(__file__).resolve().parent) not in sys.path:
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from standins import FakeBot, SqliteDB, StubGeminiServer, callback_update, photo_update  # noqa: E402
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Percentil por rango más cercano (q en 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+def summarize(samples: dict[str, list[float]]) -> dict[str, dict[str, float]]:
+    return {
+        name: {"n": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95),
+               "p99": percentile(v, 99), "max": max(v) if v else 0.0}
+        for name, v in sorted(samples.items())
+    }
+
+
+def make_sample_image(path: str) -> str:
+    """JPEG sintético 640x480 (tamaño típico de una foto comprimida por Telegram)."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+    arr[..., 1] = np.clip(arr[..., 1].astype(int) + 80, 0, 255)   # tono verde
+    Image.fromarray(arr).save(path, quality=85)
+    return path
+
+
+class LoopLagMonitor:
+    """Mide cuánto se retrasa un `sleep(interval)`: ese exceso es tiempo con el loop bloqueado."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - t0 - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def report(self) -> dict[str, float]:
+        return {
+            "samples": len(self.lags),
+            "p50_ms": percentile(self.lags, 50) * 1000,
+            "p99_ms": percentile(self.lags, 99) * 1000,
+            "max_ms": max(self.lags, default=0.0) * 1000,
+            "blocked_s": sum(lag for lag in self.lags if lag > 0.01),
+        }
+
+
+class LoadSim:
+    def __init__(self, args, bot_module, fake_bot: FakeBot):
+        self.args = args
+        self.bot = bot_module
+        self.fake = fake_bot
+        self.bot_data: dict = {}
+        self.ctx = None
+        self.processor = None
+        self.handler_samples: dict[str, list[float]] = defaultdict(list)
+        self.stage_samples: dict[str, list[float]] = defaultdict(list)
+        self.outcomes: dict[str, int] = defaultdict(int)
+        self.e2e: list[float] = []
+        self.survey_lengths: list[int] = []
+        self._image_started: set[int] = set()
+        self._image_done: dict[int, asyncio.Event] = {}
+
+    async def setup(self):
+        from types import SimpleNamespace as NS
+        import metrics
+
+        b = self.bot
+        modelo, scaler, features = b.initialize_bot_with_ml()
+        if modelo is not None:
+            b.MODELS.install("rf", modelo, os.getenv("DATASET_RF"), features)
+        b.get_sessions(self.bot_data)
+        self.ctx = NS(bot=self.fake, bot_data=self.bot_data, application=NS(bot_data=self.bot_data),
+                      job_queue=None)
+        self.processor = b.PerChatUpdateProcessor(b.MAX_CONCURRENT_UPDATES, b.MAX_PENDING_UPDATES)
+        await self.processor.initialize()
+
+        # copiar cada observación del histograma de etapas para tener percentiles exactos
+        observe = metrics.STAGE_SECONDS.observe
+
+        def _observe(value, **labels):
+            self.stage_samples[labels.get("stage", "?")].append(value)
+            observe(value, **labels)
+
+        metrics.STAGE_SECONDS.observe = _observe
+
+        # saber cuándo terminó el análisis de la foto (la tarea diferida saca su ventana al empezar)
+        process = b.process_image_after_window_async
+
+        async def _process(context, uid):
+            self._image_started.add(uid)
+            try:
+                await process(context, uid)
+            finally:
+                self._image_done.setdefault(uid, asyncio.Event()).set()
+
+        b.process_image_after_window_async = _process
+
+    async def dispatch(self, name: str, handler, update):
+        t0 = time.perf_counter()
+        await self.processor.process_update(update, handler(update, self.ctx))
+        self.handler_samples[name].append(time.perf_counter() - t0)
+
+    async def run_user(self, uid: int):
+        b, a = self.bot, self.args
+        sessions = b.get_sessions(self.bot_data)
+        t0 = time.perf_counter()
+
+        photos = random.randint(2, 3) if random.random() < a.album_ratio else 1
+        group = f"album{uid}" if photos > 1 else None
+        for i in range(photos):
+            await self.dispatch("handle_image", b.handle_image, photo_update(self.fake, uid, f"f{uid}_{i}", group))
+        done = self._image_done.setdefault(uid, asyncio.Event())
+        if sessions.image_window.get(uid, touch=False) is not None or uid in self._image_started:
+            await done.wait()
+
+        if sessions.survey.get(uid, touch=False) is None:
+            self.outcomes["busy" if self._saw(uid, "⏳") else "sin_encuesta"] += 1
+            return
+
+        # se responde la pregunta que el bot muestra (en modo adaptativo no van en orden ni son todas)
+        answered = 0
+        while (ss := sessions.survey.get(uid, touch=False)) is not None and ss.pending is not None:
+            if a.think_ms:
+                await asyncio.sleep(random.expovariate(1000.0 / a.think_ms))
+            ans = "Sí" if random.random() < a.yes_ratio else "No"
+            await self.dispatch("survey_answer", b.handle_simple_answer_callback,
+                                callback_update(self.fake, uid, f"simple_answer:{ss.pending}:{ans}"))
+            answered += 1
+        self.survey_lengths.append(answered)
+        await self.dispatch("location", b.handle_location_callback,
+                            callback_update(self.fake, uid, f"location:{random.choice(['tierra', 'invernadero'])}:{uid}"))
+
+        self.e2e.append(time.perf_counter() - t0)
+        if any(kind == "send_document" for kind, _ in self.fake.by_chat[uid]):
+            self.outcomes["informe"] += 1
+        elif self._saw(uid, "NO coinciden"):
+            self.outcomes["no_coincide"] += 1
+        elif self._saw(uid, "⏳"):
+            self.outcomes["busy"] += 1
+        else:
+            self.outcomes["error"] += 1
+
+    def _saw(self, uid: int, needle: str) -> bool:
+        return any(needle in text for _, text in self.fake.by_chat[uid])
+
+    async def run(self) -> dict:
+        monitor = LoopLagMonitor()
+        monitor.start()
+        start = time.perf_counter()
+        tasks = []
+        for n in range(self.args.users):
+            tasks.append(asyncio.create_task(self.run_user(self.args.first_uid + n)))
+            if self.args.arrival_rate > 0:
+                await asyncio.sleep(random.expovariate(self.args.arrival_rate))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        await monitor.stop()
+        await self.processor.shutdown()
+
+        crashed = [r for r in results if isinstance(r, BaseException)]
+        for r in crashed[:3]:
+            print(f"⚠️ usuario con excepción: {r!r}", file=sys.stderr)
+        finished = self.outcomes["informe"] + self.outcomes["no_coincide"]
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "json"},
+            "elapsed_s": elapsed,
+            "users": self.args.users,
+            "diagnoses_completed": finished,
+            "diagnoses_per_s": finished / elapsed if elapsed else 0.0,
+            "outcomes": dict(self.outcomes, excepcion=len(crashed)),
+            "end_to_end": summarize({"diagnosis": self.e2e})["diagnosis"],
+            "survey_questions_mean": (sum(self.survey_lengths) / len(self.survey_lengths)
+                                      if self.survey_lengths else 0.0),
+            "stages": summarize(self.stage_samples),
+            "handlers": summarize(self.handler_samples),
+            "event_loop_lag": monitor.report(),
+            "admission": self.bot.ADMISSION.stats(),
+            "telegram_calls": dict(self.fake.calls),
+        }
+
+
+def print_report(r: dict) -> None:
+    print(f"\n=== Simulación de carga: {r['users']} usuarios en {r['elapsed_s']:.1f} s ===")
+    print(f"Diagnósticos completos: {r['diagnoses_completed']}  ({r['diagnoses_per_s']:.2f}/s)")
+    print(f"Resultados: {r['outcomes']}")
+    print(f"Preguntas de encuesta por usuario: {r['survey_questions_mean']:.2f}")
+    e = r["end_to_end"]
+    print(f"Extremo a extremo: p50={e['p50']:.2f}s p95={e['p95']:.2f}s p99={e['p99']:.2f}s max={e['max']:.2f}s")
+    for title, block in (("Etapa", r["stages"]), ("Handler", r["handlers"])):
+        print(f"\n{title:<20}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, s in block.items():
+            print(f"{name:<20}{s['n']:>7}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}"
+                  f"{s['p99'] * 1000:>10.1f}{s['max'] * 1000:>10.1f}")
+    lag = r["event_loop_lag"]
+    print(f"\nEvent loop: p50={lag['p50_ms']:.1f}ms p99={lag['p99_ms']:.1f}ms max={lag['max_ms']:.1f}ms "
+          f"bloqueado={lag['blocked_s']:.2f}s")
+    print(f"Admisión: {r['admission']}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Simulación de carga del bot Pacho con dobles locales.")
+    p.add_argument("--users", type=int, default=200, help="usuarios sintéticos (un diagnóstico cada uno)")
+    p.add_argument("--arrival-rate", type=float, default=10.0, help="llegadas por segundo (0 = todas a la vez)")
+    p.add_argument("--album-ratio", type=float, default=0.1, help="fracción de usuarios que envía un álbum")
+    p.add_argument("--yes-ratio", type=float, default=0.3, help="probabilidad de responder 'Sí'")
+    p.add_argument("--think-ms", type=float, default=0.0, help="pausa media entre respuestas de la encuesta")
+    p.add_argument("--llm-latency-ms", type=float, default=800.0, help="latencia del stub de Gemini")
+    p.add_argument("--db-latency-ms", type=float, default=2.0, help="latencia añadida por consulta SQL")
+    p.add_argument("--tg-latency-ms", type=float, default=30.0, help="latencia de cada llamada a la API de Telegram")
+    p.add_argument("--cnn-stub-ms", type=float, default=None, help="sustituye la CNN por una espera fija")
+    p.add_argument("--image", default=None, help="imagen de prueba (por defecto, una sintética)")
+    p.add_argument("--workdir", default=None, help="directorio de trabajo (uploads, informes, logs)")
+    p.add_argument("--first-uid", type=int, default=1_000_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--json", default=None, help="guardar el reporte en JSON")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="pacho_loadsim_"))
+    os.makedirs(workdir, exist_ok=True)
+    image = os.path.abspath(args.image) if args.image else make_sample_image(os.path.join(workdir, "sample.jpg"))
+    json_out = os.path.abspath(args.json) if args.json else None
+
+    stub = StubGeminiServer(latency_ms=args.llm_latency_ms).start()
+    # configuración del bot antes de importarlo (ADMISSION, logging y RF se leen al importar)
+    os.environ["GEMINI_BASE_URL"] = stub.base_url
+    os.environ.setdefault("API_KEY_LLM", "loadsim")
+    os.environ.setdefault("REPORT_IMAGES_PATH", str(BOT_DIR / "data" / "report_images") + os.sep)
+    os.environ.setdefault("DATASET_RF", str(BOT_DIR / "models" / "Enfermedades_entrenamiento_actualizado.xlsx"))
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.chdir(workdir)
+
+    import bot
+    import db_core as db
+    import functionality as f
+
+    database = SqliteDB(os.path.join(workdir, "loadsim.sqlite3"), latency_ms=args.db_latency_ms)
+    database.seed(range(args.first_uid, args.first_uid + args.users))
+    database.install(db)
+
+    model_path = os.getenv("LECHUGA_MODEL_PATH")
+    if args.cnn_stub_ms is not None or not (model_path and os.path.exists(model_path)):
+        delay = (args.cnn_stub_ms or 50.0) / 1000.0
+
+        def _classify_stub(paths, cnn=None, fast=None):
+            time.sleep(delay)
+            probs = [random.random() for _ in range(3)]
+            return f._format_cnn_message([p / sum(probs) for p in probs], n_images=len(paths)), "single", None
+
+        f.classify_images_staged = _classify_stub
+        print(f"ℹ️ CNN sustituida por una espera de {delay * 1000:.0f} ms", file=sys.stderr)
+
+    sim = LoadSim(args, bot, FakeBot(image, latency_ms=args.tg_latency_ms))
+
+    async def _go():
+        await sim.setup()
+        return await sim.run()
+
+    try:
+        report = asyncio.run(_go())
+    finally:
+        stub.stop()
+    report["workdir"] = workdir
+    report["llm_requests"] = stub.requests
+    print_report(report)
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+        print(f"\nReporte guardado en {json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Micro-benchmarks de las funciones calientes del bot, con baselines JSON por máquina
+y compuerta de regresión.
+
+Uso (desde bot/):
+    python benchmarks/microbench.py                      # mide y compara con la baseline
+    python benchmarks/microbench.py --save-baseline      # mide y guarda la baseline de esta máquina
+    python benchmarks/microbench.py -k pdf -k rf         # solo los casos que contienen 'pdf' o 'rf'
+    python benchmarks/microbench.py --threshold 0.10     # regresión = >10 % más lento
+
+Sale con código 1 si algún caso empeora más que el umbral respecto a la baseline
+(mediana y mínimo a la vez, para no saltar por ruido). Las baselines se guardan en
+benchmarks/baselines/<máquina>.json; la máquina se identifica con --machine o BENCH_MACHINE.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+BOT_DIR = BENCH_DIR.parent
+for _p in (BOT_DIR, BENCH_DIR):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from loadsim import make_sample_image  # noqa: E402
+from standins import SqliteDB, StubGeminiServer  # noqa: E402
+
+BASELINE_DIR = BENCH_DIR / "baselines"
+
+
+# =======================
+# Registro de casos
+# =======================
+
+CASES: list[tuple[str, Callable]] = []
+
+
+def case(name: str):
+    """Registra un caso: la función recibe el `BenchEnv` y devuelve la operación a medir (sin argumentos)."""
+    def deco(factory):
+        CASES.append((name, factory))
+        return factory
+    return deco
+
+
+class Skip(Exception):
+    """El caso no se puede medir en este entorno (p. ej. falta el modelo CNN)."""
+
+
+class BenchEnv:
+    """Prepara una sola vez lo que comparten los casos: módulos del bot, imágenes, BD y modelos."""
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.images = [make_sample_image(os.path.join(workdir, f"img{i}.jpg")) for i in range(4)]
+        self.stub = StubGeminiServer(latency_ms=0).start()
+        os.environ["GEMINI_BASE_URL"] = self.stub.base_url
+        os.environ.setdefault("API_KEY_LLM", "microbench")
+        os.environ.setdefault("REPORT_IMAGES_PATH", str(BOT_DIR / "data" / "report_images") + os.sep)
+        os.environ.setdefault("DATASET_RF", str(BOT_DIR / "models" / "Enfermedades_entrenamiento_actualizado.xlsx"))
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        os.environ.setdefault("TRACING_ENABLED", "0")
+        os.chdir(workdir)
+
+        import bot
+        import db_core
+        import functionality
+
+        self.bot, self.db, self.f = bot, db_core, functionality
+        self.database = SqliteDB(os.path.join(workdir, "microbench.sqlite3"))
+        self.database.seed(range(1, 101))
+        self.database.install(db_core)
+        self._rf = None
+
+    @property
+    def has_cnn(self) -> bool:
+        path = os.getenv("LECHUGA_MODEL_PATH")
+        return bool(path and os.path.exists(path))
+
+    def rf(self):
+        if self._rf is None:
+            modelo, _, features = self.bot.initialize_bot_with_ml()
+            if modelo is None:
+                raise Skip("Random Forest no disponible (DATASET_RF)")
+            self._rf = (modelo, features)
+        return self._rf
+
+    def close(self):
+        self.stub.stop()
+
+
+# =======================
+# Casos
+# =======================
+
+SAMPLE_CNN_MSG = ("🔬 **Resultado del análisis (CNN)**\nDetección realizada: **Botrytis**\n\n"
+                  "✅ Botrytis: 71.3%\n• Xanthomonas: 18.2%\n• Sana: 10.5%")
+
+
+@case("cnn.preprocess")
+def _(env):
+    f = env.f
+    return lambda: f._get_preprocess()(f._load_image_array(env.images[0])[None, ...])
+
+
+@case("cnn.classify_image")
+def _(env):
+    if not env.has_cnn:
+        raise Skip("LECHUGA_MODEL_PATH no apunta a un modelo")
+    return lambda: env.f.classify_image(env.images[0])
+
+
+@case("cnn.classify_images_x4")
+def _(env):
+    if not env.has_cnn:
+        raise Skip("LECHUGA_MODEL_PATH no apunta a un modelo")
+    return lambda: env.f.classify_images(env.images)
+
+
+@case("rf.predict_from_pipeline")
+def _(env):
+    modelo, features = env.rf()
+    responses = {i: ("Sí" if i % 3 == 0 else "No") for i in range(1, 11)}
+    return lambda: env.bot.rf_predict_from_pipeline(modelo, features, responses)
+
+
+@case("text.extract_probs_from_msg")
+def _(env):
+    return lambda: env.bot.extract_probs_from_msg(SAMPLE_CNN_MSG)
+
+
+@case("text.clean_question_text")
+def _(env):
+    text = "🌱 ¿Observas   un vello o moho gris\nsobre las hojas?\t🍂  "
+    return lambda: env.bot.clean_question_text(text)
+
+
+@case("pdf.build_report")
+def _(env):
+    outfile = os.path.join(env.workdir, "bench_report.pdf")
+    rf_block = {"clasificacion": "Botrytis", "confianza": 0.82,
+                "probabilidades": {"Botrytis": 0.82, "Xanthomonas": 0.1, "Sana": 0.08},
+                "respuestas": {i: "No" for i in range(1, 11)},
+                "preguntas": {i: f"Pregunta {i}" for i in range(1, 11)}}
+    cnn_block = {"clasificacion": "Botrytis", "probabilidades": env.bot.extract_probs_from_msg(SAMPLE_CNN_MSG),
+                 "imagen_usuario_path": env.images[0], "imagen_ejemplo_path": None}
+    treatments = [f"Tratamiento {i}: aplicar producto cada 7 días" for i in range(1, 5)]
+    return lambda: env.f.build_pacho_pdf_report(
+        outfile=outfile, meta={"fecha": "01-01-2025 10:00"}, rf_block=rf_block, cnn_block=cnn_block,
+        tratamiento=treatments, treatment_title="Tratamiento recomendado")
+
+
+@case("db.get_diagnostic_question")
+def _(env):
+    return lambda: env.db.get_diagnostic_question(5)
+
+
+@case("db.get_total_diagnostic_questions")
+def _(env):
+    return env.db.get_total_diagnostic_questions
+
+
+@case("db.load_user_data")
+def _(env):
+    return lambda: env.db.load_user_data_db(42)
+
+
+@case("db.check_user_exists")
+def _(env):
+    return lambda: env.db.check_user_exists_db(42)
+
+
+@case("db.search_treatments")
+def _(env):
+    return lambda: env.db.search_treatments_db("Botrytis", "tierra", limit=4)
+
+
+@case("db.increment_user_diagnosis")
+def _(env):
+    return lambda: env.db.increment_user_diagnosis_db(42)
+
+
+# =======================
+# Medición
+# =======================
+
+def measure(fn: Callable, warmup: int, repeat: int, min_time: float) -> dict:
+    """
+    Calienta `warmup` veces, calibra cuántas llamadas (`number`) hacen falta para que
+    cada repetición dure al menos `min_time` y devuelve estadísticas por llamada.
+    """
+    for _ in range(warmup):
+        fn()
+
+    def _run(number: int) -> float:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - t0
+
+    number = 1
+    while True:
+        elapsed = _run(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)) + 1)
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = [_run(number) / number for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    q = statistics.quantiles(samples, n=4) if len(samples) >= 2 else [samples[0]] * 3
+    return {"median_s": statistics.median(samples), "min_s": min(samples),
+            "iqr_s": q[2] - q[0], "number": number, "repeat": repeat}
+
+
+def machine_id(override: Optional[str] = None) -> str:
+    raw = override or os.getenv("BENCH_MACHINE") or \
+        f"{platform.node()}-{platform.machine()}-{os.cpu_count()}cpu-py{platform.python_version()}"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", raw)
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> tuple[list[dict], bool]:
+    rows, regressed = [], False
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append({"name": name, "status": "NUEVO", "cur": cur["median_s"]})
+            continue
+        delta = cur["median_s"] / base["median_s"] - 1.0
+        slower = (cur["median_s"] > base["median_s"] * (1 + threshold)
+                  and cur["min_s"] > base["min_s"] * (1 + threshold))
+        faster = cur["median_s"] < base["median_s"] * (1 - threshold)
+        status = "REGRESIÓN" if slower else ("MEJORA" if faster else "ok")
+        regressed |= slower
+        rows.append({"name": name, "status": status, "cur": cur["median_s"],
+                     "base": base["median_s"], "delta": delta})
+    return rows, regressed
+
+
+def _fmt_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Micro-benchmarks del bot con baselines por máquina.")
+    p.add_argument("-k", dest="filters", action="append", default=[],
+                   help="ejecutar solo casos cuyo nombre contenga este texto (repetible)")
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--repeat", type=int, default=7)
+    p.add_argument("--min-time", type=float, default=0.2, help="duración mínima (s) de cada repetición")
+    p.add_argument("--threshold", type=float, default=0.15, help="fracción de empeoramiento tolerada")
+    p.add_argument("--machine", default=None, help="identificador de la máquina para la baseline")
+    p.add_argument("--baseline", default=None, help="ruta de la baseline (por defecto baselines/<máquina>.json)")
+    p.add_argument("--save-baseline", action="store_true", help="guardar los resultados como baseline")
+    p.add_argument("--json", default=None, help="guardar también los resultados en este archivo")
+    p.add_argument("--list", action="store_true", help="listar los casos y salir")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    selected = [(n, fac) for n, fac in CASES if not args.filters or any(k in n for k in args.filters)]
+    if args.list:
+        print("\n".join(n for n, _ in selected))
+        return 0
+
+    machine = machine_id(args.machine)
+    baseline_path = Path(args.baseline) if args.baseline else BASELINE_DIR / f"{machine}.json"
+    baseline_path = baseline_path.resolve()
+    json_out = os.path.abspath(args.json) if args.json else None
+
+    env = BenchEnv(tempfile.mkdtemp(prefix="pacho_microbench_"))
+    results, skipped = {}, {}
+    try:
+        for name, factory in selected:
+            try:
+                fn = factory(env)
+                results[name] = measure(fn, args.warmup, args.repeat, args.min_time)
+            except Skip as e:
+                skipped[name] = str(e)
+                continue
+            r = results[name]
+            print(f"{name:<36}{_fmt_time(r['median_s']):>14}  (min {_fmt_time(r['min_s'])}, "
+                  f"iqr {_fmt_time(r['iqr_s'])}, {r['number']}x{r['repeat']})")
+    finally:
+        env.close()
+    for name, why in skipped.items():
+        print(f"{name:<36}{'omitido':>14}  ({why})")
+
+    report = {"machine": machine, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "python": platform.python_version(), "results": results}
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        merged = {}
+        if baseline_path.exists():
+            merged = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+        merged.update(results)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(dict(report, results=merged), ensure_ascii=False, indent=2),
+                                 encoding="utf-8")
+        print(f"\nBaseline guardada en {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\nSin baseline para '{machine}' ({baseline_path}); usa --save-baseline para crearla.")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+    rows, regressed = compare(results, baseline, args.threshold)
+    print(f"\nComparación con {baseline_path.name} (umbral {args.threshold:.0%}):")
+    for row in rows:
+        if row["status"] == "NUEVO":
+            print(f"  {row['name']:<36}{_fmt_time(row['cur']):>14}  NUEVO")
+        else:
+            print(f"  {row['name']:<36}{_fmt_time(row['base']):>14} -> {_fmt_time(row['cur']):>12}"
+                  f"  {row['delta']:+7.1%}  {row['status']}")
+    if regressed:
+        print("\n❌ Hay regresiones de rendimiento.")
+        return 1
+    print("\n✅ Sin regresiones.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
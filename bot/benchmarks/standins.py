@@ -0,0 +1,390 @@
+"""
+Dobles locales para medir el bot sin Telegram, SQL Server ni Gemini:
+
+- `SqliteDB`: base SQLite con el mismo esquema que usa db_core y una traducción
+  mínima de T-SQL (TOP, concatenación con +, ISNULL, GETDATE, DB_NAME).
+- `FakeBot` y constructores de updates con la forma que leen los handlers.
+- `StubGeminiServer`: servidor HTTP con la API generateContent y latencia configurable
+  (el bot lo usa vía GEMINI_BASE_URL).
+"""
+import asyncio
+import json
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace as NS
+from typing import Optional
+
+# =======================
+# Base de datos (SQLite con dialecto T-SQL)
+# =======================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users_bot (
+    id_userbot INTEGER PRIMARY KEY,
+    telegram_id TEXT,
+    phone TEXT,
+    total_diagnoses INTEGER DEFAULT 0,
+    AgreementStatus TEXT,
+    DateAgreement DATE,
+    LastUpdated TIMESTAMP,
+    RecommendationState INTEGER,
+    RecommendationDate DATE,
+    CreatedAt TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS diagnostic_questions (
+    Id_question INTEGER PRIMARY KEY,
+    question_order INTEGER UNIQUE,
+    question_text TEXT
+);
+CREATE TABLE IF NOT EXISTS diagnostic_answers (
+    Id_answer INTEGER PRIMARY KEY,
+    question_id INTEGER REFERENCES diagnostic_questions(Id_question),
+    answer_order INTEGER,
+    answer_text TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_answers_question ON diagnostic_answers(question_id);
+CREATE TABLE IF NOT EXISTS diseases (
+    id_disease INTEGER PRIMARY KEY,
+    scientific_name TEXT,
+    common_name TEXT,
+    asset INTEGER DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS treatments (
+    id_treatment INTEGER PRIMARY KEY,
+    disease_id INTEGER REFERENCES diseases(id_disease),
+    treatment_type TEXT,
+    recommended_products TEXT,
+    frequency TEXT,
+    precautions TEXT,
+    dias_mejoria_visual INTEGER,
+    Environment INTEGER,
+    creation_date TIMESTAMP
+);
+"""
+
+# Mismo orden que RandomForest.FEATURES_DEFAULT
+QUESTIONS = [
+    "¿Observas un vello o moho gris sobre las hojas?",
+    "¿Hay manchas de aspecto acuoso en las hojas?",
+    "¿Aparecen manchas marrones en hojas o tallos?",
+    "¿La humedad del cultivo ha sido alta?",
+    "¿Ha habido varios días nublados seguidos?",
+    "¿Las temperaturas han sido frías?",
+    "¿El cultivo tiene mala ventilación?",
+    "¿La planta sufrió alguna herida o corte?",
+    "¿El clima ha sido cálido?",
+    "¿Riegas por aspersión?",
+]
+
+DISEASES = [
+    (1, "Botrytis cinerea", "Moho gris"),
+    (2, "Xanthomonas campestris", "Mancha bacteriana"),
+]
+
+_TOP = re.compile(r"\bSELECT\s+TOP\s+(\d+)\b", re.IGNORECASE)
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_SELECT_TOKENS = re.compile(r"\bSELECT\b|\bFROM\b|\+", re.IGNORECASE)
+
+
+def _concat_in_select(sql: str) -> str:
+    """Cambia `+` por `||` en las listas de SELECT (en T-SQL concatena texto), fuera de literales."""
+    out, in_select = [], False
+    for part in _LITERAL.split(sql):
+        if part.startswith("'"):
+            out.append(part)
+            continue
+
+        def _sub(m):
+            nonlocal in_select
+            word = m.group(0).upper()
+            if word == "SELECT":
+                in_select = True
+            elif word == "FROM":
+                in_select = False
+            elif in_select:
+                return "||"
+            return m.group(0)
+
+        out.append(_SELECT_TOKENS.sub(_sub, part))
+    return "".join(out)
+
+
+def translate_tsql(sql: str) -> str:
+    """Traduce las construcciones de T-SQL que usa db_core a SQLite."""
+    limit = None
+    m = _TOP.search(sql)
+    if m:
+        limit = m.group(1)
+        sql = sql[:m.start()] + "SELECT" + sql[m.end():]
+    sql = re.sub(r"CAST\(\s*GETDATE\(\)\s+AS\s+date\s*\)", "date('now','localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bGETDATE\(\)", "datetime('now','localtime')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bISNULL\(", "IFNULL(", sql, flags=re.IGNORECASE)
+    sql = _concat_in_select(sql)
+    if limit:
+        sql = sql.rstrip().rstrip(";") + f" LIMIT {limit}"
+    return sql
+
+
+class _Cursor:
+    def __init__(self, cur: sqlite3.Cursor, latency: float):
+        self._cur = cur
+        self._latency = latency
+
+    def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        if self._latency:
+            time.sleep(self._latency)   # ida y vuelta de red hasta SQL Server
+        self._cur.execute(translate_tsql(sql), tuple(params))
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class _Connection:
+    """Conexión con la interfaz de pyodbc que usa db_core."""
+
+    def __init__(self, raw: sqlite3.Connection, latency: float):
+        self._raw = raw
+        self._latency = latency
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self._raw.cursor(), self._latency)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+
+class SqliteDB:
+    """
+    Base SQLite en archivo (WAL) con el esquema del bot. `latency_ms` se suma a cada
+    consulta para emular la red hasta SQL Server.
+    """
+
+    def __init__(self, path: str, latency_ms: float = 0.0):
+        self.path = path
+        self.latency = max(0.0, latency_ms) / 1000.0
+        with self._raw() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _raw(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.create_function("DB_NAME", 0, lambda: "sqlite-standin")
+        return conn
+
+    def connect(self) -> _Connection:
+        return _Connection(self._raw(), self.latency)
+
+    def seed(self, user_ids=(), agreed: bool = True) -> None:
+        """Preguntas, respuestas, enfermedades, tratamientos y (opcional) usuarios ya registrados."""
+        with self._raw() as conn:
+            conn.execute("DELETE FROM diagnostic_answers")
+            conn.execute("DELETE FROM diagnostic_questions")
+            for i, text in enumerate(QUESTIONS, 1):
+                conn.execute("INSERT INTO diagnostic_questions VALUES (?, ?, ?)", (i, i, text))
+                conn.execute("INSERT INTO diagnostic_answers (question_id, answer_order, answer_text) "
+                             "VALUES (?, 1, 'Sí'), (?, 2, 'No')", (i, i))
+            conn.execute("DELETE FROM treatments")
+            conn.execute("DELETE FROM diseases")
+            for did, sci, common in DISEASES:
+                conn.execute("INSERT INTO diseases VALUES (?, ?, ?, 1)", (did, sci, common))
+                for env in (1, 2):
+                    for n in range(1, 4):
+                        conn.execute(
+                            "INSERT INTO treatments (disease_id, treatment_type, recommended_products, frequency, "
+                            "precautions, dias_mejoria_visual, Environment, creation_date) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+                            (did, f"Tipo {n}", f"Producto {n} para {common}", "Cada 7 días",
+                             "Usar guantes y no aplicar con viento", 7 + n, env),
+                        )
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            conn.executemany(
+                "INSERT OR REPLACE INTO users_bot VALUES (?, ?, 'sin_telefono', 0, ?, date('now'), ?, 0, NULL, ?)",
+                [(uid, str(uid), "True" if agreed else "False", now, now) for uid in user_ids],
+            )
+
+    def install(self, db_module) -> None:
+        """Hace que db_core abra sus conexiones contra esta base (conservando su instrumentación)."""
+        db_module._open_raw_connection = self.connect
+
+
+# =======================
+# Telegram
+# =======================
+
+class FakeBot:
+    """API de Bot mínima que usan los handlers, con latencia por llamada y registro por chat."""
+
+    def __init__(self, image_path: str, latency_ms: float = 0.0):
+        self.image_path = image_path
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.calls = defaultdict(int)
+        self.by_chat: dict[int, list[tuple[str, str]]] = defaultdict(list)
+
+    async def _rtt(self, kind: str, chat_id: Optional[int] = None, text: str = ""):
+        self.calls[kind] += 1
+        if chat_id is not None:
+            self.by_chat[chat_id].append((kind, text))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._rtt("send_message", chat_id, text)
+        return FakeMessage(self, chat_id, text)
+
+    async def get_file(self, file_id):
+        await self._rtt("get_file")
+        bot = self
+
+        async def download_to_drive(path):
+            await bot._rtt("download")
+            shutil.copyfile(bot.image_path, path)
+
+        return NS(file_id=file_id, download_to_drive=download_to_drive)
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        document.read()
+        await self._rtt("send_document", chat_id, filename or "")
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, text: str = ""):
+        self._bot = bot
+        self.chat_id = chat_id
+        self.text = text
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        await self._bot._rtt("edit_message", self.chat_id, text)
+
+    async def reply_text(self, text, **kwargs):
+        await self._bot._rtt("send_message", self.chat_id, text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, uid: int, data: str):
+        self._bot = bot
+        self.from_user = NS(id=uid, username=f"user{uid}")
+        self.data = data
+        self.message = FakeMessage(bot, uid)
+
+    async def answer(self):
+        await self._bot._rtt("answer_callback")
+
+    async def edit_message_text(self, text, **kwargs):
+        await self.message.edit_text(text, **kwargs)
+
+
+def photo_update(bot: FakeBot, uid: int, file_id: str, media_group_id: Optional[str] = None):
+    user = NS(id=uid, username=f"user{uid}")
+    msg = FakeMessage(bot, uid)
+    msg.from_user = user
+    msg.photo = [NS(file_id=file_id)]
+    msg.media_group_id = media_group_id
+    return NS(message=msg, effective_chat=NS(id=uid), effective_user=user, callback_query=None)
+
+
+def text_update(bot: FakeBot, uid: int, text: str):
+    user = NS(id=uid, username=f"user{uid}")
+    msg = FakeMessage(bot, uid, text)
+    msg.from_user = user
+    return NS(message=msg, effective_chat=NS(id=uid), effective_user=user, callback_query=None)
+
+
+def callback_update(bot: FakeBot, uid: int, data: str):
+    q = FakeCallbackQuery(bot, uid, data)
+    return NS(callback_query=q, message=None, effective_chat=NS(id=uid), effective_user=q.from_user)
+
+
+# =======================
+# Gemini
+# =======================
+
+class StubGeminiServer:
+    """
+    Responde `POST /v1beta/models/<modelo>:generateContent` como Gemini:
+    con imagen -> '1' (lechuga) con probabilidad `lettuce_ratio`; sin imagen -> texto de tratamientos.
+    La latencia es `latency_ms` ± `jitter` (fracción).
+    """
+
+    def __init__(self, latency_ms: float = 800.0, jitter: float = 0.2, lettuce_ratio: float = 1.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.jitter = jitter
+        self.lettuce_ratio = lettuce_ratio
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                stub.requests += 1
+                try:
+                    parts = json.loads(body)["contents"][0]["parts"]
+                except Exception:
+                    parts = []
+                if any("inlineData" in p for p in parts):
+                    text = "1" if random.random() < stub.lettuce_ratio else "0"
+                else:
+                    text = ("Querido agricultor estos son los tratamientos aconsejados para su planta\n"
+                            "Tratamiento 1\nAplique el producto recomendado cada 7 días.\n"
+                            "-------------------------------------------------------------")
+                if stub.latency:
+                    time.sleep(stub.latency * random.uniform(1 - stub.jitter, 1 + stub.jitter))
+                payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-gemini", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubGeminiServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
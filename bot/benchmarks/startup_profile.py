@@ -0,0 +1,244 @@
+"""
+Perfil de arranque del bot: tiempo de importación (con `python -X importtime`) y
+pasos de inicialización de `bot.initialize_runtime()` contra la BD SQLite de stand-in.
+
+Uso (desde bot/):
+    python benchmarks/startup_profile.py                       # importación + inicialización
+    python benchmarks/startup_profile.py --json antes.json     # guarda el informe
+    python benchmarks/startup_profile.py --compare antes.json  # diferencias con un informe previo
+    python benchmarks/startup_profile.py --cnn                 # incluye la precarga de TF + CNN
+
+La ruta crítica de importación sigue, desde `bot`, el submódulo con mayor tiempo
+acumulado en cada nivel; así se ve qué import arrastra a TensorFlow y compañía.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+BOT_DIR = BENCH_DIR.parent
+for _p in (BOT_DIR, BENCH_DIR):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+# Dependencias pesadas que no deberían cargarse al importar el bot
+HEAVY = ("tensorflow", "keras", "reportlab", "requests", "sklearn", "scipy", "PIL")
+
+
+# =======================
+# Importación (-X importtime)
+# =======================
+
+class ImportNode:
+    __slots__ = ("name", "self_us", "cumulative_us", "children")
+
+    def __init__(self, name: str, self_us: int, cumulative_us: int):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children: list["ImportNode"] = []
+
+
+def parse_importtime(text: str) -> list[ImportNode]:
+    """
+    Reconstruye el árbol de `-X importtime`. La salida está en post-orden: los hijos
+    (más indentados) aparecen antes que el import que los provocó.
+    """
+    pending: dict[int, list[ImportNode]] = {}
+    roots: list[ImportNode] = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        node = ImportNode(stripped.strip(), int(self_us), int(cum_us))
+        node.children = pending.pop(depth + 1, [])
+        if depth == 0:
+            roots.append(node)
+        else:
+            pending.setdefault(depth, []).append(node)
+    return roots
+
+
+def critical_path(node: ImportNode) -> list[tuple[str, float]]:
+    path = [(node.name, node.cumulative_us / 1e6)]
+    while node.children:
+        node = max(node.children, key=lambda c: c.cumulative_us)
+        path.append((node.name, node.cumulative_us / 1e6))
+    return path
+
+
+def heavy_entries(node: ImportNode, limit: int = 10) -> list[tuple[str, str, float]]:
+    """Primer import de cada paquete de terceros/propio y desde qué módulo se hizo."""
+    found: dict[str, tuple[str, str, float]] = {}
+
+    def walk(n: ImportNode, parent_root: Optional[str], parent: str):
+        root = n.name.split(".")[0]
+        if root != parent_root and root not in found:
+            found[root] = (n.name, parent, n.cumulative_us / 1e6)
+        for c in n.children:
+            walk(c, root, n.name)
+
+    walk(node, None, "-")
+    return sorted(found.values(), key=lambda e: e[2], reverse=True)[:limit]
+
+
+def profile_imports(module: str, workdir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(BOT_DIR), env.get("PYTHONPATH")) if p)
+    env.setdefault("LOG_LEVEL", "ERROR")
+    env.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    code = (f"import sys, time; t0 = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - t0); "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} falló:\n{proc.stderr[-2000:]}")
+    wall, loaded = proc.stdout.split("\n")[-3:-1]   # las dos últimas líneas impresas
+    root = next((r for r in parse_importtime(proc.stderr) if r.name == module), None)
+    if root is None:
+        raise RuntimeError(f"sin datos de importtime para {module}")
+    return {
+        "module": module,
+        "wall_s": float(wall),
+        "cumulative_s": root.cumulative_us / 1e6,
+        "heavy_loaded": [m for m in loaded.split(",") if m],
+        "critical_path": critical_path(root),
+        "entries": heavy_entries(root),
+    }
+
+
+# =======================
+# Inicialización (bot.initialize_runtime)
+# =======================
+
+def profile_init(workdir: str, with_cnn: bool) -> dict:
+    os.environ.setdefault("DATASET_RF", str(BOT_DIR / "models" / "Enfermedades_entrenamiento_actualizado.xlsx"))
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ.setdefault("TRACING_ENABLED", "0")
+    os.chdir(workdir)
+
+    from standins import SqliteDB
+
+    t0 = time.perf_counter()
+    import bot
+    import db_core
+    import_s = time.perf_counter() - t0
+
+    database = SqliteDB(os.path.join(workdir, "startup.sqlite3"))
+    database.seed()
+    database.install(db_core)
+
+    db_ok, (modelo, _, _), steps = bot.initialize_runtime()
+    total = steps.pop("total")
+    serial = steps.get("directories", 0.0)
+    parallel = {k: v for k, v in steps.items() if k != "directories"}
+    report = {
+        "import_s": import_s,
+        "steps": steps,
+        "init_s": total,
+        "sequential_s": sum(steps.values()),
+        "critical_step": max(parallel, key=parallel.get) if parallel else None,
+        "critical_s": serial + max(parallel.values(), default=0.0),
+        "db_ok": bool(db_ok),
+        "rf_ready": modelo is not None,
+        "resources": bot.RESOURCES.describe(),
+    }
+    if with_cnn:
+        import functionality as f
+        t0 = time.perf_counter()
+        f.preload_cnn_model().join()
+        report["cnn_preload_s"] = time.perf_counter() - t0
+        report["cnn_ready"] = f.MODELS.current("cnn") is not None
+    report["ready_s"] = import_s + total
+    return report
+
+
+# =======================
+# Informe
+# =======================
+
+def print_report(report: dict, before: Optional[dict] = None) -> None:
+    imp = report["imports"]
+    print(f"=== Importación de '{imp['module']}': {imp['wall_s']:.2f} s "
+          f"(importtime acumulado {imp['cumulative_s']:.2f} s) ===")
+    print(f"Dependencias pesadas cargadas: {', '.join(imp['heavy_loaded']) or 'ninguna'}")
+    print("\nRuta crítica:")
+    for depth, (name, secs) in enumerate(imp["critical_path"][:12]):
+        print(f"  {'  ' * depth}{name:<40}{secs * 1000:>10.1f} ms")
+    print("\nPaquetes más costosos (importado desde):")
+    for name, parent, secs in imp["entries"]:
+        print(f"  {name:<32}{secs * 1000:>10.1f} ms  <- {parent}")
+
+    init = report.get("init")
+    if init:
+        print(f"\n=== Inicialización: {init['init_s']:.2f} s "
+              f"(en serie serían {init['sequential_s']:.2f} s) ===")
+        for name, secs in sorted(init["steps"].items(), key=lambda kv: kv[1], reverse=True):
+            mark = "  <- ruta crítica" if name == init["critical_step"] else ""
+            print(f"  {name:<20}{secs * 1000:>10.1f} ms{mark}")
+        print(f"BD ok: {init['db_ok']}  ·  RF listo: {init['rf_ready']}")
+        res = init.get("resources")
+        if res:
+            print(f"Recursos: {res['cpus']} CPU ({res['cpu_source']}), TF intra={res['tf_intra_op']} "
+                  f"inter={res['tf_inter_op']}, inferencia={res['inference_workers']}, "
+                  f"executor={res['executor_workers']}")
+        if "cnn_preload_s" in init:
+            print(f"Precarga TF + CNN (en segundo plano): {init['cnn_preload_s']:.2f} s "
+                  f"(modelo listo: {init['cnn_ready']})")
+        print(f"Listo para atender: {init['ready_s']:.2f} s desde el primer import")
+
+    if before:
+        print("\n=== Comparación ===")
+        rows = [("importación", before["imports"]["wall_s"], imp["wall_s"])]
+        if init and before.get("init"):
+            rows += [("inicialización", before["init"]["init_s"], init["init_s"]),
+                     ("listo para atender", before["init"]["ready_s"], init["ready_s"])]
+        for label, old, new in rows:
+            delta = (new - old) / old if old else 0.0
+            print(f"  {label:<22}{old:>8.2f} s -> {new:>8.2f} s  {delta:+7.1%}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Perfil de arranque del bot (importación + inicialización).")
+    p.add_argument("--module", default="bot", help="módulo a importar (por defecto: bot)")
+    p.add_argument("--no-init", action="store_true", help="medir solo la importación")
+    p.add_argument("--cnn", action="store_true", help="medir también la precarga de TF y la CNN")
+    p.add_argument("--json", default=None, help="guardar el informe en este archivo")
+    p.add_argument("--compare", default=None, help="informe JSON previo con el que comparar")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    json_out = os.path.abspath(args.json) if args.json else None
+    before = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            before = json.load(fh)
+
+    workdir = tempfile.mkdtemp(prefix="pacho_startup_")
+    report = {"imports": profile_imports(args.module, workdir)}
+    if not args.no_init:
+        report["init"] = profile_init(workdir, args.cnn)
+    print_report(report, before)
+
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,29 @@
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, MessageHandler, CommandHandler, CallbackQueryHandler, ContextTypes, filters
-import os, asyncio
+import os, asyncio, functools, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+import resource_profile
+# Antes de numpy/pandas/TF: los hilos nativos se fijan según la cuota de CPU del contenedor
+RESOURCES = resource_profile.configure()
 import pandas as pd
 import re
 import functionality as f
 import randomforest as pr
 from dotenv import load_dotenv
 import db_core as db
+from update_processor import PerChatUpdateProcessor
+from admission import AdmissionController, Overloaded
+from session_store import ImageAnalysis, ImageWindow, SurveySession, get_sessions, sweep_sessions_job
+from janitor import ARTIFACTS, JANITOR_INTERVAL_SECONDS, janitor_job
+from metrics import DIAGNOSES, REGISTRY, start_metrics_server, timed
+import tracing
+import db_budget
+from model_registry import ADMIN_USER_IDS, MODEL_WATCH_SECONDS, MODELS, watch_models_job
+from shadow import SHADOW
+import adaptive_survey
 f.setup_logging()
 
 # =======================
@@ -24,65 +39,154 @@ synonyms = {
 }
 WINDOW_SECONDS = 0
 
+# Modo de ejecución: "polling" (por defecto) o "webhook" (servidor HTTP local)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Handlers ejecutándose a la vez entre chats distintos (cada chat sigue en serie)
+MAX_CONCURRENT_UPDATES = int(os.getenv("BOT_MAX_CONCURRENT_UPDATES", "16"))
+MAX_PENDING_UPDATES = int(os.getenv("BOT_MAX_PENDING_UPDATES", "1024"))
+
+# Admisión: límite por usuario + tope global de etapas costosas (descarga, Gemini, CNN, PDF)
+ADMISSION = AdmissionController.from_env()
+# Segundos que el PDF puede esperar un hueco (la encuesta ya se respondió)
+PDF_STAGE_WAIT_SECONDS = float(os.getenv("PDF_STAGE_WAIT_SECONDS", "30"))
+
+# Álbumes de Telegram (media_group_id): se analizan todas las fotos juntas
+ALBUM_MAX_IMAGES = int(os.getenv("ALBUM_MAX_IMAGES", "5"))
+# Espera para reunir las fotos del álbum (llegan como updates separados)
+ALBUM_WINDOW_SECONDS = float(os.getenv("ALBUM_WINDOW_SECONDS", "2"))
+
+# Preguntas respondidas por encuesta (modo full: todas; adaptive: hasta que el RF está seguro)
+SURVEY_QUESTIONS = REGISTRY.histogram("pacho_survey_questions", "Preguntas respondidas por encuesta", ("mode",),
+                                      buckets=(1, 2, 3, 4, 5, 6, 7, 8, 10, 15))
+
+# Cada cuánto se expulsan sesiones caducadas de memoria
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+
+# Arranque: pasos independientes en paralelo y TF/CNN cargándose en segundo plano
+STARTUP_WORKERS = int(os.getenv("STARTUP_WORKERS", "3"))
+CNN_PRELOAD = os.getenv("CNN_PRELOAD", "1").strip().lower() not in ("0", "false", "no")
+
+
+def busy_text(e: Overloaded) -> str:
+    return f"⏳ Estoy atendiendo muchas solicitudes. Intenta de nuevo en {e.retry_seconds} s."
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Etapa del diagnóstico: latencia en /metrics y span en la traza activa."""
+    with timed(name), tracing.span(name, **attributes) as sp:
+        yield sp
+
 
 async def process_image_after_window_async(context: ContextTypes.DEFAULT_TYPE, uid: int):
+    # La tarea diferida hereda el contexto del update que la creó: lleva su propio acumulador de BD
+    with db_budget.track("process_image", user_id=uid):
+        await _process_image_after_window(context, uid)
+
+
+async def _process_image_after_window(context: ContextTypes.DEFAULT_TYPE, uid: int):
+    trace = None
     try:
         # recuperar y limpiar sesión
-        win = context.bot_data.get('image_window', {})
-        sess = win.pop(uid, None)
+        sessions = get_sessions(context.bot_data)
+        sess = sessions.image_window.pop(uid)
         if not sess:
             return
 
-        file_id = sess.get("last_file_id")
-        chat_id = sess.get("chat_id", uid)
-        uname = sess.get("uname", "sin_username")
-        count = int(sess.get("count", 1))
+        file_ids = sess.file_ids
+        trace = sess.trace
+        chat_id = sess.chat_id or uid
+        uname = sess.uname
+        count = sess.count or 1
 
-        if not file_id:
+        if not file_ids:
             await context.bot.send_message(chat_id=chat_id, text="❌ No pude obtener la imagen. Envía una foto nuevamente.")
+            tracing.end_trace(trace, "error", reason="no_file")
             return
 
-        # descargar la ÚLTIMA imagen
-        tg_file = await context.bot.get_file(file_id)
-        image_path = f"data/uploads/{uid}_diagnosis.jpg"
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-        await tg_file.download_to_drive(image_path)
-
-        if count > 1:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="He detectado que enviaste más de una imagen, así que analizaré la última que me enviaste."
-            )
-
-        # 1) detectar lechuga
-        det = f.detect_lettuce(image_path)
-        print(f"[DEBUG] Resultado detectlettuce para {image_path}: {det}")
-        if det == "1":
-            await context.bot.send_message(chat_id=chat_id, text="✅ Se detectó lechuga en la imagen.")
-        elif det == "0":
-            await context.bot.send_message(chat_id=chat_id, text="❌ No se detectó lechuga en la imagen. Envía otra foto.")
-            return
-        else:
-            await context.bot.send_message(chat_id=chat_id, text="⚠️ La imagen no parece una lechuga real. Intenta con otra foto. Resultado: " + str(det))
-            return
-            
-
-        # 2) clasificar en silencio (CNN)
-        result_text = f.classify_image(image_path)
-        top = extract_top_from_msg(result_text)
-        # guardar resultado para el paso final + ruta de imagen
-        context.bot_data.setdefault('image_analysis', {})[uid] = {
-            'ml_result': result_text,
-            'detected_class': top,
-            'image_path': image_path,
-        }
-
-        # 3) iniciar encuesta RF
-        context.bot_data.setdefault('survey_sessions', {})[uid] = {'responses': {}, 'user_name': uname}
-        await context.bot.send_message(chat_id=chat_id, text="Ahora te haré unas preguntas rápidas para complementar el diagnóstico 🌱")
-        await send_diagnostic_question_simple(context, uid, 1)
-
+        with tracing.span("process_image", trace=trace, images=len(file_ids)):
+            # etapas costosas (descarga, filtro Gemini, CNN) bajo el tope global
+            async with ADMISSION.stage("image"):
+                # descargar la ÚLTIMA imagen (o todas las del álbum)
+                image_paths = [f"data/uploads/{uid}_diagnosis.jpg" if i == 0 else f"data/uploads/{uid}_diagnosis_{i}.jpg"
+                               for i in range(len(file_ids))]
+                os.makedirs(os.path.dirname(image_paths[0]), exist_ok=True)
+
+                async def _download(fid, path):
+                    tg_file = await context.bot.get_file(fid)
+                    await tg_file.download_to_drive(path)
+
+                with stage("download"):
+                    await asyncio.gather(*(_download(fid, path) for fid, path in zip(file_ids, image_paths)))
+                for path in image_paths:
+                    ARTIFACTS.register(path, "upload", owner=uid)
+
+                if count > 1:
+                    await context.bot.send_message(
+                        chat_id=chat_id,
+                        text="He detectado que enviaste más de una imagen, así que analizaré la última que me enviaste."
+                    )
+
+                # 1) detectar lechuga (en paralelo para todas las imágenes del álbum)
+                with stage("detect_lettuce"):
+                    dets = await asyncio.gather(*(asyncio.to_thread(f.detect_lettuce, p) for p in image_paths))
+                f.logger.debug(f"Resultado detectlettuce para {image_paths}: {dets}", extra={"sample": True})
+                if len(image_paths) == 1:
+                    det = dets[0]
+                    if det == "1":
+                        await context.bot.send_message(chat_id=chat_id, text="✅ Se detectó lechuga en la imagen.")
+                    elif det == "0":
+                        await context.bot.send_message(chat_id=chat_id, text="❌ No se detectó lechuga en la imagen. Envía otra foto.")
+                        tracing.end_trace(trace, "rejected", reason="no_lettuce")
+                        return
+                    else:
+                        await context.bot.send_message(chat_id=chat_id, text="⚠️ La imagen no parece una lechuga real. Intenta con otra foto. Resultado: " + str(det))
+                        tracing.end_trace(trace, "rejected", reason=f"detect_{det}")
+                        return
+                else:
+                    kept = [p for p, det in zip(image_paths, dets) if det == "1"]
+                    if not kept:
+                        await context.bot.send_message(chat_id=chat_id, text="❌ No se detectó lechuga en ninguna de las imágenes. Envía otras fotos.")
+                        tracing.end_trace(trace, "rejected", reason="no_lettuce")
+                        return
+                    msg = f"✅ Se detectó lechuga en {len(kept)} de {len(image_paths)} imágenes."
+                    if len(kept) < len(image_paths):
+                        msg += " Las demás no se tendrán en cuenta."
+                    await context.bot.send_message(chat_id=chat_id, text=msg)
+                    image_paths = kept
+
+                # 2) clasificar en silencio (CNN): un único lote y diagnóstico de ensamble
+                with stage("classify", images=len(image_paths)):
+                    cnn = MODELS.current("cnn")   # versiones fijadas para este diagnóstico
+                    fast = MODELS.current("cnn_fast")
+                    t0 = time.perf_counter()
+                    result_text, cnn_stage, batch = await resource_profile.run_inference(
+                        f.classify_images_staged, image_paths, cnn, fast)
+                    cnn_seconds = time.perf_counter() - t0
+                    cnn = cnn or MODELS.current("cnn")
+                    fast = fast or MODELS.current("cnn_fast")
+                top = extract_top_from_msg(result_text)
+                if cnn_stage and batch is not None and SHADOW.wants("cnn"):
+                    # el lote que ya decodificó la CNN: cuando corra el trabajo, los archivos pueden ser de otra foto
+                    SHADOW.submit("cnn", functools.partial(f.predict_class_probs, batch),
+                                  extract_probs_from_msg(result_text), _answered_by(cnn_stage, cnn, fast), cnn_seconds,
+                                  trace.trace_id if trace else None)
+            # guardar resultado para el paso final + ruta de imagen
+            sessions.image_analysis.put(uid, ImageAnalysis(result_text, top, image_paths, trace,
+                                                           model_version=_answered_by(cnn_stage, cnn, fast)))
+
+            # 3) iniciar encuesta RF
+            sessions.survey.put(uid, SurveySession(uname, trace))
+            await context.bot.send_message(chat_id=chat_id, text="Ahora te haré unas preguntas rápidas para complementar el diagnóstico 🌱")
+            await send_next_question(context, uid)
+
+    except Overloaded as e:
+        if e.reason == "busy":   # no se atendió: el reintento no debe chocar con el límite por usuario
+            ADMISSION.refund_user(uid)
+        tracing.end_trace(trace, "shed", reason=e.reason)
+        await context.bot.send_message(chat_id=uid, text=busy_text(e))
     except Exception as e:
+        tracing.end_trace(trace, "error")
         f.logger.error(f"process_image_after_window_async: {e}")
         try:
             await context.bot.send_message(chat_id=uid, text="❌ Ocurrió un error procesando la imagen.")
@@ -97,6 +201,14 @@ def normalize_label(x: str) -> str:
         return rf_num_to_name[s]
     return synonyms.get(s, str(x or "").strip())
 
+def _answered_by(stage, cnn, fast):
+    """Versión (o versiones) de la CNN que produjo el resultado según la etapa de la cascada."""
+    if stage == "fast":
+        return fast.version if fast else None
+    if stage == "mixed" and fast and cnn:
+        return f"{fast.version}+{cnn.version}"
+    return cnn.version if cnn else None
+
 def extract_top_from_msg(msg: str) -> str:
     """Extrae la clase top-1 del texto de la CNN en formato flexible."""
     m = re.search(r"Detecci[oó]n\s+realizada:\s*\**\s*([^\n*]+)", msg or "", flags=re.I)
@@ -119,9 +231,8 @@ def extract_top_from_msg(msg: str) -> str:
     return normalize_label(label) if label else "Desconocida"
 
 def _store_cnn_result(context, user_id: int, ml_result: str, detected_class: str, image_path: str = None):
-    payload = {'ml_result': ml_result, 'detected_class': detected_class, 'image_path': image_path}
-    context.bot_data.setdefault('image_analysis', {})[user_id] = payload
-    context.application.bot_data.setdefault('image_analysis', {})[user_id] = payload
+    payload = ImageAnalysis(ml_result, detected_class, [image_path] if image_path else [])
+    get_sessions(context.bot_data).image_analysis.put(user_id, payload)
 
 def extract_probs_from_msg(msg: str) -> dict:
     """Devuelve dict normalizado {Botrytis/Xanthomonas/Sana: prob(0-1)} desde el texto de la CNN."""
@@ -177,6 +288,20 @@ def rf_predict_from_pipeline(modelo, feature_columns, survey_responses: dict):
         return {"error": True, "message": str(e)}
 
 
+def rf_predict_adaptive(planner, survey_responses: dict):
+    """Como `rf_predict_from_pipeline`, con P(clase | respuestas dadas) de las tablas adaptativas."""
+    try:
+        out = planner.predict(survey_responses)
+        return {
+            "error": False,
+            "clase_predicha": normalize_label(out["clase_predicha"]),
+            "confianza": out["confianza"],
+            "probabilidades": {normalize_label(c): p for c, p in out["probabilidades"].items()}
+        }
+    except Exception as e:
+        return {"error": True, "message": str(e)}
+
+
 # -------------------- FOTO GUÍA --------------------
 async def send_photo_guidance(context, user_id, user_name):
     try:
@@ -193,7 +318,7 @@ async def handle_terms_callback(update: Update, context: ContextTypes.DEFAULT_TY
     fecha = datetime.now().strftime("%d-%m-%Y")
 
     if q.data.startswith("acepto"):
-        db.update_user_data_db(uid, agreement_state=True, DateAgreement=fecha)
+        await asyncio.to_thread(db.update_user_data_db, uid, agreement_state=True, DateAgreement=fecha)
         if q.message.text != "✅ Has aceptado los términos y condiciones.":
             await q.edit_message_text("✅ Has aceptado los términos y condiciones.")
         await send_photo_guidance(context, uid, uname)
@@ -204,31 +329,81 @@ async def handle_terms_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 # -------------------- ENCUESTA RF --------------------
 def extract_survey_responses_for_ml(context, user_id):
-    ss = context.bot_data.get('survey_sessions', {}).get(user_id)
+    ss = get_sessions(context.bot_data).survey.get(user_id)
     if not ss: return {}
     out = {}
-    for k,v in ss.get('responses', {}).items():
+    for k,v in ss.responses.items():
         if k.startswith('q'):
             try: out[int(k[1:])] = v
             except: pass
     return out
 
-async def send_diagnostic_question_simple(context, user_id, qn, message=None):
-    qdata = db.get_diagnostic_question(qn)
+_planner_failed: set[str] = set()   # versiones del RF sin planificador (p. ej. demasiadas características)
+
+
+def _survey_planner():
+    """
+    Planificador de la encuesta adaptativa para el RF activo, o None (modo full, RF no
+    disponible o sin planificador para esta versión: entonces se hace la encuesta completa).
+    """
+    rf = MODELS.current("rf")
+    if adaptive_survey.SURVEY_MODE != "adaptive" or rf is None or not rf.features:
+        return None
+    if rf.version in _planner_failed:
+        return None
+    try:
+        return adaptive_survey.planner_for(rf)
+    except Exception as e:
+        _planner_failed.add(rf.version)
+        f.logger.warning(f"[SURVEY] Sin encuesta adaptativa para el RF {rf.version}; se usa la completa: {e}")
+        return None
+
+
+async def send_next_question(context, user_id, message=None):
+    """Modo adaptive: la pregunta más informativa o, si el RF ya está seguro, la ubicación. Modo full: la primera."""
+    ss = get_sessions(context.bot_data).survey.get(user_id)
+    planner = await asyncio.to_thread(_survey_planner) if ss is not None else None
+    if planner is None:
+        await send_diagnostic_question_simple(context, user_id, 1, message)
+        return
+    nxt = planner.next_question(extract_survey_responses_for_ml(context, user_id), skip=ss.skipped)
+    if nxt is None:
+        ss.pending = None
+        if message: await message.edit_text("✅ Gracias. Con eso tengo suficiente. Ahora cuéntame dónde está tu cultivo.")
+        await ask_cultivation_location(context, user_id)
+        return
+    await send_diagnostic_question_simple(context, user_id, nxt, message, total=planner.n)
+
+
+async def send_diagnostic_question_simple(context, user_id, qn, message=None, total=None):
+    with stage("survey_db"):
+        qdata = await asyncio.to_thread(db.get_diagnostic_question, qn)
     if not qdata:
         txt = "❌ No pude cargar la pregunta. Intenta de nuevo."
         if message: await message.edit_text(txt)
         else: await context.bot.send_message(chat_id=user_id, text=txt)
         return
-    total = db.get_total_diagnostic_questions()
+    ss = get_sessions(context.bot_data).survey.get(user_id)
+    adaptive = total is not None   # el orden lo decide el planificador; `total` es su número de preguntas
+    if not adaptive:
+        with stage("survey_db"):
+            total = await asyncio.to_thread(db.get_total_diagnostic_questions)
     valid = [a for a in qdata['answers'] if a['answer_text'] and a['answer_text'].strip()!='']
     if not valid:
-        if qn < total: await send_diagnostic_question_simple(context, user_id, qn+1, message)
+        if adaptive and ss is not None:
+            ss.skipped.add(qn)
+            await send_next_question(context, user_id, message)
+        elif qn < total: await send_diagnostic_question_simple(context, user_id, qn+1, message)
         else: await ask_cultivation_location(context, user_id)
         return
+    if ss is not None:
+        ss.pending = qn
     kb = [[InlineKeyboardButton(a['answer_text'], callback_data=f"simple_answer:{qn}:{a['answer_text']}")] for a in valid]
-    progress = "🟢"*qn + "⚪"*(total-qn)
-    txt = f"📋 PREGUNTA {qn} de {total}**\n{progress}\n\n❓     {qdata['question_text']}**\n\n👇 Elige tu respuesta:"
+    # en modo adaptativo se numera por orden de aparición (la pregunta 7 puede ser la primera)
+    shown = len(ss.responses) + 1 if adaptive and ss is not None else qn
+    progress = "🟢"*shown + "⚪"*max(0, total-shown)
+    limit = f"máx. {total}" if adaptive else f"de {total}"
+    txt = f"📋 PREGUNTA {shown} {limit}**\n{progress}\n\n❓     {qdata['question_text']}**\n\n👇 Elige tu respuesta:"
     if message: await message.edit_text(txt, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
     else: await context.bot.send_message(chat_id=user_id, text=txt, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
 
@@ -280,22 +455,29 @@ async def handle_simple_answer_callback(update: Update, context: ContextTypes.DE
         ans = parts[2]
 
         # Mantener estructura de respuestas
-        ss = context.bot_data.setdefault('survey_sessions', {}).setdefault(uid, {'responses': {}})
-        ss['responses'][f'q{qn}'] = ans
-
-        # 🧠 Guardar texto limpio de la pregunta
-        qdata = db.get_diagnostic_question(qn)
-        if qdata and qdata.get('question_text'):
-            clean_text = clean_question_text(qdata['question_text'])
-            ss.setdefault('question_texts', {})[qn] = clean_text
-
-        # Continuar flujo normal
-        total = db.get_total_diagnostic_questions()
-        if qn < total:
-            await send_diagnostic_question_simple(context, uid, qn + 1, q.message)
-        else:
-            await q.edit_message_text("✅ Gracias. Ahora cuéntame dónde está tu cultivo.")
-            await ask_cultivation_location(context, uid)
+        ss = get_sessions(context.bot_data).survey.get_or_create(uid, SurveySession)
+        ss.responses[f'q{qn}'] = ans
+        ss.pending = None
+
+        with tracing.span("survey_answer", trace=ss.trace, question=qn):
+            planner = await asyncio.to_thread(_survey_planner)
+            # 🧠 Guardar texto limpio de la pregunta
+            with stage("survey_db"):
+                qdata = await asyncio.to_thread(db.get_diagnostic_question, qn)
+                # en modo adaptativo el total no decide nada: una consulta menos por respuesta
+                total = await asyncio.to_thread(db.get_total_diagnostic_questions) if planner is None else None
+            if qdata and qdata.get('question_text'):
+                clean_text = clean_question_text(qdata['question_text'])
+                ss.question_texts[qn] = clean_text
+
+            # Continuar flujo normal
+            if planner is not None:
+                await send_next_question(context, uid, q.message)
+            elif qn < total:
+                await send_diagnostic_question_simple(context, uid, qn + 1, q.message)
+            else:
+                await q.edit_message_text("✅ Gracias. Ahora cuéntame dónde está tu cultivo.")
+                await ask_cultivation_location(context, uid)
 
 async def ask_cultivation_location(context, user_id):
     kb = [[InlineKeyboardButton("🏠 Hidroponía", callback_data=f"location:invernadero:{user_id}")],
@@ -309,8 +491,10 @@ async def handle_location_callback(update: Update, context: ContextTypes.DEFAULT
     data = q.data
     if not data.startswith("location:"): return
     ubic = data.split(":")[1]
-    ss = context.bot_data.setdefault('survey_sessions', {}).setdefault(uid, {})
-    ss['cultivation_location'] = ubic
+    ss = get_sessions(context.bot_data).survey.get_or_create(uid, SurveySession)
+    ss.cultivation_location = ubic
+    if ss.trace is not None:
+        ss.trace.set_attribute("cultivation.location", ubic)
     await q.edit_message_text("🔄 Procesando diagnóstico final...")
     await asyncio.sleep(1)
     await complete_combined_diagnosis_with_rf(context, uid)
@@ -321,9 +505,9 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uname = update.message.from_user.username or "sin_username"
 
     # validar términos
-    if not db.check_user_exists_db(uid):
-        db.create_user_db(uid, uname, False, None, False, None)
-    user_data = db.load_user_data_db(uid) or {"agreement_state": False}
+    if not await asyncio.to_thread(db.check_user_exists_db, uid):
+        await asyncio.to_thread(db.create_user_db, uid, uname, False, None, False, None)
+    user_data = await asyncio.to_thread(db.load_user_data_db, uid) or {"agreement_state": False}
     if not user_data.get("agreement_state", False):
         kb = [[InlineKeyboardButton("✅ Acepto", callback_data=f"acepto:{uid}")],
               [InlineKeyboardButton("❌ No Acepto", callback_data=f"no_acepto:{uid}")]]
@@ -352,177 +536,240 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     file_id = update.message.photo[-1].file_id
+    media_group_id = update.message.media_group_id
 
     # ventana de 60 s: guardo última imagen y reprogramo tarea
-    win = context.bot_data.setdefault('image_window', {})
-    sess = win.setdefault(uid, {"count": 0, "last_file_id": None, "task": None,
-                                "chat_id": update.effective_chat.id, "uname": uname})
+    win = get_sessions(context.bot_data).image_window
+    sess = win.get(uid)
+    same_album = bool(sess and media_group_id and sess.media_group_id == media_group_id)
+
+    if sess is None:
+        # límite por usuario: responder de inmediato en lugar de encolar otra tarea. Solo
+        # cobra una ventana nueva: un álbum o una foto que reemplaza la que espera no añaden trabajo
+        try:
+            ADMISSION.check_user(uid)
+        except Overloaded as e:
+            await update.message.reply_text(busy_text(e))
+            return
+        sess = win.get_or_create(uid, lambda: ImageWindow(
+            update.effective_chat.id, uname, tracing.start_trace("diagnosis", **{"user.id": uid})))
 
     # cancelar tarea previa
-    if sess.get("task"):
-        try: sess["task"].cancel()
+    if sess.task:
+        try: sess.task.cancel()
         except Exception: pass
 
     # actualizar estado
-    sess["count"] += 1
-    sess["last_file_id"] = file_id
-    sess["chat_id"] = update.effective_chat.id
-    sess["uname"] = uname
-
-    # programar procesamiento en 60 s (solo la última)
+    if same_album:
+        if len(sess.file_ids) < ALBUM_MAX_IMAGES:
+            sess.file_ids.append(file_id)
+    else:
+        sess.count += 1
+        sess.file_ids = [file_id]
+        sess.media_group_id = media_group_id
+    sess.chat_id = update.effective_chat.id
+    sess.uname = uname
+
+    # programar procesamiento en 60 s (solo la última foto o el álbum completo)
+    delay = ALBUM_WINDOW_SECONDS if media_group_id else WINDOW_SECONDS
     async def _delayed_run():
         try:
-            await asyncio.sleep(WINDOW_SECONDS)
+            await asyncio.sleep(delay)
             await process_image_after_window_async(context, uid)
         except asyncio.CancelledError:
             pass
         except Exception as e:
             f.logger.error(f"_delayed_run error: {e}")
 
-    sess["task"] = asyncio.create_task(_delayed_run())
-    await update.message.reply_text("👍 Recibí tu imagen. Esperaré 1 minuto por si envías más y analizaré la última.")
+    with tracing.span("handle_image", trace=sess.trace, album=bool(media_group_id), photos=len(sess.file_ids)):
+        sess.task = asyncio.create_task(_delayed_run())
+    if same_album:
+        return
+    if media_group_id:
+        await update.message.reply_text("👍 Recibí tus imágenes. Las analizaré todas juntas para darte un único diagnóstico.")
+    else:
+        await update.message.reply_text("👍 Recibí tu imagen. Esperaré 1 minuto por si envías más y analizaré la última.")
 
 # -------------------- DIAGNÓSTICO FINAL (Comparación CNN vs RF) --------------------
 # ============================================================
 # Paso final: comparar CNN (imagen) vs RF (encuesta) y responder
 # ============================================================
 async def complete_combined_diagnosis_with_rf(context, user_id):
+    trace = None
     try:
         # 1) recuperar resultado de CNN
-        image_data = (context.bot_data.get('image_analysis', {}).get(user_id)
-                      or context.application.bot_data.get('image_analysis', {}).get(user_id))
+        sessions = get_sessions(context.bot_data)
+        image_data = sessions.image_analysis.get(user_id)
+        survey = sessions.survey.get(user_id) or SurveySession()
+        trace = image_data.trace if image_data else survey.trace
         if not image_data:
             await context.bot.send_message(chat_id=user_id,
                                            text="❌ No tengo el resultado de la imagen. Envía una foto de nuevo.")
             return
 
-        cnn_class = normalize_label(image_data.get('detected_class', 'Desconocida'))
-
-        # 2) ejecutar RF
-        modelo = context.bot_data.get('ml_model')
-        features = context.bot_data.get('ml_features')
-        if not (modelo and features):
-            await context.bot.send_message(chat_id=user_id, text="⚠️ No pude ejecutar el Random Forest.")
-            return
-
-        responses = extract_survey_responses_for_ml(context, user_id)
-        rf_out = rf_predict_from_pipeline(modelo, features, responses)
-        if rf_out.get("error"):
-            await context.bot.send_message(chat_id=user_id, text=f"⚠️ Error en RF: {rf_out.get('message','desconocido')}")
-            return
-
-        rf_class = normalize_label(rf_out["clase_predicha"])
-
-        # 3) feedback de coincidencia
-        if (cnn_class or '').lower() == (rf_class or '').lower():
-            msg = (f"✅ **Las clasificaciones COINCIDEN**\n\n"
-                   f"• Imagen: {cnn_class}\n"
-                   f"• Preguntas: {rf_class}")
-            await context.bot.send_message(chat_id=user_id, text=msg, parse_mode='Markdown')            
-            db.increment_user_diagnosis_db(user_id)
-
-            # 4) construir bloques para PDF
-            from datetime import datetime
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            reports_dir = os.path.join("data", "reports")
-            os.makedirs(reports_dir, exist_ok=True)
-            outfile = os.path.join(reports_dir, f"Pacho_Informe_{user_id}_{ts}.pdf")
-
-            question_texts = context.bot_data.get('survey_sessions', {}).get(user_id, {}).get('question_texts', {})
-
-            rf_block = {
-                "clasificacion": rf_class,
-                "confianza": float(rf_out.get("confianza", 0.0)),
-                "probabilidades": rf_out.get("probabilidades", {}),
-                "respuestas": responses,
-                "preguntas": question_texts
-            }
-
-
-            cnn_probs = extract_probs_from_msg(image_data.get('ml_result', ''))
-            example_path = f.get_example_image_for_disease(cnn_class)
-            cnn_block = {
-                "clasificacion": cnn_class,
-                "probabilidades": cnn_probs,
-                "imagen_usuario_path": image_data.get('image_path'),
-                "imagen_ejemplo_path": example_path
-            }
-
-            # ubicación seleccionada al terminar la encuesta
-            ubic = None
-            try:
-                ubic = context.bot_data.get('survey_sessions', {}).get(user_id, {}).get('cultivation_location')
-            except Exception:
-                pass
-            ubic_norm = (ubic or "tierra").strip().lower()
-
-            # 5) tratamientos: API -> fallback local
-            tratamientos = []
-            treatment_title = ""
-            try:
-                resultados = db.search_treatments_db(rf_class, ubic_norm, limit=4)
-                if resultados:
-                    tratamientos = [r['detalle_tratamiento'] for r in resultados]
-                    treatment_title = "Tratamiento recomendado"
+        with tracing.span("final_diagnosis", trace=trace):
+            cnn_class = normalize_label(image_data.detected_class or 'Desconocida')
+
+            # 2) ejecutar RF (versión activa al empezar este paso)
+            rf = MODELS.current("rf")
+            modelo, features = (rf.model, rf.features) if rf else (None, None)
+            if not (modelo and features):
+                await context.bot.send_message(chat_id=user_id, text="⚠️ No pude ejecutar el Random Forest.")
+                tracing.end_trace(trace, "error", reason="rf_unavailable")
+                return
+
+            responses = extract_survey_responses_for_ml(context, user_id)
+            with stage("rf_predict", answers=len(responses)):
+                t0 = time.perf_counter()
+                planner = await asyncio.to_thread(_survey_planner)
+                if planner is not None:
+                    # las preguntas no hechas se promedian según el prior (no cuentan como "no")
+                    rf_out = rf_predict_adaptive(planner, responses)
                 else:
+                    rf_out = await asyncio.to_thread(rf_predict_from_pipeline, modelo, features, responses)
+                rf_seconds = time.perf_counter() - t0
+            survey_mode = "adaptive" if planner is not None else "full"
+            SURVEY_QUESTIONS.observe(len(responses), mode=survey_mode)
+            tracing.set_attribute("survey.mode", survey_mode)
+            tracing.set_attribute("survey.questions", len(responses))
+            if not rf_out.get("error") and SHADOW.wants("rf"):
+                SHADOW.submit("rf", functools.partial(_shadow_rf_probs, responses),
+                              rf_out["probabilidades"], rf.version, rf_seconds,
+                              trace.trace_id if trace else None)
+            if rf_out.get("error"):
+                await context.bot.send_message(chat_id=user_id, text=f"⚠️ Error en RF: {rf_out.get('message','desconocido')}")
+                tracing.end_trace(trace, "error", reason="rf_error")
+                return
+
+            rf_class = normalize_label(rf_out["clase_predicha"])
+            matched = (cnn_class or '').lower() == (rf_class or '').lower()
+
+            # 3) feedback de coincidencia
+            if matched:
+                msg = (f"✅ **Las clasificaciones COINCIDEN**\n\n"
+                       f"• Imagen: {cnn_class}\n"
+                       f"• Preguntas: {rf_class}")
+                await context.bot.send_message(chat_id=user_id, text=msg, parse_mode='Markdown')            
+                await asyncio.to_thread(db.increment_user_diagnosis_db, user_id)
+
+                # 4) construir bloques para PDF
+                from datetime import datetime
+                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+                reports_dir = os.path.join("data", "reports")
+                os.makedirs(reports_dir, exist_ok=True)
+                outfile = os.path.join(reports_dir, f"Pacho_Informe_{user_id}_{ts}.pdf")
+
+                question_texts = survey.question_texts
+
+                rf_block = {
+                    "clasificacion": rf_class,
+                    "confianza": float(rf_out.get("confianza", 0.0)),
+                    "probabilidades": rf_out.get("probabilidades", {}),
+                    "respuestas": responses,
+                    "preguntas": question_texts
+                }
+
+
+                cnn_probs = extract_probs_from_msg(image_data.ml_result or '')
+                example_path = await asyncio.to_thread(f.get_example_image_for_disease, cnn_class)
+                cnn_block = {
+                    "clasificacion": cnn_class,
+                    "probabilidades": cnn_probs,
+                    "imagen_usuario_path": image_data.image_path,
+                    "imagen_ejemplo_path": example_path
+                }
+
+                # ubicación seleccionada al terminar la encuesta
+                ubic = survey.cultivation_location
+                ubic_norm = (ubic or "tierra").strip().lower()
+
+                # 5) tratamientos: API -> fallback local
+                tratamientos = []
+                treatment_title = ""
+                try:
+                    with stage("search_treatments"):
+                        resultados = await asyncio.to_thread(db.search_treatments_db, rf_class, ubic_norm, limit=4)
+                    if resultados:
+                        tratamientos = [r['detalle_tratamiento'] for r in resultados]
+                        treatment_title = "Tratamiento recomendado"
+                    else:
+                        treatment_title = "Observaciones"
+                        tratamientos = [
+                            "⚠️ No se encontraron tratamientos registrados en la base de datos para esta enfermedad y ubicación."
+                        ]
+                except Exception as e:
+                    f.logger.error(f"Error consultando tratamientos: {e}")
                     treatment_title = "Observaciones"
                     tratamientos = [
-                        "⚠️ No se encontraron tratamientos registrados en la base de datos para esta enfermedad y ubicación."
+                        "❌ Error al consultar tratamientos en la base de datos."
                     ]
-            except Exception as e:
-                f.logger.error(f"Error consultando tratamientos: {e}")
-                treatment_title = "Observaciones"
-                tratamientos = [
-                    "❌ Error al consultar tratamientos en la base de datos."
-                ]
-
-            meta = {"fecha": datetime.now().strftime("%d-%m-%Y %H:%M")}
-            load_dotenv()
-            logo_path = os.getenv("REPORT_IMAGES_PATH") + "logo_pacho.png"
-
-            # aviso previo
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="📄 A continuación te enviaré un documento con el resumen del diagnóstico y la recomendación de tratamiento."
-            )
 
-            # generar y enviar PDF
-            f.build_pacho_pdf_report(
-                outfile=outfile,
-                meta=meta,
-                rf_block=rf_block,
-                cnn_block=cnn_block,
-                tratamiento=tratamientos,
-                logo_path=logo_path,
-                treatment_title=treatment_title
-            )
+                meta = {"fecha": datetime.now().strftime("%d-%m-%Y %H:%M")}
+                load_dotenv()
+                logo_path = os.getenv("REPORT_IMAGES_PATH") + "logo_pacho.png"
 
-            with open(outfile, "rb") as fh:
-                await context.bot.send_document(
+                # aviso previo
+                await context.bot.send_message(
                     chat_id=user_id,
-                    document=fh,
-                    filename=os.path.basename(outfile),
-                    caption="📄 Informe de diagnóstico"
+                    text="📄 A continuación te enviaré un documento con el resumen del diagnóstico y la recomendación de tratamiento."
                 )
 
-        else:
-            msg = (f"⚠️ **Las clasificaciones NO coinciden**\n\n"
-                   f"• Imagen: {cnn_class}\n"
-                   f"• Preguntas: {rf_class}")
-            await context.bot.send_message(chat_id=user_id, text=msg, parse_mode='Markdown')
-            await context.bot.send_message(chat_id=user_id, text="⚠️ Por favor, envía otra foto de tu lechuga para un nuevo análisis. Responde las preguntas de acuerdo a tus condiciones.")
-            # No se genera ni envía PDF
+                # generar y enviar PDF (etapa costosa: formateo con LLM + ReportLab)
+                async with ADMISSION.stage("pdf", wait_timeout=PDF_STAGE_WAIT_SECONDS):
+                    with stage("build_pdf"):
+                        await asyncio.to_thread(
+                            f.build_pacho_pdf_report,
+                            outfile=outfile,
+                            meta=meta,
+                            rf_block=rf_block,
+                            cnn_block=cnn_block,
+                            tratamiento=tratamientos,
+                            logo_path=logo_path,
+                            treatment_title=treatment_title
+                        )
+                ARTIFACTS.register(outfile, "report", owner=user_id)
+
+                with open(outfile, "rb") as fh, stage("send_document"):
+                    await context.bot.send_document(
+                        chat_id=user_id,
+                        document=fh,
+                        filename=os.path.basename(outfile),
+                        caption="📄 Informe de diagnóstico"
+                    )
+                DIAGNOSES.inc(result="match")
+
+            else:
+                msg = (f"⚠️ **Las clasificaciones NO coinciden**\n\n"
+                       f"• Imagen: {cnn_class}\n"
+                       f"• Preguntas: {rf_class}")
+                await context.bot.send_message(chat_id=user_id, text=msg, parse_mode='Markdown')
+                await context.bot.send_message(chat_id=user_id, text="⚠️ Por favor, envía otra foto de tu lechuga para un nuevo análisis. Responde las preguntas de acuerdo a tus condiciones.")
+                # No se genera ni envía PDF
+                DIAGNOSES.inc(result="mismatch")
 
         # 6) limpieza
-        context.bot_data.get('image_analysis', {}).pop(user_id, None)
-        context.application.bot_data.get('image_analysis', {}).pop(user_id, None)
-        context.bot_data.get('survey_sessions', {}).pop(user_id, None)
-        f.delete_user_files(user_id=user_id)        
-
+        sessions.image_analysis.pop(user_id)
+        sessions.survey.pop(user_id)
+        await asyncio.to_thread(f.delete_user_files, user_id=user_id)
+        record = {"user_id": user_id, "result": "match" if matched else "mismatch",
+                  "cnn_class": cnn_class, "rf_class": rf_class,
+                  "cnn_version": image_data.model_version, "rf_version": rf.version}
+        f.logger.info(f"[DIAGNOSIS] {record['result']} cnn={cnn_class}@{record['cnn_version']} "
+                      f"rf={rf_class}@{record['rf_version']}", extra={"diagnosis": record})
+        tracing.end_trace(trace, "ok", result=record["result"],
+                          **{"cnn.class": cnn_class, "rf.class": rf_class,
+                             "model.cnn_version": record["cnn_version"] or "",
+                             "model.rf_version": record["rf_version"]})
+
+    except Overloaded as e:
+        tracing.end_trace(trace, "shed", reason=e.reason)
+        await context.bot.send_message(chat_id=user_id, text=busy_text(e))
+        await asyncio.to_thread(f.delete_user_files, user_id=user_id)
     except Exception as e:
+        tracing.end_trace(trace, "error")
         f.logger.error(f"complete_combined_diagnosis_with_rf: {e}")
         await context.bot.send_message(chat_id=user_id, text="❌ Error al completar el diagnóstico.")
-        f.delete_user_files(user_id=user_id) 
+        await asyncio.to_thread(f.delete_user_files, user_id=user_id)
 
 
 # -------------------- MENSAJES DE TEXTO --------------------
@@ -532,8 +779,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = update.message.text
 
     # usuario y términos
-    if not db.check_user_exists_db(uid): db.create_user_db(uid, uname, False, None, False, None)
-    user_data = db.load_user_data_db(uid) or {"agreement_state": False}
+    if not await asyncio.to_thread(db.check_user_exists_db, uid):
+        await asyncio.to_thread(db.create_user_db, uid, uname, False, None, False, None)
+    user_data = await asyncio.to_thread(db.load_user_data_db, uid) or {"agreement_state": False}
     if not user_data.get("agreement_state", False):
         kb = [[InlineKeyboardButton("✅ Acepto", callback_data=f"acepto:{uid}")],
               [InlineKeyboardButton("❌ No Acepto", callback_data=f"no_acepto:{uid}")]]
@@ -563,14 +811,35 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # primer mensaje del día: saludar y pedir imagen
-    last_seen = context.bot_data.setdefault('last_seen_date',{}).get(uid)
+    last_seen = get_sessions(context.bot_data).last_seen
     today = datetime.now().date()
-    if last_seen != today:
-        context.bot_data['last_seen_date'][uid] = today
+    if last_seen.get(uid) != today:
+        last_seen.put(uid, today)
         await update.message.reply_text("👋 ¡Hola! Envíame una **foto de tu lechuga** para revisarla. 📷")
     else:
         await update.message.reply_text("📷 Envíame una **foto de tu lechuga** para analizarla.")
 
+def _shadow_rf_probs(responses: dict, candidate) -> dict:
+    out = rf_predict_from_pipeline(candidate.model, candidate.features, responses)
+    if out.get("error"):
+        raise RuntimeError(out.get("message"))
+    return out["probabilidades"]
+
+# -------------------- ADMIN --------------------
+async def reload_models_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/reload_models [cnn|rf]: recarga y publica los modelos sin reiniciar (solo ADMIN_USER_IDS)."""
+    uid = update.effective_user.id
+    if uid not in ADMIN_USER_IDS:
+        f.logger.warning(f"[MODELS] /reload_models rechazado para {uid}")
+        return
+    kinds = [a.lower() for a in (context.args or []) if a.lower() in MODELS.kinds] or None
+    await update.message.reply_text("🔄 Cargando y calentando modelos; las solicitudes en curso terminan con la versión actual...")
+    results = await asyncio.to_thread(MODELS.reload, kinds, True)
+    lines = [f"• {k}: {v}" for k, v in results.items()]
+    lines.append("")
+    lines += [f"Activo {k}: {v}" for k, v in MODELS.versions().items()]
+    await update.message.reply_text("\n".join(lines))
+
 # -------------------- INIT ML --------------------
 def initialize_bot_with_ml():
     try:
@@ -584,25 +853,109 @@ def initialize_bot_with_ml():
             pipe = res[0]; feats = res[1] if len(res)>1 else None
             return pipe, None, feats
     except Exception as e:
-        print(f"Error inicializando RF: {e}")
+        f.logger.error(f"Error inicializando RF: {e}")
         return None, None, None
 
+def _timed_step(timings: dict, name: str, fn, *args):
+    t0 = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        timings[name] = time.perf_counter() - t0
+
+
+def initialize_runtime():
+    """
+    Arranque en paralelo: comprobación de BD, entrenamiento del RF y limpieza de temporales
+    no dependen entre sí. El logging ya quedó configurado al importar el módulo y los
+    directorios se crean antes porque los demás pasos escriben en data/.
+    Devuelve (bd_ok, (modelo, scaler, features), tiempos en segundos por paso).
+    """
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    _timed_step(timings, "directories", f.setup_directories)
+    with ThreadPoolExecutor(max_workers=STARTUP_WORKERS, thread_name_prefix="startup") as pool:
+        db_ok = pool.submit(_timed_step, timings, "db_check", db.test_db_connection)
+        ml = pool.submit(_timed_step, timings, "rf_init", initialize_bot_with_ml)
+        cleaned = pool.submit(_timed_step, timings, "cleanup", f.cleanup_old_files, 5)
+        db_ok, ml, cleaned = db_ok.result(), ml.result(), cleaned.result()
+    timings["total"] = time.perf_counter() - t0
+    f.logger.info(f"Archivos eliminados: {cleaned}")
+    f.logger.info("⏱️ Arranque: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()),
+                  extra={"startup": {k: round(v, 4) for k, v in timings.items()}})
+    return db_ok, ml, timings
+
+# -------------------- MÉTRICAS --------------------
+def register_runtime_metrics(processor: PerChatUpdateProcessor, sessions) -> None:
+    """Gauges leídos en cada scrape de /metrics (sin coste entre scrapes)."""
+    REGISTRY.callback("pacho_diagnoses_in_progress", "Diagnósticos abiertos por fase",
+                      lambda: {"photos": len(sessions.image_window), "survey": len(sessions.survey)},
+                      ("phase",))
+    REGISTRY.callback("pacho_cpu_effective", "CPUs efectivas del contenedor (cuota cgroup o afinidad)",
+                      lambda: RESOURCES.cpus)
+    REGISTRY.callback("pacho_expensive_stages_in_flight", "Etapas costosas en ejecución (descarga/CNN/PDF)",
+                      lambda: ADMISSION.in_flight)
+    REGISTRY.callback("pacho_expensive_stages_capacity", "Tope global de etapas costosas",
+                      lambda: ADMISSION.max_concurrent)
+    REGISTRY.callback("pacho_admitted_total", "Solicitudes de diagnóstico admitidas",
+                      lambda: ADMISSION.admitted, kind="counter")
+    REGISTRY.callback("pacho_shed_total", "Solicitudes rechazadas por admisión",
+                      lambda: dict(ADMISSION.shed), ("reason",), kind="counter")
+    REGISTRY.callback("pacho_updates_in_flight", "Updates de Telegram aceptados (en ejecución + en cola)",
+                      lambda: processor.current_concurrent_updates)
+    REGISTRY.callback("pacho_update_chats_active", "Chats con updates en ejecución o en cola",
+                      lambda: processor.active_chats)
+    REGISTRY.callback("pacho_session_entries", "Entradas en cada contenedor de sesión",
+                      lambda: {s.name: len(s) for s in sessions.all()}, ("store",))
+    REGISTRY.callback("pacho_session_bytes", "Memoria aproximada (bytes) de cada contenedor de sesión",
+                      lambda: {s.name: s.approx_bytes() for s in sessions.all()}, ("store",))
+    REGISTRY.callback("pacho_session_evicted_total", "Sesiones expulsadas por TTL o tamaño",
+                      lambda: {s.name: s.evicted for s in sessions.all()}, ("store",), kind="counter")
+    REGISTRY.callback("pacho_artifacts_tracked", "Archivos temporales pendientes de borrar",
+                      lambda: len(ARTIFACTS))
+    REGISTRY.callback("pacho_artifacts_reclaimed_files_total", "Archivos temporales borrados",
+                      lambda: ARTIFACTS.reclaimed_files, kind="counter")
+    REGISTRY.callback("pacho_artifacts_reclaimed_bytes_total", "Bytes liberados al borrar temporales",
+                      lambda: ARTIFACTS.reclaimed_bytes, kind="counter")
+
+
 # -------------------- MAIN --------------------
+async def _install_executors(application: Application) -> None:
+    RESOURCES.install_executor(asyncio.get_running_loop())
+
+
 def main():
-    print("🤖 Iniciando bot...")
-    if not db.test_db_connection():
-        print("❌ No se puede conectar a la base de datos"); return
-    modelo_rf, scaler_rf, feature_columns = initialize_bot_with_ml()
-    f.setup_directories(); f.setup_logging(); 
-    print("Archivos eliminados: ",f.cleanup_old_files(minutes_old=5))
+    f.logger.info("🤖 Iniciando bot...")
+    RESOURCES.log()
+    db_ok, (modelo_rf, scaler_rf, feature_columns), _ = initialize_runtime()
+    if not db_ok:
+        f.logger.error("❌ No se puede conectar a la base de datos"); return
+    if CNN_PRELOAD:
+        f.preload_cnn_model()
 
     token,_,_,_ = f.load_values()
-    application = Application.builder().token(token).build()
-    application.bot_data['ml_model'] = modelo_rf
-    application.bot_data['ml_scaler'] = scaler_rf
-    application.bot_data['ml_features'] = feature_columns
-    application.bot_data['ml_available'] = modelo_rf is not None
+    processor = PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES)
+    application = (Application.builder().token(token).concurrent_updates(processor)
+                   .post_init(_install_executors).build())
+    if modelo_rf is not None:
+        MODELS.install("rf", modelo_rf, pr.rf_model_default, feature_columns)
+        if adaptive_survey.SURVEY_MODE == "adaptive":   # tablas listas antes de la primera encuesta
+            threading.Thread(target=_survey_planner, name="survey-planner", daemon=True).start()
+    register_runtime_metrics(processor, get_sessions(application.bot_data))
+    start_metrics_server()
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(sweep_sessions_job, interval=SESSION_SWEEP_SECONDS,
+                                            first=SESSION_SWEEP_SECONDS, name="sweep_sessions")
+        application.job_queue.run_repeating(janitor_job, interval=JANITOR_INTERVAL_SECONDS,
+                                            first=JANITOR_INTERVAL_SECONDS, name="janitor")
+        if MODEL_WATCH_SECONDS > 0:
+            application.job_queue.run_repeating(watch_models_job, interval=MODEL_WATCH_SECONDS,
+                                                first=MODEL_WATCH_SECONDS, name="watch_models")
+    else:
+        f.logger.warning("[BOT] JobQueue no disponible (instala python-telegram-bot[job-queue]); "
+                         "las sesiones y archivos temporales solo se limpian por usuario.")
 
+    application.add_handler(CommandHandler("reload_models", reload_models_command))
     application.add_handler(CallbackQueryHandler(handle_terms_callback, pattern="^(acepto:|no_acepto:)"))
     
     application.add_handler(CallbackQueryHandler(handle_simple_answer_callback, pattern="^simple_answer:"))
@@ -610,6 +963,27 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.PHOTO, handle_image))
 
+    run_application(application)
+
+def run_application(application):
+    """Arranca el bot en modo webhook (servidor HTTP local) o polling según BOT_MODE."""
+    if BOT_MODE == "webhook":
+        webhook_url = os.getenv("WEBHOOK_URL", "").strip()
+        if webhook_url:
+            url_path = os.getenv("WEBHOOK_PATH", "telegram").strip().strip("/")
+            f.logger.warning(f"[BOT] Modo webhook en {os.getenv('WEBHOOK_LISTEN', '0.0.0.0')}:"
+                             f"{os.getenv('WEBHOOK_PORT', '9000')}/{url_path} "
+                             f"(concurrencia={MAX_CONCURRENT_UPDATES})")
+            application.run_webhook(
+                listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+                port=int(os.getenv("WEBHOOK_PORT", "9000")),
+                url_path=url_path,
+                webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+                secret_token=os.getenv("WEBHOOK_SECRET") or None,
+                drop_pending_updates=True,
+            )
+            return
+        f.logger.error("[BOT] BOT_MODE=webhook sin WEBHOOK_URL; se usa polling.")
     application.run_polling(drop_pending_updates=True)
 
 if __name__ == "__main__":
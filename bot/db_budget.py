@@ -0,0 +1,208 @@
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto de ida y vuelta a la BD por update (o por tarea en segundo plano). Medido con
+# benchmarks/loadsim.py: la tarea de la foto hace 3 consultas en 2 conexiones y una respuesta
+# de la encuesta adaptativa 4 en 2; la encuesta completa (6 en 4, cada pregunta y el total se
+# leen dos veces) es justo el patrón N+1 que debe avisar.
+DB_BUDGET_QUERIES = int(os.getenv("DB_BUDGET_QUERIES", "4"))
+DB_BUDGET_CONNECTIONS = int(os.getenv("DB_BUDGET_CONNECTIONS", "2"))
+DB_BUDGET_ROWS = int(os.getenv("DB_BUDGET_ROWS", "500"))
+DB_BUDGET_MS = float(os.getenv("DB_BUDGET_MS", "500"))
+# En tests: excederse lanza DbBudgetExceeded en lugar de solo avisar
+DB_BUDGET_STRICT = os.getenv("DB_BUDGET_STRICT", "0").strip().lower() in ("1", "true", "yes")
+
+DB_QUERIES = REGISTRY.counter("pacho_db_queries_total", "Consultas SQL ejecutadas", ("scope",))
+DB_CONNECTIONS = REGISTRY.counter("pacho_db_connections_total", "Conexiones a la BD abiertas", ("scope",))
+DB_OVER_BUDGET = REGISTRY.counter("pacho_db_budget_exceeded_total",
+                                  "Updates/tareas que superaron el presupuesto de BD", ("scope",))
+
+
+class DbBudgetExceeded(RuntimeError):
+    """Un update superó el presupuesto de BD (solo con DB_BUDGET_STRICT)."""
+
+    def __init__(self, stats: "DbStats", over: list[str]):
+        super().__init__(f"{stats.scope}: presupuesto de BD superado ({', '.join(over)})")
+        self.stats = stats
+        self.over = over
+
+
+class DbStats:
+    """Acumulador de un update: consultas, conexiones, filas y tiempo en la BD."""
+
+    __slots__ = ("scope", "labels", "queries", "connections", "rows", "seconds", "statements")
+
+    def __init__(self, scope: str, **labels):
+        self.scope = scope
+        self.labels = labels
+        self.queries = 0
+        self.connections = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def over_budget(self) -> list[str]:
+        over = []
+        if self.queries > DB_BUDGET_QUERIES:
+            over.append(f"consultas {self.queries}>{DB_BUDGET_QUERIES}")
+        if self.connections > DB_BUDGET_CONNECTIONS:
+            over.append(f"conexiones {self.connections}>{DB_BUDGET_CONNECTIONS}")
+        if self.rows > DB_BUDGET_ROWS:
+            over.append(f"filas {self.rows}>{DB_BUDGET_ROWS}")
+        if self.seconds * 1000 > DB_BUDGET_MS:
+            over.append(f"tiempo {self.seconds * 1000:.0f}ms>{DB_BUDGET_MS:.0f}ms")
+        return over
+
+    def repeated(self) -> dict[str, int]:
+        """Sentencias ejecutadas más de una vez: candidatas a N+1 o a caché."""
+        return {sql: n for sql, n in self.statements.items() if n > 1}
+
+    def summary(self) -> dict:
+        return {"db_scope": self.scope, "db_queries": self.queries, "db_connections": self.connections,
+                "db_rows": self.rows, "db_ms": round(self.seconds * 1000, 2), **self.labels}
+
+
+_CURRENT: contextvars.ContextVar[Optional[DbStats]] = contextvars.ContextVar("pacho_db_stats", default=None)
+
+
+def current_stats() -> Optional[DbStats]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def track(scope: str, **labels):
+    """
+    Abre un acumulador para el bloque (un update, la tarea diferida de la foto...).
+    Al salir registra el resumen y comprueba el presupuesto. `asyncio.to_thread`
+    copia el contexto, así que las consultas hechas en hilos cuentan igual.
+    """
+    stats = DbStats(scope, **labels)
+    token = _CURRENT.set(stats)
+    try:
+        yield stats
+    finally:
+        _CURRENT.reset(token)
+        _finish(stats)
+
+
+def _finish(stats: DbStats) -> None:
+    if not stats.queries and not stats.connections:
+        return
+    DB_QUERIES.inc(stats.queries, scope=stats.scope)
+    DB_CONNECTIONS.inc(stats.connections, scope=stats.scope)
+    summary = stats.summary()
+    over = stats.over_budget()
+    if not over:
+        logger.info(f"[DB] {stats.scope}: {stats.queries} consultas, {stats.connections} conexiones, "
+                   f"{stats.rows} filas, {stats.seconds * 1000:.1f} ms", extra=summary)
+        return
+    DB_OVER_BUDGET.inc(scope=stats.scope)
+    logger.warning(f"[DB] {stats.scope} superó el presupuesto ({', '.join(over)}); "
+                   f"repetidas={stats.repeated()}", extra=summary)
+    if DB_BUDGET_STRICT:
+        raise DbBudgetExceeded(stats, over)
+
+
+# =======================
+# Proxies de conexión y cursor (interfaz de pyodbc)
+# =======================
+
+_WS = re.compile(r"\s+")
+
+
+def _statement_key(sql: str) -> str:
+    return _WS.sub(" ", sql).strip()[:120]
+
+
+class InstrumentedCursor:
+    __slots__ = ("_cur", "_stats")
+
+    def __init__(self, cur: Any, stats: Optional[DbStats]):
+        self._cur = cur
+        self._stats = stats
+
+    def execute(self, sql: str, *params):
+        stats = self._stats
+        if stats is None:
+            self._cur.execute(sql, *params)
+            return self
+        t0 = time.perf_counter()
+        try:
+            self._cur.execute(sql, *params)
+        finally:
+            stats.seconds += time.perf_counter() - t0
+            stats.queries += 1
+            stats.statements[_statement_key(sql)] += 1
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cur.fetchone)
+        if row is not None and self._stats is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchall(self):
+        rows = self._timed(self._cur.fetchall)
+        if self._stats is not None:
+            self._stats.rows += len(rows)
+        return rows
+
+    def _timed(self, fn: Callable):
+        if self._stats is None:
+            return fn()
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self._stats.seconds += time.perf_counter() - t0
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+
+class InstrumentedConnection:
+    __slots__ = ("_conn", "_stats")
+
+    def __init__(self, conn: Any, stats: Optional[DbStats]):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self) -> InstrumentedCursor:
+        return InstrumentedCursor(self._conn.cursor(), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+def instrument_connect(open_fn: Callable[[], Any]) -> InstrumentedConnection:
+    """Abre una conexión con `open_fn` y la envuelve para contar en el acumulador activo."""
+    stats = _CURRENT.get()
+    if stats is None:
+        return InstrumentedConnection(open_fn(), None)
+    t0 = time.perf_counter()
+    try:
+        conn = open_fn()
+    finally:
+        stats.seconds += time.perf_counter() - t0
+    stats.connections += 1
+    return InstrumentedConnection(conn, stats)
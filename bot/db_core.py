@@ -9,6 +9,8 @@ import pyodbc
 from datetime import datetime
 from dotenv import load_dotenv
 
+from db_budget import InstrumentedConnection, instrument_connect
+
 logger = logging.getLogger(__name__)
 load_dotenv()
 # DRIVER = os.getenv("DB_DRIVER")
@@ -73,25 +75,28 @@ def build_conn_str() -> str:
 
     return conn_str
 
-def connect_to_db() -> pyodbc.Connection:
+def _open_raw_connection() -> pyodbc.Connection:
     cs = build_conn_str()
     # log para depuración (oculta la contraseña si está)
     pwd = _g("DB_PASSWORD")
     safe_cs = cs.replace(pwd, "*****") if pwd else cs
-    print("🔧 Cadena de conexión:", safe_cs)
+    logger.debug(f"🔧 Cadena de conexión: {safe_cs}", extra={"sample": True})
     return pyodbc.connect(cs, timeout=5)
 
+def connect_to_db() -> InstrumentedConnection:
+    """Conexión pyodbc envuelta para contar consultas, filas y tiempo del update en curso."""
+    return instrument_connect(_open_raw_connection)
+
 def test_db_connection() -> bool:
     try:
         with connect_to_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT DB_NAME()")
             row = cur.fetchone()
-            print("✅ Conectado a BD:", row[0] if row else "(desconocida)")
+            logger.info(f"✅ Conectado a BD: {row[0] if row else '(desconocida)'}")
         return True
     except Exception as e:
-        print("❌ No se puede conectar a la base de datos:", e)
-        logger.exception("DB connection failed")
+        logger.exception(f"❌ No se puede conectar a la base de datos: {e}")
         return False
 
 def normalize_disease_name(enf: str) -> str:
@@ -151,7 +156,8 @@ def load_user_data_db(user_id):
         
         cursor.execute(sql, (user_id,))
         row = cursor.fetchone()
-        print(f"🔍 Datos cargados para usuario {user_id}: {row}")
+        logger.debug(f"🔍 Datos cargados para usuario {user_id}: {'encontrado' if row else 'no existe'}",
+                     extra={"sample": True})
         if row:
             # ✅ CONVERTIR AgreementStatus de STRING a BOOLEAN
             AgreementStatus_str = row[4]
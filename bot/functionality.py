@@ -1,34 +1,29 @@
 import os
 from dotenv import load_dotenv
-import requests
 import json
 from datetime import date, datetime
 import warnings
-import numpy as np
 import base64
-import requests
 import logging
-import glob
-import tensorflow as tf
-from keras.preprocessing import image
+import threading
 import time
-from keras.applications.mobilenet import preprocess_input as _pp
-import traceback
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, KeepInFrame,
-    Image as RLImage
-)
-from reportlab.lib.units import mm
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm    
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfgen import canvas as _canvas
+from typing import Any, Optional
 from datetime import datetime as _dt
-import os
+# TensorFlow/Keras, ReportLab, requests y numpy se importan dentro de las funciones que
+# los usan: importar este módulo (y arrancar el bot) no paga varios segundos de TF.
+from janitor import ARTIFACTS
+from model_registry import MODELS, LoadFailed, ModelVersion, has_baked_preprocess
+from structured_logging import setup_structured_logging
+from metrics import REGISTRY, timed
+import tracing
+
+# Endpoint de Gemini (se puede apuntar a un stub local para pruebas de carga)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+
+def _gemini_url(api_key: str) -> str:
+    return f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent?key={api_key}"
 
 
 def detect_lettuce(ruta_imagen):
@@ -64,7 +59,9 @@ def detect_lettuce(ruta_imagen):
             ]
         }
 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={API_KEY_LLM}"
+        import requests
+
+        url = _gemini_url(API_KEY_LLM)
         headers = {"Content-Type": "application/json"}
         
         response = requests.post(url, headers=headers, data=json.dumps(payload))
@@ -73,17 +70,23 @@ def detect_lettuce(ruta_imagen):
                 respuesta = result["candidates"][0]["content"]["parts"][0]["text"]
                 return respuesta.strip()
         else:
-                print(f"[ERROR detectlettuce] HTTP {response.status_code}: {response.text}")
+                logger.error(f"[detectlettuce] HTTP {response.status_code}: {response.text}")
                 return f"Parece que tenemos un fallo técnico. Intenta de nuevo más tarde 😥."
     except Exception as e:
-        print("[ERROR detectlettuce]", str(e))
-        traceback.print_exc()
+        logger.exception(f"[detectlettuce] {e}")
         return f"Parece que tenemos un fallo técnico. Intenta de nuevo más tarde 😥."
 # ================================================================================================
 logger = logging.getLogger(__name__)
-_CNN_MODEL = None
 _CNN_IMG_SIZE = 224
 _CNN_CLASSES = ["Botrytis", "Xanthomonas", "Sana"]   # etiquetas unificadas
+# Normalización para modelos sin capa "preprocess": "mobilenet" ([-1, 1]) o "unit" ([0, 1], la de TrainCNN.py)
+CNN_LEGACY_PREPROCESS = os.getenv("CNN_LEGACY_PREPROCESS", "mobilenet").strip().lower()
+# Cascada: con CNN_CASCADE_FAST_MODEL_PATH configurado responde primero el modelo rápido y solo
+# las imágenes con probabilidad top por debajo del umbral pasan al completo (calibrate_cascade.py)
+CNN_CASCADE_THRESHOLD = float(os.getenv("CNN_CASCADE_THRESHOLD", "0.9"))
+
+CASCADE_IMAGES = REGISTRY.counter("pacho_cnn_cascade_images_total",
+                                  "Imágenes clasificadas por cada etapa de la cascada", ("stage",))
 
 
 
@@ -94,26 +97,62 @@ def _resolve_model_path():
     return model_path
 
 
-def _load_cnn_model():
-    """Carga el modelo una sola vez y lo cachea."""
-    global _CNN_MODEL
-    if _CNN_MODEL is not None:
-        return _CNN_MODEL
+def _load_cnn_model() -> ModelVersion:
+    """Versión activa de la CNN en el registro de modelos (la carga la primera vez)."""
+    tracing.set_attribute("cnn.model_cache_hit", MODELS.current("cnn") is not None)
     try:
-        import tensorflow as tf
-        model_path = _resolve_model_path()
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Modelo .keras no encontrado en: {model_path}")
-        _CNN_MODEL = tf.keras.models.load_model(model_path)
-        logger.info(f"[CNN] Modelo cargado: {model_path}")
-        return _CNN_MODEL
+        _resolve_model_path()
+        return MODELS.get("cnn")
     except Exception as e:
         logger.exception(f"[CNN] Error cargando modelo: {e}")
         raise
 
-def _get_preprocess():
+
+def _load_fast_model() -> Optional[ModelVersion]:
+    """Modelo rápido de la cascada, o None si no está configurado o no carga."""
+    if not MODELS.source("cnn_fast"):
+        return None
     try:
-        
+        return MODELS.get("cnn_fast")
+    except LoadFailed:
+        return None   # ya avisado en la carga fallida; se reintenta si cambia el archivo o con /reload_models
+    except Exception as e:
+        logger.warning(f"[CNN] Modelo rápido no disponible; se usa solo el completo: {e}")
+        return None
+
+
+def preload_cnn_model() -> threading.Thread:
+    """
+    Importa TensorFlow y carga la CNN en un hilo daemon: el bot empieza a atender
+    updates sin esperar a TF y la primera foto ya encuentra el modelo en memoria.
+    """
+    def _run():
+        t0 = time.perf_counter()
+        try:
+            _load_cnn_model()
+            _load_fast_model()
+            logger.info(f"[CNN] Precarga completa en {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            logger.warning(f"[CNN] Precarga fallida; se reintentará con la primera foto: {e}")
+
+    th = threading.Thread(target=_run, name="cnn-preload", daemon=True)
+    th.start()
+    return th
+
+def _get_preprocess(model=None):
+    """
+    Función que prepara un lote uint8 (N, H, W, 3) para `model`. Si el modelo trae la
+    capa "preprocess" el lote pasa sin copiarse; si no, se normaliza aquí según
+    CNN_LEGACY_PREPROCESS.
+    """
+    import numpy as np
+
+    if model is not None and has_baked_preprocess(model):
+        return np.asarray
+    if CNN_LEGACY_PREPROCESS == "unit":
+        return lambda x: np.asarray(x, dtype=np.float32) / 255.0
+    try:
+        from keras.applications.mobilenet import preprocess_input as _pp
         return _pp
     except Exception:
         try:
@@ -122,67 +161,167 @@ def _get_preprocess():
         except Exception:
             # Fallback: escalado [-1, 1] (equivalente a MobileNetV2)
             def _pp(x):
-                import numpy as np
-                return (x / 127.5) - 1.0
+                return (np.asarray(x, dtype=np.float32) / 127.5) - 1.0
             logger.warning("[CNN] Usando fallback de preprocess_input (no se pudo importar desde TF/Keras).")
             return _pp
 
 
+def _load_image_array(image_path: str, size: int = _CNN_IMG_SIZE):
+    """Abre una imagen, corrige orientación EXIF y la redimensiona a la entrada de la CNN."""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    img = Image.open(image_path).convert("RGB")
+    img = ImageOps.exif_transpose(img)  # corrige orientación
+    img = img.resize((size, size))
+    return np.asarray(img, dtype=np.uint8)    # (H, W, 3); la normalización la hace el modelo
+
+
+def _predict_probs(batch, model=None):
+    """Inferencia de la CNN sobre un lote (N, H, W, 3). Devuelve probabilidades (N, C)."""
+    import numpy as np
+
+    model = model if model is not None else _load_cnn_model().model
+    arr = _get_preprocess(model)(batch)
+    preds = np.asarray(model.predict(arr, verbose=0), dtype=np.float64)
+    return _as_probs(preds.reshape(len(arr), -1))
+
+
+def _as_probs(preds):
+    """
+    Los modelos de TrainCNN ya terminan en softmax: aplicarlo otra vez aplana las
+    probabilidades hacia 1/C. Solo se normaliza si la salida son logits.
+    """
+    import numpy as np
+
+    if (preds >= 0).all() and np.allclose(preds.sum(axis=-1), 1.0, atol=1e-3):
+        return preds
+    exp = np.exp(preds - preds.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+_STAGE_TEXT = {
+    "fast": "⚡ Respondió el modelo rápido",
+    "full": "🔎 Respondió el modelo completo",
+    "mixed": "🔎 Modelo rápido + completo ({escalated} de {n} imágenes revisadas por el completo)",
+}
+
+
+def _format_cnn_message(probs, n_images: int = 1, stage: Optional[str] = None, escalated: int = 0) -> str:
+    """Arma el texto de resultado a partir de un vector de probabilidades."""
+    import numpy as np
+
+    probs = [float(p) for p in probs]
+    n = min(len(probs), len(_CNN_CLASSES))
+    classes = _CNN_CLASSES[:n]
+    probs = probs[:n]
+    top_idx = int(np.argmax(probs))
+    top_cls = classes[top_idx] if 0 <= top_idx < len(classes) else "Desconocida"
+
+    lines = []
+    lines.append("🔬 **Resultado del análisis (CNN)**")
+    lines.append(f"Detección realizada: **{top_cls}**")
+    if n_images > 1:
+        lines.append(f"Imágenes analizadas: {n_images}")
+    if stage in _STAGE_TEXT:
+        lines.append(_STAGE_TEXT[stage].format(escalated=escalated, n=n_images))
+    lines.append("")
+    for i, cls in enumerate(classes):
+        pct = probs[i] * 100.0
+        prefix = "✅" if i == top_idx else "•"
+        lines.append(f"{prefix} {cls}: {pct:.1f}%")
+
+    logger.debug(f"[CNN] top={top_cls} n={n_images} probs={dict(zip(classes, probs))}", extra={"sample": True})
+    return "\n".join(lines)
+
+
 def classify_image(image_path: str) -> str:
     """
     Clasifica una imagen con MobileNetV2 y devuelve TEXTO con el formato esperado:
       'Detección realizada: **<CLASE_TOP>**' + líneas con porcentajes.
     """
-    try:
-        import numpy as np
-        from PIL import Image, ImageOps
-        import tensorflow as tf
+    return classify_images([image_path])
 
-        # 1) Cargar modelo y preprocess
-        model = _load_cnn_model()
-        preprocess_input = _get_preprocess()
 
-        # 2) Cargar/normalizar imagen
-        if not os.path.exists(image_path):
-            return f"❌ Error al procesar la imagen (CNN): ruta inexistente {image_path}"
-        
-        img = Image.open(image_path).convert("RGB")
-        img = ImageOps.exif_transpose(img)  # corrige orientación
-        img = img.resize((_CNN_IMG_SIZE, _CNN_IMG_SIZE))
-        arr = np.array(img, dtype=np.float32)
-        arr = np.expand_dims(arr, 0)              # (1, H, W, 3)
-        arr = preprocess_input(arr)               # [-1,1] para MobileNetV2
-
-        # 3) Inferencia y softmax
-        preds = model.predict(arr)
-        preds = np.squeeze(preds)
-        if preds.ndim == 0:
-            preds = np.array([float(preds)])
-        probs = tf.nn.softmax(preds).numpy().tolist()
-
-        # 4) Mapear a etiquetas y armar salida
-        n = min(len(probs), len(_CNN_CLASSES))
-        classes = _CNN_CLASSES[:n]
-        probs = probs[:n]
-        top_idx = int(np.argmax(probs))
-        top_cls = classes[top_idx] if 0 <= top_idx < len(classes) else "Desconocida"
-
-        lines = []
-        lines.append("🔬 **Resultado del análisis (CNN)**")
-        lines.append(f"Detección realizada: **{top_cls}**")
-        lines.append("")
-        for i, cls in enumerate(classes):
-            pct = probs[i] * 100.0
-            prefix = "✅" if i == top_idx else "•"
-            lines.append(f"{prefix} {cls}: {pct:.1f}%")
-
-        msg = "\n".join(lines)
-        logger.debug(f"[CNN] top={top_cls} probs={dict(zip(classes, probs))}")
-        return msg
+def classify_images(image_paths: list[str], cnn: Optional[ModelVersion] = None,
+                    fast: Optional[ModelVersion] = None) -> str:
+    """
+    Clasifica varias imágenes de la misma planta (p. ej. un álbum de Telegram) en un
+    único forward pass y devuelve el diagnóstico de ensamble (promedio de probabilidades)
+    con el mismo formato de texto que `classify_image`. `cnn` y `fast` fijan las versiones
+    de los modelos (si se recargan a mitad del diagnóstico, este termina con las que empezó).
+    """
+    return classify_images_staged(image_paths, cnn, fast)[0]
+
+
+def classify_images_staged(image_paths: list[str], cnn: Optional[ModelVersion] = None,
+                           fast: Optional[ModelVersion] = None) -> tuple[str, Optional[str], Any]:
+    """
+    Como `classify_images`, y además la etapa que respondió: "fast", "full", "mixed"
+    (parte del álbum pasó al modelo completo), "single" (sin cascada) o None si hubo error,
+    y el lote uint8 ya decodificado (None si hubo error) para reutilizarlo, p. ej. en modo sombra.
+    """
+    try:
+        if not image_paths:
+            return "❌ Error al procesar la imagen (CNN): no hay imágenes", None, None
+        for path in image_paths:
+            if not os.path.exists(path):
+                return f"❌ Error al procesar la imagen (CNN): ruta inexistente {path}", None, None
+
+        fast = fast or _load_fast_model()
+        batch = load_image_batch(image_paths)
+        probs, stage, escalated = _cascade_probs(batch, cnn, fast)
+        return _format_cnn_message(probs, len(image_paths), stage, escalated), stage, batch
 
     except Exception as e:
         logger.exception(f"classify_image error: {e}")
-        return f"❌ Error al procesar la imagen (CNN): {e}"
+        return f"❌ Error al procesar la imagen (CNN): {e}", None, None
+
+
+def _cascade_probs(batch, cnn: Optional[ModelVersion], fast: Optional[ModelVersion]):
+    """
+    Probabilidades de ensamble, etapa e imágenes escaladas del lote (N, H, W, 3). Con modelo
+    rápido, cada imagen cuya probabilidad top quede bajo CNN_CASCADE_THRESHOLD se vuelve a
+    clasificar con el completo (que solo se carga si hace falta).
+    """
+    if fast is None:
+        cnn = cnn or _load_cnn_model()
+        tracing.set_attribute("model.version", cnn.version)
+        tracing.set_attribute("cnn.stage", "single")
+        return _predict_probs(batch, cnn.model).mean(axis=0), "single", 0
+
+    probs = _predict_probs(batch, fast.model)
+    unsure = probs.max(axis=1) < CNN_CASCADE_THRESHOLD
+    escalated = int(unsure.sum())
+    versions = [fast.version]
+    if escalated:
+        cnn = cnn or _load_cnn_model()
+        probs[unsure] = _predict_probs(batch[unsure], cnn.model)
+        versions.append(cnn.version)
+    stage = "fast" if not escalated else "full" if escalated == len(batch) else "mixed"
+    CASCADE_IMAGES.inc(len(batch) - escalated, stage="fast")
+    if escalated:
+        CASCADE_IMAGES.inc(escalated, stage="full")
+    tracing.set_attribute("model.version", "+".join(versions))
+    tracing.set_attribute("cnn.stage", stage)
+    tracing.set_attribute("cnn.escalated", escalated)
+    return probs.mean(axis=0), stage, escalated
+
+
+def load_image_batch(image_paths: list[str]):
+    """Lote uint8 (N, H, W, 3) de las imágenes, decodificadas como para la CNN."""
+    import numpy as np
+
+    return np.stack([_load_image_array(p) for p in image_paths])
+
+
+def predict_class_probs(batch, cnn: ModelVersion) -> dict[str, float]:
+    """
+    Probabilidades de ensamble {clase: prob} sin formatear (comparaciones en modo sombra).
+    Recibe el lote ya decodificado: los archivos de subida se sobrescriben con la siguiente foto.
+    """
+    probs = _predict_probs(batch, cnn.model).mean(axis=0)
+    return {cls: float(p) for cls, p in zip(_CNN_CLASSES, probs)}
 
 #===================================================================================================
 def simplify_disease_name(x: str) -> str:
@@ -200,7 +339,7 @@ def get_example_image_for_disease(label: str) -> str | None:
     Devuelve la ruta a una imagen de ejemplo para la enfermedad detectada por la CNN.
     Las imágenes deben estar en la ruta configurada en EXAMPLE_IMAGES_PATH.
     """
-    print(f"📁 Ruta base de imágenes de ejemplo: {base}")
+    logger.debug(f"📁 Ruta base de imágenes de ejemplo: {base}")
     if not base:
         # Si la variable de entorno no está definida, usar una ruta por defecto o devolver None
         return None
@@ -222,9 +361,6 @@ def get_example_image_for_disease(label: str) -> str | None:
 def pct_str(p):
     return f"{p*100:.1f}%" if isinstance(p, (int, float)) and p <= 1.0001 else str(p)
 
-from reportlab.lib.utils import ImageReader
-
-
 def build_pacho_pdf_report(
     outfile,
     meta,
@@ -234,6 +370,16 @@ def build_pacho_pdf_report(
     logo_path=None,
     treatment_title: str = "Tratamiento recomendado"
 ):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas as _canvas
+    from reportlab.platypus import (
+        SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, KeepInFrame,
+        Image as RLImage
+    )
+
     images_base = os.getenv("REPORT_IMAGES_PATH") or ""
     candidate = os.path.join(images_base, "logo_pacho.png")
     logo_path = candidate if os.path.exists(candidate) else None
@@ -344,7 +490,8 @@ def build_pacho_pdf_report(
         # usa tu función global si existe
         if "format_treatments_with_ai_or_fallback" in globals():
             try:
-                return globals()["format_treatments_with_ai_or_fallback"](trat)
+                with timed("llm_format"), tracing.span("llm_format", treatments=len(trat or [])):
+                    return globals()["format_treatments_with_ai_or_fallback"](trat)
             except Exception:
                 pass
         # fallback sencillo
@@ -526,42 +673,37 @@ def setup_directories():
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
     
-    print("✅ Directorios creados correctamente")
+    logger.info("✅ Directorios creados correctamente")
 
 #===================================================================================================
-def setup_logging(level=logging.WARNING):
-    """Configura el sistema de logging para reducir prints innecesarios"""
+def setup_logging(level=None):
+    """
+    Configura el logging no bloqueante (cola + hilo escritor, JSON en archivos rotativos).
+    Nivel por defecto desde LOG_LEVEL; niveles por módulo desde LOG_LEVELS.
+    """
+    if level is None:
+        level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").strip().upper())
+        if not isinstance(level, int):
+            level = logging.INFO
     try:
-        # ✅ CREAR DIRECTORIOS PRIMERO
-        log_dir = os.path.join("data", "logs")
-        os.makedirs(log_dir, exist_ok=True)
-        
-        log_file = os.path.join(log_dir, "bot.log")
-        
-        logging.basicConfig(
-            level=level,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()  # También mostrar en consola
-            ]
-        )
-        
+        log_file = setup_structured_logging(level=level)
+
         # Silenciar logs de bibliotecas externas
         logging.getLogger('tensorflow').setLevel(logging.ERROR)
         logging.getLogger('whisper').setLevel(logging.ERROR)
         logging.getLogger('pydub').setLevel(logging.ERROR)
+        logging.getLogger('httpx').setLevel(logging.WARNING)   # una línea por cada getUpdates
         warnings.filterwarnings("ignore")
-        
-        print(f"✅ Logging configurado: {log_file}")
-        
+
+        logger.debug(f"Logging configurado: {log_file}")
+
     except Exception as e:
-        print(f"❌ Error configurando logging: {e}")
         # Configuración de respaldo solo para consola
         logging.basicConfig(
             level=level,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
+        logger.error(f"❌ Error configurando logging: {e}")
 #===================================================================================================
 def cleanup_old_files(minutes_old=5):
     """Limpia archivos temporales antiguos"""
@@ -595,8 +737,10 @@ def cleanup_old_files(minutes_old=5):
 def delete_user_files(user_id: int, report_age_minutes: int = 5):
     """
     Elimina:
-      ✅ la imagen del diagnóstico inmediatamente.
+      ✅ las imágenes del diagnóstico inmediatamente.
       ✅ los informes PDF del usuario si tienen al menos X minutos de antigüedad.
+    Los archivos se toman del índice de temporales (janitor.ARTIFACTS), sin recorrer
+    directorios; lo que quede lo borra el job periódico del janitor al vencer.
 
     Args:
         user_id (int): ID del usuario.
@@ -605,32 +749,16 @@ def delete_user_files(user_id: int, report_age_minutes: int = 5):
     deleted = {"image_deleted": False, "reports_deleted": 0}
 
     try:
-        # === 1️⃣ Eliminar imagen del diagnóstico ===
-        img_path = os.path.join("data", "uploads", f"{user_id}_diagnosis.jpg")
-        if os.path.exists(img_path):
-            os.remove(img_path)
-            deleted["image_deleted"] = True
-            logger.info(f"🗑️ Imagen eliminada: {img_path}")
-        else:
-            logger.debug(f"No se encontró la imagen para eliminar: {img_path}")
+        # === 1️⃣ Eliminar imágenes del diagnóstico ===
+        files, _ = ARTIFACTS.release_owner(user_id, kind="upload")
+        deleted["image_deleted"] = files > 0
+        if not files:
+            logger.debug(f"No se encontró la imagen para eliminar del usuario {user_id}")
 
         # === 2️⃣ Eliminar informes PDF antiguos ===
-        reports_dir = os.path.join("data", "reports")
-        pattern = os.path.join(reports_dir, f"Pacho_Informe_{user_id}_*.pdf")
-
-        current_time = time.time()
-        cutoff_seconds = report_age_minutes * 60
-
-        for report_path in glob.glob(pattern):
-            try:
-                file_time = os.path.getmtime(report_path)
-                age_seconds = current_time - file_time
-                if age_seconds >= cutoff_seconds:
-                    os.remove(report_path)
-                    deleted["reports_deleted"] += 1
-                    logger.info(f"🗑️ Informe eliminado (antigüedad {age_seconds/60:.1f} min): {report_path}")
-            except Exception as e:
-                logger.error(f"Error eliminando informe {report_path}: {e}")
+        files, _ = ARTIFACTS.release_owner(user_id, kind="report",
+                                           min_age_seconds=report_age_minutes * 60)
+        deleted["reports_deleted"] = files
 
     except Exception as e:
         logger.error(f"Error en delete_user_files para usuario {user_id}: {e}")
@@ -681,14 +809,13 @@ def format_treatments_with_ai_or_fallback(treatments_list):
             f"A continuación se presentan los tratamientos para organizar:\n{chr(10).join(treatments_list)}"
         )
 
-        url = (
-            f"https://generativelanguage.googleapis.com/v1beta/models/"
-            f"gemini-2.5-flash:generateContent?key={API_KEY_LLM}"
-        )
+        import requests
+
+        url = _gemini_url(API_KEY_LLM)
         headers = {"Content-Type": "application/json"}
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
 
-        print("🌿 Enviando solicitud al modelo Gemini para formatear tratamientos...")
+        logger.debug("🌿 Enviando solicitud al modelo Gemini para formatear tratamientos...")
         response = requests.post(url, headers=headers, json=payload, timeout=30)
 
         if response.status_code == 200:
@@ -706,7 +833,7 @@ def format_treatments_with_ai_or_fallback(treatments_list):
             return limpio.split("\n")
 
         else:
-            print(f"[WARN Gemini] Error {response.status_code}: {response.text}")
+            logger.warning(f"[Gemini] Error {response.status_code}: {response.text}")
             # Fallback local si falla la API
             fallback = []
             for i, t in enumerate(treatments_list, 1):
@@ -715,7 +842,7 @@ def format_treatments_with_ai_or_fallback(treatments_list):
             return fallback
 
     except Exception as e:
-        print(f"[ERROR Gemini fallback] {e}")
+        logger.error(f"[Gemini fallback] {e}")
         fallback = []
         for i, t in enumerate(treatments_list, 1):
             fallback.append(f"\n----- 🌿 Tratamiento {i} -----\n")
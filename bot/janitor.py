@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Retención de imágenes e informes (los términos prometen borrarlos a los 5 minutos)
+ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", "300"))
+JANITOR_INTERVAL_SECONDS = float(os.getenv("JANITOR_INTERVAL_SECONDS", "30"))
+JANITOR_BATCH_SIZE = int(os.getenv("JANITOR_BATCH_SIZE", "200"))
+
+
+class _Artifact:
+    __slots__ = ("path", "kind", "owner", "created", "expires")
+
+    def __init__(self, path: str, kind: str, owner: Optional[Hashable], created: float, expires: float):
+        self.path = path
+        self.kind = kind
+        self.owner = owner
+        self.created = created
+        self.expires = expires
+
+
+class ArtifactIndex:
+    """
+    Índice en memoria de archivos temporales (subidas e informes) con su caducidad.
+    El borrado se hace por lotes desde un heap ordenado por vencimiento, sin listar
+    directorios. Es seguro llamarlo desde el event loop y desde hilos del executor.
+    """
+
+    def __init__(self, default_ttl: float = ARTIFACT_TTL_SECONDS):
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._heap: list[tuple[float, int, str]] = []
+        self._items: dict[str, _Artifact] = {}
+        self._by_owner: dict[Hashable, set[str]] = {}
+        self._seq = 0
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def register(self, path: str, kind: str, owner: Optional[Hashable] = None,
+                 ttl: Optional[float] = None) -> None:
+        """Registra (o renueva) un archivo para que se borre `ttl` segundos después."""
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._items.get(path)
+            if old is not None and old.owner != owner:
+                self._discard_owner(old)
+            self._items[path] = _Artifact(path, kind, owner, now, expires)
+            if owner is not None:
+                self._by_owner.setdefault(owner, set()).add(path)
+            self._seq += 1
+            heapq.heappush(self._heap, (expires, self._seq, path))
+
+    def _discard_owner(self, art: _Artifact) -> None:
+        paths = self._by_owner.get(art.owner)
+        if paths is not None:
+            paths.discard(art.path)
+            if not paths:
+                del self._by_owner[art.owner]
+
+    def _take(self, path: str) -> Optional[_Artifact]:
+        art = self._items.pop(path, None)
+        if art is not None:
+            self._discard_owner(art)
+        return art
+
+    def _remove_files(self, arts: list[_Artifact]) -> tuple[int, int]:
+        files = nbytes = 0
+        for art in arts:
+            try:
+                size = os.path.getsize(art.path)
+                os.remove(art.path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"[JANITOR] Error eliminando {art.path}: {e}")
+                continue
+            files += 1
+            nbytes += size
+            logger.info(f"🗑️ {art.kind} eliminado: {art.path}")
+        with self._lock:
+            self.reclaimed_files += files
+            self.reclaimed_bytes += nbytes
+        return files, nbytes
+
+    def release_owner(self, owner: Hashable, kind: Optional[str] = None,
+                      min_age_seconds: float = 0.0) -> tuple[int, int]:
+        """Borra ya los archivos de `owner` (opcionalmente de un tipo y con antigüedad mínima)."""
+        now = time.time()
+        with self._lock:
+            arts = [self._items[p] for p in self._by_owner.get(owner, ())
+                    if (kind is None or self._items[p].kind == kind)
+                    and now - self._items[p].created >= min_age_seconds]
+            for art in arts:
+                self._take(art.path)
+        return self._remove_files(arts)
+
+    def sweep(self, batch_size: int = JANITOR_BATCH_SIZE) -> tuple[int, int, int]:
+        """
+        Saca hasta `batch_size` entradas vencidas y borra sus archivos. Devuelve (entradas,
+        archivos, bytes): un archivo que ya no existe cuenta como entrada pero no como borrado.
+        """
+        now = time.time()
+        due: list[_Artifact] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < batch_size:
+                expires, _, path = heapq.heappop(self._heap)
+                art = self._items.get(path)
+                # entradas renovadas o ya liberadas dejan restos en el heap: se ignoran
+                if art is None or art.expires != expires:
+                    continue
+                due.append(self._take(path))
+        return (len(due), *self._remove_files(due))
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._items), "reclaimed_files": self.reclaimed_files,
+                "reclaimed_bytes": self.reclaimed_bytes}
+
+
+# Índice del proceso: lo comparten bot.py (registro) y functionality (borrado por usuario)
+ARTIFACTS = ArtifactIndex()
+
+
+async def janitor_job(context) -> None:
+    """Job periódico (JobQueue): borra por lotes los archivos temporales vencidos."""
+    files = nbytes = 0
+    while True:
+        taken, f, b = await asyncio.to_thread(ARTIFACTS.sweep)
+        files += f
+        nbytes += b
+        # se sigue mientras el lote salga lleno, aunque sus archivos ya no existieran
+        if taken < JANITOR_BATCH_SIZE:
+            break
+    if files:
+        logger.info(f"[JANITOR] recuperados {files} archivos ({nbytes / 1024:.1f} KiB); {ARTIFACTS.stats()}")
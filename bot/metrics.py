@@ -0,0 +1,253 @@
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Buckets (segundos) pensados para etapas entre milisegundos (BD) y decenas de segundos (LLM/PDF)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    """Escapa barras invertidas, comillas y saltos de línea (formato de texto de Prometheus)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class CallbackMetric(_Metric):
+    """
+    Métrica calculada solo al hacer scrape: `fn()` devuelve un número o un dict
+    {tupla_de_labels: número}. No cuesta nada mientras nadie consulte /metrics.
+    """
+
+    def __init__(self, name, help, fn: Callable, labelnames=(), kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        try:
+            result = self.fn()
+        except Exception as e:
+            logger.debug(f"[METRICS] {self.name}: {e}")
+            return []
+        if not isinstance(result, dict):
+            return [f"{self.name} {_fmt_value(result)}"]
+        lines = []
+        for key, v in result.items():
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple, list] = {}   # key -> [counts por bucket..., suma, total]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(s)) for k, s in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_fmt_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(series[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._metrics.get(name) or self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._metrics.get(name) or self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.get(name) or self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, fn, labelnames=(), kind="gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, fn, labelnames, kind))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            body = m.render()
+            if body:
+                lines += m.header() + body
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "pacho_stage_seconds", "Duración de cada etapa del diagnóstico", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "pacho_stage_errors_total", "Etapas del diagnóstico que terminaron con excepción", ("stage",))
+DIAGNOSES = REGISTRY.counter(
+    "pacho_diagnoses_total", "Diagnósticos finalizados por resultado", ("result",))
+
+
+class timed:
+    """
+    Mide un bloque como etapa del diagnóstico (histograma `pacho_stage_seconds`).
+    Se usa con `with`, también alrededor de un `await`:
+
+        with timed("cnn"):
+            result = await asyncio.to_thread(f.classify_images, paths)
+    """
+
+    __slots__ = ("stage", "_start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, stage=self.stage)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            STAGE_ERRORS.inc(stage=self.stage)
+        return False
+
+
+# =======================
+# Endpoint HTTP (formato texto de Prometheus)
+# =======================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):   # sin una línea de log por cada scrape
+        pass
+
+
+def start_metrics_server(port: Optional[int] = None, addr: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Levanta /metrics en un hilo daemon. Puerto y dirección desde METRICS_PORT / METRICS_ADDR;
+    METRICS_PORT=0 lo desactiva.
+    """
+    port = int(os.getenv("METRICS_PORT", "9100") if port is None else port)
+    addr = os.getenv("METRICS_ADDR", "127.0.0.1") if addr is None else addr
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"[METRICS] No se pudo abrir {addr}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"[METRICS] Endpoint Prometheus en http://{addr}:{port}/metrics")
+    return server
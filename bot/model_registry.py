@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se revisan los archivos de modelo (0 = solo recarga manual con /reload_models)
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "30"))
+# Usuarios de Telegram que pueden usar /reload_models
+ADMIN_USER_IDS = frozenset(
+    int(x) for x in os.getenv("ADMIN_USER_IDS", "").replace(";", ",").split(",") if x.strip().isdigit()
+)
+
+# Capa de normalización integrada en el modelo (TrainCNN.py / cnn_pipeline.py wrap)
+PREPROCESS_LAYER = "preprocess"
+
+RELOADS = REGISTRY.counter("pacho_model_reloads_total", "Recargas de modelos", ("kind", "result"))
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def _stat(path: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ModelVersion:
+    """
+    Un modelo cargado y calentado. Es inmutable salvo `stat`: quien lo obtiene del
+    registro lo usa hasta terminar, aunque entretanto se publique otra versión.
+    """
+
+    __slots__ = ("kind", "model", "path", "digest", "version", "stat", "features", "loaded_at")
+
+    def __init__(self, kind: str, model: Any, path: str, digest: str,
+                 stat: Optional[tuple[int, int]], features: Optional[list] = None):
+        self.kind = kind
+        self.model = model
+        self.path = path
+        self.digest = digest
+        self.version = f"{os.path.splitext(os.path.basename(path))[0]}-{digest}"
+        self.stat = stat
+        self.features = features
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+
+
+def has_baked_preprocess(model: Any) -> bool:
+    """¿El modelo normaliza por sí mismo? Entonces recibe los píxeles uint8 tal cual."""
+    return any(layer.name == PREPROCESS_LAYER for layer in getattr(model, "layers", ()))
+
+
+# =======================
+# Cargadores (cargan y calientan; corren fuera del event loop)
+# =======================
+
+def load_cnn(path: str) -> tuple[Any, None]:
+    import numpy as np
+    import tensorflow as tf
+    import resource_profile
+
+    resource_profile.configure().apply_tensorflow(tf)
+    model = tf.keras.models.load_model(path)
+    if not has_baked_preprocess(model):
+        logger.warning(f"[MODELS] {os.path.basename(path)} no tiene capa '{PREPROCESS_LAYER}': se normaliza "
+                       f"fuera del modelo (CNN_LEGACY_PREPROCESS). Conviértelo con `cnn_pipeline.py wrap`.")
+    # el primer predict traza el grafo: mejor aquí que en la foto de un usuario
+    shape = [d or 1 for d in model.input_shape]
+    dtype = np.uint8 if has_baked_preprocess(model) else np.float32
+    model.predict(np.zeros(shape, dtype=dtype), verbose=0)
+    return model, None
+
+
+def load_rf(path: str) -> tuple[Any, list]:
+    import pandas as pd
+    from randomforest import RandomForest
+
+    pipe, features, _, info = RandomForest.initialize_ml_system(data_path=path)
+    if pipe is None:
+        raise RuntimeError(info.get("message", "entrenamiento fallido"))
+    pipe.predict_proba(pd.DataFrame([[0] * len(features)], columns=features))
+    return pipe, features
+
+
+class LoadFailed(RuntimeError):
+    """La última carga del modelo falló y su archivo sigue igual."""
+
+
+class ModelRegistry:
+    """
+    Versión activa de cada modelo ('cnn', 'rf'). La recarga carga y calienta la
+    versión nueva en segundo plano y la publica con una sola asignación: las
+    peticiones nuevas la ven, las que ya tomaron la anterior terminan con ella.
+    """
+
+    def __init__(self, sources: dict[str, tuple[Callable[[], Optional[str]], Callable]], name: str = "MODELS"):
+        self.name = name                     # prefijo de los logs
+        self._sources = sources              # tipo -> (ruta actual, cargador)
+        self._current: dict[str, ModelVersion] = {}
+        self._pending: dict[str, tuple] = {}   # stat visto en el sondeo anterior
+        self._failed: dict[str, tuple] = {}    # tipo -> (ruta, stat, error) de la última carga fallida
+        self._lock = threading.Lock()          # una carga a la vez
+        self.history: deque = deque(maxlen=20)
+
+    @property
+    def kinds(self) -> tuple[str, ...]:
+        return tuple(self._sources)
+
+    def source(self, kind: str) -> Optional[str]:
+        """Ruta configurada ahora mismo para el modelo (None si no hay)."""
+        return self._sources[kind][0]() if kind in self._sources else None
+
+    def current(self, kind: str) -> Optional[ModelVersion]:
+        return self._current.get(kind)
+
+    def versions(self) -> dict[str, str]:
+        return {k: mv.version for k, mv in self._current.items()}
+
+    def get(self, kind: str) -> ModelVersion:
+        """
+        Versión activa; si aún no hay ninguna, la carga (bloqueando). Si la última carga
+        falló y el archivo no ha cambiado, se repite el error sin volver a leerlo; una
+        recarga manual (`reload(force=True)`) lo vuelve a intentar.
+        """
+        mv = self._current.get(kind)
+        if mv is not None:
+            return mv
+        self._raise_if_failed(kind)
+        with self._lock:
+            mv = self._current.get(kind)
+            if mv is None:
+                self._raise_if_failed(kind)
+                path = self._sources[kind][0]()
+                try:
+                    mv = self._load(kind, path)
+                except Exception as e:
+                    if path:
+                        self._failed[kind] = (path, _stat(path), e)
+                    raise
+                self._publish(mv)
+        return mv
+
+    def _raise_if_failed(self, kind: str) -> None:
+        failed = self._failed.get(kind)
+        if failed is None:
+            return
+        path, stat, error = failed
+        if path == self._sources[kind][0]() and stat == _stat(path):
+            raise LoadFailed(f"Carga previa de '{kind}' fallida y {path} no ha cambiado: {error}")
+        self._failed.pop(kind, None)
+
+    def install(self, kind: str, model: Any, path: str, features: Optional[list] = None) -> ModelVersion:
+        """Publica un modelo ya cargado (p. ej. el RF entrenado durante el arranque)."""
+        digest = file_digest(path) if path and os.path.exists(path) else "memoria"
+        mv = ModelVersion(kind, model, path or kind, digest, _stat(path) if path else None, features)
+        self._publish(mv)
+        return mv
+
+    def _load(self, kind: str, path: Optional[str] = None) -> ModelVersion:
+        path_fn, loader = self._sources[kind]
+        path = path or path_fn()
+        if not path:
+            raise ValueError(f"Ruta del modelo '{kind}' no configurada")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Modelo '{kind}' no encontrado en: {path}")
+        stat, digest = _stat(path), file_digest(path)
+        t0 = time.perf_counter()
+        model, features = loader(path)
+        mv = ModelVersion(kind, model, path, digest, stat, features)
+        logger.info(f"[{self.name}] {kind} {mv.version} cargado y calentado en {time.perf_counter() - t0:.1f}s")
+        return mv
+
+    def _publish(self, mv: ModelVersion) -> None:
+        old = self._current.get(mv.kind)
+        self._current[mv.kind] = mv
+        self._pending.pop(mv.kind, None)
+        self._failed.pop(mv.kind, None)
+        self.history.append((mv.loaded_at, mv.kind, mv.version))
+        logger.info(f"[{self.name}] {mv.kind} activo: {old.version if old else '—'} -> {mv.version}")
+
+    def reload(self, kinds: Optional[list[str]] = None, force: bool = False) -> dict[str, str]:
+        """
+        Revisa y recarga en el hilo que llama. Sin `force` solo recarga modelos ya en uso
+        cuyo archivo cambió y no se movió desde el sondeo anterior (copia terminada).
+        Devuelve {tipo: versión nueva | estado}.
+        """
+        kinds = [k for k in (kinds or self.kinds) if k in self._sources]
+        if not self._lock.acquire(blocking=False):
+            return {k: "ocupado" for k in kinds}
+        try:
+            return {k: self._reload_one(k, force) for k in kinds}
+        finally:
+            self._lock.release()
+
+    def _reload_one(self, kind: str, force: bool) -> str:
+        path = self._sources[kind][0]()
+        cur = self._current.get(kind)
+        if force:
+            self._failed.pop(kind, None)
+        if not path or not os.path.exists(path):
+            return "sin_archivo"
+        stat = _stat(path)
+        if not force:
+            if cur is None:
+                return "sin_cargar"   # se cargará con la primera petición
+            if cur.path == path and cur.stat == stat:
+                self._pending.pop(kind, None)
+                return "sin_cambios"
+            if self._pending.get(kind) != stat:
+                self._pending[kind] = stat
+                return "pendiente"
+            if cur.path == path and file_digest(path) == cur.digest:
+                cur.stat = stat   # solo cambió la fecha (touch/copia idéntica)
+                self._pending.pop(kind, None)
+                return "sin_cambios"
+        try:
+            mv = self._load(kind, path)
+        except Exception as e:
+            RELOADS.inc(kind=kind, result="error")
+            if cur is None:
+                self._failed[kind] = (path, stat, e)
+            logger.exception(f"[{self.name}] Recarga de {kind} fallida; se mantiene "
+                             f"{cur.version if cur else 'ninguno'}: {e}")
+            return f"error: {e}"
+        self._publish(mv)
+        RELOADS.inc(kind=kind, result="ok")
+        return mv.version
+
+
+MODELS = ModelRegistry({
+    "cnn": (lambda: os.getenv("LECHUGA_MODEL_PATH"), load_cnn),
+    # primera etapa de la cascada (opcional)
+    "cnn_fast": (lambda: os.getenv("CNN_CASCADE_FAST_MODEL_PATH", "").strip() or None, load_cnn),
+    "rf": (lambda: os.getenv("DATASET_RF"), load_rf),
+})
+
+REGISTRY.callback("pacho_model_info", "Versión activa de cada modelo (valor 1)",
+                  lambda: {(k, v): 1 for k, v in MODELS.versions().items()}, ("kind", "version"))
+
+_QUIET = ("sin_cambios", "pendiente", "sin_cargar", "sin_archivo", "ocupado")
+
+
+async def watch_models_job(context) -> None:
+    """Job periódico (JobQueue): recarga los modelos cuyo archivo cambió."""
+    results = await asyncio.to_thread(MODELS.reload)
+    changed = {k: v for k, v in results.items() if v not in _QUIET}
+    if changed:
+        logger.warning(f"[MODELS] Recarga automática: {changed}")
@@ -1,14 +1,17 @@
 #Librerías
 import os
+import logging
 import pandas as pd
 from datetime import datetime
+from typing import TYPE_CHECKING
 from joblib import dump, load
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestClassifier
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
 # Carga las variables definidas en archivo .env para configurar rutas y parámetros
 load_dotenv()
 
@@ -94,10 +97,15 @@ class RandomForest:
     # -----------------------------
 
     @staticmethod
-    def _build_pipeline(use_scaler: bool = False) -> Pipeline:
+    def _build_pipeline(use_scaler: bool = False) -> "Pipeline":
         """
         Construye el procesamiento y clasificación:        
         """
+        # scikit-learn se importa al entrenar (en el hilo de arranque), no al importar el módulo
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.ensemble import RandomForestClassifier
+
         steps = []
         # Añade escalado o pasa directo según parámetro
         steps.append(("scaler", StandardScaler())) if use_scaler else steps.append(("scaler", "passthrough"))
@@ -150,6 +158,7 @@ class RandomForest:
             y = df[label_col].astype(str)  # Convierte etiqueta a texto para clasificación nominal
 
             # Divide el dataset en entrenamiento y prueba (holdout) usando estratificación para clases
+            from sklearn.model_selection import train_test_split
             X_train, X_test, y_train, y_test = train_test_split(
                 X, y, test_size=test_size, random_state=random_state, stratify=y
             )
@@ -165,9 +174,7 @@ class RandomForest:
             acc_test = pipe.score(X_test, y_test)
 
             # Imprime métricas para evaluación rápida
-            print("🎯 Exactitud (holdout)")
-            print(f" • Entrenamiento: {acc_train:.4f}")
-            print(f" • Prueba: {acc_test:.4f}")
+            logger.info(f"🎯 Exactitud (holdout) • Entrenamiento: {acc_train:.4f} • Prueba: {acc_test:.4f}")
 
             # Prepara diccionario con métricas y clases para retornar
             metrics = {
@@ -180,8 +187,8 @@ class RandomForest:
             return pipe, feature_columns, label_col, metrics
 
         except Exception as e:
-            # En caso de error, se imprime en consola y retorna estructura con error
-            print(f"❌ Error al entrenar: {e}")
+            # En caso de error, se registra en el log y retorna estructura con error
+            logger.error(f"❌ Error al entrenar: {e}")
             return None, None, None, {"error": True, "message": str(e)}
 
     # -----------------------------
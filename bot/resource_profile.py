@@ -0,0 +1,161 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Cuota de CPU del contenedor (cgroup v2 y v1)
+_CGROUP_V2_MAX = "/sys/fs/cgroup/cpu.max"
+_CGROUP_V1_DIRS = ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct")
+
+# Variables que leen las bibliotecas nativas al importarse (numpy/BLAS, oneDNN/OpenMP, TF)
+_THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="ascii") as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs permitidas por la cuota CFS del cgroup (p. ej. 1.5), o None si no hay límite."""
+    raw = _read(_CGROUP_V2_MAX)
+    if raw:
+        quota, _, period = raw.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    for base in _CGROUP_V1_DIRS:
+        quota = _read(os.path.join(base, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(base, "cpu.cfs_period_us"))
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+
+def detect_cpus() -> tuple[float, str]:
+    """CPUs efectivas y de dónde salen: CPU_LIMIT, cuota del cgroup o afinidad del proceso."""
+    override = os.getenv("CPU_LIMIT", "").strip()
+    if override:
+        return float(override), "CPU_LIMIT"
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:   # sin sched_getaffinity (Windows/macOS)
+        available = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    if quota is not None and quota < available:
+        return quota, "cgroup"
+    return float(available), "affinity"
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    return max(1, int(raw)) if raw else default
+
+
+class ResourceProfile:
+    """
+    Reparto de hilos según las CPUs efectivas del contenedor:
+
+    - TensorFlow: `tf_intra_op` hilos por operación (oneDNN/Eigen) y `tf_inter_op` entre operaciones.
+    - Inferencia CNN: pool propio de `inference_workers` hilos; cada lote ya usa todos los
+      hilos intra-op, así que más lotes a la vez solo se pisarían.
+    - Executor por defecto de asyncio (BD, Gemini, PDF): `executor_workers`, sobre todo espera de E/S.
+    """
+
+    __slots__ = ("cpus", "source", "cores", "tf_intra_op", "tf_inter_op", "inference_workers",
+                 "executor_workers", "_inference_pool")
+
+    def __init__(self, cpus: float, source: str, tf_intra_op: int, tf_inter_op: int,
+                 inference_workers: int, executor_workers: int):
+        self.cpus = cpus
+        self.source = source
+        self.cores = max(1, int(cpus))   # cuota 1.5 -> 1 hilo de cómputo: no provocar throttling
+        self.tf_intra_op = tf_intra_op
+        self.tf_inter_op = tf_inter_op
+        self.inference_workers = inference_workers
+        self.executor_workers = executor_workers
+        self._inference_pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "ResourceProfile":
+        load_dotenv()
+        cpus, source = detect_cpus()
+        cores = max(1, int(cpus))
+        inference = _env_int("INFERENCE_WORKERS", 1)
+        return cls(
+            cpus=cpus,
+            source=source,
+            tf_intra_op=_env_int("TF_NUM_INTRAOP_THREADS", max(1, cores // inference)),
+            tf_inter_op=_env_int("TF_NUM_INTEROP_THREADS", 1 if cores <= 2 else 2),
+            inference_workers=inference,
+            executor_workers=_env_int("EXECUTOR_WORKERS", min(32, cores + 4)),
+        )
+
+    def apply_env(self) -> None:
+        """Fija los hilos de las bibliotecas nativas. Debe llamarse antes de importar numpy/TF."""
+        for name in _THREAD_ENV:
+            os.environ.setdefault(name, str(self.tf_intra_op))
+        os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(self.tf_intra_op))
+        os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(self.tf_inter_op))
+
+    def apply_tensorflow(self, tf) -> None:
+        """Configura los pools de TF; solo surte efecto antes de ejecutar la primera operación."""
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.tf_intra_op)
+            tf.config.threading.set_inter_op_parallelism_threads(self.tf_inter_op)
+        except RuntimeError as e:   # el runtime de TF ya estaba inicializado
+            logger.debug(f"[RESOURCES] TF ya inicializado; se mantienen sus hilos: {e}")
+
+    def install_executor(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Executor por defecto del loop (asyncio.to_thread) dimensionado a la cuota."""
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                     thread_name_prefix="pacho-io"))
+
+    @property
+    def inference_pool(self) -> ThreadPoolExecutor:
+        if self._inference_pool is None:
+            self._inference_pool = ThreadPoolExecutor(max_workers=self.inference_workers,
+                                                      thread_name_prefix="pacho-cnn")
+        return self._inference_pool
+
+    def describe(self) -> dict:
+        return {"cpus": round(self.cpus, 2), "cpu_source": self.source,
+                "tf_intra_op": self.tf_intra_op, "tf_inter_op": self.tf_inter_op,
+                "omp_threads": int(os.getenv("OMP_NUM_THREADS", self.tf_intra_op)),
+                "inference_workers": self.inference_workers, "executor_workers": self.executor_workers}
+
+    def log(self) -> None:
+        d = self.describe()
+        logger.info(f"🧮 Recursos: {d['cpus']} CPU ({d['cpu_source']}) · TF intra={d['tf_intra_op']} "
+                    f"inter={d['tf_inter_op']} · OMP={d['omp_threads']} · inferencia={d['inference_workers']} "
+                    f"· executor={d['executor_workers']}", extra={"resources": d})
+
+
+PROFILE: Optional[ResourceProfile] = None
+
+
+def configure() -> ResourceProfile:
+    """Detecta la cuota y exporta las variables de hilos (una sola vez por proceso)."""
+    global PROFILE
+    if PROFILE is None:
+        PROFILE = ResourceProfile.from_env()
+        PROFILE.apply_env()
+    return PROFILE
+
+
+async def run_inference(fn, /, *args, **kwargs):
+    """Como `asyncio.to_thread`, pero en el pool de inferencia (conserva contextvars: trazas, BD)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(configure().inference_pool, call)
@@ -0,0 +1,219 @@
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# Registros de sesión (compactos, con __slots__)
+# =======================
+
+class ImageWindow:
+    """Fotos recibidas de un usuario mientras corre la ventana previa al análisis."""
+
+    __slots__ = ("count", "file_ids", "media_group_id", "task", "chat_id", "uname", "trace")
+
+    def __init__(self, chat_id: int, uname: str, trace: Optional[tracing.Trace] = None):
+        self.count = 0
+        self.file_ids: list[str] = []
+        self.media_group_id: Optional[str] = None
+        self.task = None
+        self.chat_id = chat_id
+        self.uname = uname
+        self.trace = trace
+
+
+class ImageAnalysis:
+    """Resultado de la CNN guardado hasta el paso final del diagnóstico."""
+
+    __slots__ = ("ml_result", "detected_class", "image_path", "image_paths", "trace", "model_version")
+
+    def __init__(self, ml_result: str, detected_class: str, image_paths: list[str],
+                 trace: Optional[tracing.Trace] = None, model_version: Optional[str] = None):
+        self.ml_result = ml_result
+        self.detected_class = detected_class
+        self.image_path = image_paths[0] if image_paths else None
+        self.image_paths = image_paths
+        self.trace = trace
+        self.model_version = model_version   # versión de la CNN que produjo el resultado
+
+
+class SurveySession:
+    """Respuestas de la encuesta RF de un usuario."""
+
+    __slots__ = ("responses", "question_texts", "user_name", "cultivation_location", "trace", "pending", "skipped")
+
+    def __init__(self, user_name: str = "sin_username", trace: Optional[tracing.Trace] = None):
+        self.responses: dict[str, str] = {}
+        self.question_texts: dict[int, str] = {}
+        self.pending: Optional[int] = None   # pregunta mostrada y aún sin responder
+        self.skipped: set[int] = set()       # preguntas sin opciones válidas en la BD (modo adaptativo)
+        self.user_name = user_name
+        self.cultivation_location: Optional[str] = None
+        self.trace = trace
+
+
+def _record_size(value: Any) -> int:
+    """Tamaño aproximado (bytes) de un registro: el objeto y sus atributos directos."""
+    size = sys.getsizeof(value)
+    for attr in getattr(type(value), "__slots__", ()):
+        v = getattr(value, attr, None)
+        size += sys.getsizeof(v)
+        if isinstance(v, (dict, list)):
+            size += sum(sys.getsizeof(x) for x in (v.values() if isinstance(v, dict) else v))
+    return size
+
+
+# =======================
+# Contenedor con TTL y tope de entradas
+# =======================
+
+class TTLStore:
+    """
+    Diccionario acotado: cada entrada caduca `ttl` segundos después de su último uso
+    y, si se supera `max_entries`, se expulsa la usada hace más tiempo (LRU).
+    `on_evict(key, value)` se llama al expulsar por TTL o por tamaño y cuando `put`
+    reemplaza un valor distinto bajo la misma clave (no en `pop`).
+    """
+
+    __slots__ = ("name", "ttl", "max_entries", "on_evict", "_data", "evicted")
+
+    def __init__(self, name: str, ttl: float, max_entries: int,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()   # key -> [expires_at, value]
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, touch=False) is not None
+
+    def get(self, key: Hashable, default: Any = None, touch: bool = True) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        now = time.monotonic()
+        if entry[0] <= now:
+            self._evict(key)
+            return default
+        if touch:
+            entry[0] = now + self.ttl
+            self._data.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        previous = self._data.get(key)
+        self._data[key] = [time.monotonic() + self.ttl, value]
+        self._data.move_to_end(key)
+        # p. ej. una foto nueva con el diagnóstico anterior aún abierto: el registro viejo se cierra
+        if previous is not None and previous[1] is not value:
+            self._notify(key, previous[1])
+        while len(self._data) > self.max_entries:
+            self._evict(next(iter(self._data)))
+        return value
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory())
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def _evict(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self.evicted += 1
+        self._notify(key, entry[1])
+
+    def _notify(self, key: Hashable, value: Any) -> None:
+        if self.on_evict:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                logger.error(f"[SESSIONS] on_evict ({self.name}) {key}: {e}")
+
+    def sweep(self) -> int:
+        """Expulsa las entradas caducadas. Como el orden es de último uso, basta mirar el frente."""
+        now = time.monotonic()
+        removed = 0
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if entry[0] > now:
+                break
+            self._evict(key)
+            removed += 1
+        return removed
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self._data) + sum(
+            sys.getsizeof(k) + _record_size(e[1]) for k, e in self._data.items()
+        )
+
+
+def _abandon_trace(_uid, record) -> None:
+    # sesión expulsada o reemplazada sin terminar el diagnóstico: la traza se cierra igualmente
+    tracing.end_trace(getattr(record, "trace", None), status="abandoned")
+
+
+def _cancel_window_task(uid, win: ImageWindow) -> None:
+    if win.task is not None and not win.task.done():
+        win.task.cancel()
+    _abandon_trace(uid, win)
+
+
+class SessionStores:
+    """Todos los contenedores de estado por usuario del bot."""
+
+    __slots__ = ("image_window", "image_analysis", "survey", "last_seen")
+
+    def __init__(self):
+        session_ttl = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+        max_entries = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+        self.image_window = TTLStore("image_window", float(os.getenv("IMAGE_WINDOW_TTL_SECONDS", "600")),
+                                     max_entries, on_evict=_cancel_window_task)
+        self.image_analysis = TTLStore("image_analysis", session_ttl, max_entries, on_evict=_abandon_trace)
+        self.survey = TTLStore("survey_sessions", session_ttl, max_entries, on_evict=_abandon_trace)
+        # solo hace falta recordar "ya saludé hoy": basta con algo más de un día
+        self.last_seen = TTLStore("last_seen_date", float(os.getenv("LAST_SEEN_TTL_SECONDS", "129600")),
+                                  int(os.getenv("LAST_SEEN_MAX_ENTRIES", "100000")))
+
+    def all(self) -> tuple[TTLStore, ...]:
+        return (self.image_window, self.image_analysis, self.survey, self.last_seen)
+
+    def sweep(self) -> dict[str, int]:
+        return {s.name: s.sweep() for s in self.all()}
+
+    def gauges(self) -> dict[str, dict[str, int]]:
+        """Tamaño, bytes aproximados y expulsiones acumuladas de cada contenedor."""
+        return {s.name: {"entries": len(s), "bytes": s.approx_bytes(), "evicted": s.evicted}
+                for s in self.all()}
+
+
+def get_sessions(bot_data: dict) -> SessionStores:
+    """Devuelve (creando si hace falta) los contenedores de sesión guardados en `bot_data`."""
+    stores = bot_data.get("sessions")
+    if stores is None:
+        stores = bot_data["sessions"] = SessionStores()
+    return stores
+
+
+async def sweep_sessions_job(context) -> None:
+    """Job periódico (JobQueue): expulsa sesiones caducadas (los gauges se exponen en /metrics)."""
+    removed = get_sessions(context.bot_data).sweep()
+    if any(removed.values()):
+        logger.info(f"[SESSIONS] expulsadas={removed}")
@@ -0,0 +1,250 @@
+"""
+Modo sombra: un modelo candidato (CNN o RF) se ejecuta junto al de producción sobre
+una fracción de las solicitudes, en un hilo aparte y con presupuesto de CPU. El
+agricultor siempre recibe la respuesta de producción; la comparación (acuerdo, delta
+de confianza y latencias) se escribe en SHADOW_LOG.
+
+Resumen del registro:
+    python shadow.py [data/logs/shadow.jsonl]
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Optional
+
+from metrics import REGISTRY
+from model_registry import ModelRegistry, ModelVersion, load_cnn, load_rf
+
+logger = logging.getLogger(__name__)
+
+# Candidatos (vacío = sin sombra para ese modelo)
+SHADOW_CNN_MODEL_PATH = os.getenv("SHADOW_CNN_MODEL_PATH", "").strip()
+SHADOW_RF_DATASET = os.getenv("SHADOW_RF_DATASET", "").strip()
+# Fracción de solicitudes que también pasan por el candidato
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+# Fracción del tiempo que el hilo sombra puede estar ocupado (0.2 = 20 %)
+SHADOW_CPU_BUDGET = float(os.getenv("SHADOW_CPU_BUDGET", "0.2"))
+# Trabajos en espera como máximo; si está lleno se descarta (nunca se bloquea al bot)
+SHADOW_MAX_QUEUE = int(os.getenv("SHADOW_MAX_QUEUE", "8"))
+SHADOW_LOG = os.getenv("SHADOW_LOG", os.path.join("data", "logs", "shadow.jsonl"))
+
+SHADOW_RUNS = REGISTRY.counter("pacho_shadow_runs_total", "Comparaciones en modo sombra", ("kind", "result"))
+SHADOW_SKIPPED = REGISTRY.counter("pacho_shadow_skipped_total", "Trabajos sombra descartados", ("kind", "reason"))
+
+CANDIDATES = ModelRegistry({
+    "cnn": (lambda: SHADOW_CNN_MODEL_PATH or None, load_cnn),
+    "rf": (lambda: SHADOW_RF_DATASET or None, load_rf),
+}, name="SHADOW")
+
+
+class BusyBudget:
+    """
+    Cubeta de segundos de trabajo: se recarga a `share` s por segundo hasta `burst`.
+    Un trabajo puede dejarla en negativo; mientras lo esté, los siguientes se saltan.
+    """
+
+    __slots__ = ("share", "burst", "tokens", "updated")
+
+    def __init__(self, share: float, burst: float):
+        self.share = share
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def available(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.share)
+        self.updated = now
+        return self.tokens > 0
+
+    def charge(self, seconds: float) -> None:
+        self.tokens -= seconds
+
+
+def _top(probs: dict) -> tuple[Optional[str], float]:
+    if not probs:
+        return None, 0.0
+    cls = max(probs, key=probs.get)
+    return cls, float(probs[cls])
+
+
+class ShadowRunner:
+    """Cola acotada + un hilo de baja prioridad que ejecuta los candidatos y registra la comparación."""
+
+    def __init__(self, candidates: ModelRegistry, sample_rate: float = SHADOW_SAMPLE_RATE,
+                 budget: float = SHADOW_CPU_BUDGET, max_queue: int = SHADOW_MAX_QUEUE,
+                 log_path: str = SHADOW_LOG):
+        self.candidates = candidates
+        self.sample_rate = sample_rate
+        self.budget = BusyBudget(budget, burst=max(1.0, budget * 30))
+        self.log_path = log_path
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enabled(self, kind: str) -> bool:
+        return self.sample_rate > 0 and bool(self.candidates.source(kind))
+
+    def wants(self, kind: str) -> bool:
+        """¿Esta solicitud entra en la muestra? Barato: se llama en el event loop."""
+        return self.enabled(kind) and random.random() < self.sample_rate
+
+    def submit(self, kind: str, run: Callable[[ModelVersion], dict], production: dict,
+               prod_version: Optional[str], prod_seconds: float, trace_id: Optional[str] = None) -> bool:
+        """
+        Encola la comparación sin esperar. `run(candidato)` devuelve {clase: prob};
+        `production` son las probabilidades que ya recibió el usuario.
+        """
+        job = {"kind": kind, "run": run, "production": production, "prod_version": prod_version,
+               "prod_seconds": prod_seconds, "trace_id": trace_id, "queued": time.monotonic()}
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            SHADOW_SKIPPED.inc(kind=kind, reason="queue_full")
+            return False
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="shadow", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        try:   # Linux: bajar la prioridad solo de este hilo
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._handle(job)
+            finally:
+                self._queue.task_done()
+
+    def _handle(self, job: dict) -> None:
+        if not self.budget.available():
+            SHADOW_SKIPPED.inc(kind=job["kind"], reason="cpu_budget")
+            return
+        t0 = time.perf_counter()
+        try:
+            record = self._compare(job)
+        except Exception as e:
+            SHADOW_RUNS.inc(kind=job["kind"], result="error")
+            logger.warning(f"[SHADOW] {job['kind']}: {e}")
+            return
+        finally:
+            self.budget.charge(time.perf_counter() - t0)
+        self._write(record)
+
+    def _compare(self, job: dict) -> dict:
+        kind = job["kind"]
+        cand = self.candidates.get(kind)   # la primera vez carga y calienta (fuera del camino crítico)
+        t0 = time.perf_counter()
+        cand_probs = job["run"](cand)
+        cand_seconds = time.perf_counter() - t0
+
+        prod_cls, prod_conf = _top(job["production"])
+        cand_cls, cand_conf = _top(cand_probs)
+        agree = prod_cls is not None and prod_cls == cand_cls
+        SHADOW_RUNS.inc(kind=kind, result="agree" if agree else "disagree")
+        return {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "kind": kind,
+            "trace_id": job["trace_id"],
+            "prod_version": job["prod_version"],
+            "cand_version": cand.version,
+            "prod_class": prod_cls,
+            "cand_class": cand_cls,
+            "agree": agree,
+            "prod_conf": round(prod_conf, 4),
+            "cand_conf": round(cand_conf, 4),
+            "conf_delta": round(cand_conf - prod_conf, 4),
+            # confianza del candidato en la clase que eligió producción
+            "cand_conf_on_prod": round(float(cand_probs.get(prod_cls, 0.0)), 4) if prod_cls else None,
+            "prod_ms": round(job["prod_seconds"] * 1000, 2),
+            "cand_ms": round(cand_seconds * 1000, 2),
+            "queue_ms": round((time.monotonic() - job["queued"]) * 1000 - cand_seconds * 1000, 2),
+        }
+
+    def _write(self, record: dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"[SHADOW] No se pudo escribir {self.log_path}: {e}")
+
+    def join(self, timeout: float = 30.0) -> None:
+        """Espera a que se vacíe la cola (pruebas y benchmarks)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+SHADOW = ShadowRunner(CANDIDATES)
+
+
+# =======================
+# Resumen del registro
+# =======================
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(path: str = SHADOW_LOG) -> dict:
+    groups: dict[tuple, list[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                r = json.loads(line)
+                groups[(r["kind"], r["prod_version"], r["cand_version"])].append(r)
+    out = {}
+    for (kind, prod, cand), rows in groups.items():
+        n = len(rows)
+        out[f"{kind}: {prod} vs {cand}"] = {
+            "n": n,
+            "agreement": sum(r["agree"] for r in rows) / n,
+            "conf_delta_mean": sum(r["conf_delta"] for r in rows) / n,
+            "prod_ms_p50": _pct([r["prod_ms"] for r in rows], 0.5),
+            "cand_ms_p50": _pct([r["cand_ms"] for r in rows], 0.5),
+            "prod_ms_p95": _pct([r["prod_ms"] for r in rows], 0.95),
+            "cand_ms_p95": _pct([r["cand_ms"] for r in rows], 0.95),
+            "disagreements": dict(sorted(
+                _count((r["prod_class"], r["cand_class"]) for r in rows if not r["agree"]).items(),
+                key=lambda kv: -kv[1])),
+        }
+    return out
+
+
+def _count(items) -> dict:
+    counts: dict[str, int] = defaultdict(int)
+    for prod, cand in items:
+        counts[f"{prod} -> {cand}"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else SHADOW_LOG
+    for name, s in summarize(path).items():
+        print(f"{name}\n  n={s['n']}  acuerdo={s['agreement']:.1%}  Δconfianza={s['conf_delta_mean']:+.3f}\n"
+              f"  latencia p50 {s['prod_ms_p50']:.1f} -> {s['cand_ms_p50']:.1f} ms · "
+              f"p95 {s['prod_ms_p95']:.1f} -> {s['cand_ms_p95']:.1f} ms")
+        for pair, n in s["disagreements"].items():
+            print(f"    {pair}: {n}")
@@ -0,0 +1,134 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+# Atributos estándar de LogRecord: todo lo demás se considera un campo `extra`
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+_LISTENER: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por evento: ts, level, logger, msg, campos `extra` y excepción."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STD_ATTRS and not key.startswith("_"):
+                doc[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc"] = record.exc_text
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Deja pasar solo una fracción `rate` de los eventos DEBUG marcados como de alto volumen
+    (`extra={"sample": True}`, los de la ruta caliente). El resto pasa siempre: un módulo
+    puesto en DEBUG con LOG_LEVELS conserva todos sus eventos.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0 or not getattr(record, "sample", False):
+            return True
+        return random.random() < self.rate
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que solo resuelve el mensaje en el hilo que loguea y deja el
+    formateo (incluido el de la excepción) a los handlers del listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+def parse_levels(spec: str) -> dict[str, int]:
+    """'db_core=INFO,bot=DEBUG' -> {'db_core': 20, 'bot': 10}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, lvl = (x.strip() for x in item.split("=", 1))
+        value = logging.getLevelName(lvl.upper())
+        if name and isinstance(value, int):
+            levels[name] = value
+    return levels
+
+
+def setup_structured_logging(level=logging.INFO, log_dir: str = os.path.join("data", "logs"),
+                             filename: str = "bot.log") -> str:
+    """
+    Logging no bloqueante: los handlers de la app solo encolan (QueueHandler) y un hilo
+    (QueueListener) escribe JSON en archivos rotativos y texto legible en consola.
+
+    Variables de entorno:
+        LOG_LEVELS: niveles por módulo, p. ej. "db_core=INFO,functionality=DEBUG".
+        LOG_DEBUG_SAMPLE_RATE: fracción de eventos DEBUG de alto volumen (extra={"sample": True})
+            que se conservan (0-1).
+        LOG_MAX_BYTES / LOG_BACKUPS: rotación del archivo.
+    """
+    global _LISTENER
+    log_file = os.path.join(log_dir, filename)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, lvl in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(lvl)
+
+    if _LISTENER is not None:
+        return log_file
+
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUPS", "5")),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))))
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+
+    _LISTENER = QueueListener(log_queue, file_handler, console, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(stop_structured_logging)
+    return log_file
+
+
+def stop_structured_logging() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
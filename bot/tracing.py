@@ -0,0 +1,233 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Trazas por diagnóstico (foto -> encuesta -> informe) en JSON compatible con OTLP
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join("data", "traces"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "2"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "pacho-bot")
+
+_STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None,
+                 attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes or {})
+        self.status = "unset"
+
+    @property
+    def ended(self) -> bool:
+        return self.end_ns != 0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.ended:
+            return
+        self.end_ns = time.time_ns()
+        if status:
+            self.status = status
+        _export(self)
+
+    def to_otlp(self) -> dict:
+        status = {"code": _STATUS_CODES.get(self.status, 0)}
+        if self.status not in _STATUS_CODES:
+            status["message"] = self.status
+        doc = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,   # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attr(k, v) for k, v in self.attributes.items()],
+            "status": status,
+        }
+        if self.parent_id:
+            doc["parentSpanId"] = self.parent_id
+        return doc
+
+
+class Trace:
+    """Una traza por diagnóstico; se guarda en los registros de sesión para continuarla entre updates."""
+
+    __slots__ = ("trace_id", "root")
+
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(self.trace_id, name, attributes=attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.root.set_attribute(key, value)
+
+
+def _otlp_attr(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+# =======================
+# API
+# =======================
+
+_CURRENT: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("pacho_current_span", default=None)
+
+
+def start_trace(name: str, **attributes) -> Optional[Trace]:
+    """Abre la traza de un diagnóstico (span raíz). Devuelve None si el tracing está desactivado."""
+    if not TRACING_ENABLED:
+        return None
+    return Trace(name, attributes)
+
+
+def end_trace(trace: Optional[Trace], status: str = "ok", **attributes) -> None:
+    """Cierra el span raíz y lo exporta. Es idempotente."""
+    if trace is None:
+        return
+    trace.root.attributes.update(attributes)
+    trace.root.end(status)
+
+
+@contextmanager
+def span(name: str, trace: Optional[Trace] = None, **attributes):
+    """
+    Span anidado. Con `trace` se continúa la traza de la sesión (nuevo update o tarea);
+    sin él cuelga del span activo en este contexto. Si no hay traza, no hace nada.
+    """
+    current = _CURRENT.get()
+    if trace is not None:
+        if current is not None and current.trace_id == trace.trace_id and not current.ended:
+            parent = current
+        else:
+            parent = trace.root
+    else:
+        parent = current if current is not None and not current.ended else None
+    if parent is None:
+        yield None
+        return
+
+    sp = Span(parent.trace_id, name, parent.span_id, attributes)
+    token = _CURRENT.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.status = "error" if isinstance(e, Exception) else "cancelled"
+        if isinstance(e, Exception):
+            sp.attributes["exception.type"] = type(e).__name__
+            sp.attributes["exception.message"] = str(e)[:200]
+        raise
+    finally:
+        _CURRENT.reset(token)
+        sp.end()
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Añade un atributo al span activo (p. ej. aciertos de caché dentro de functionality)."""
+    sp = _CURRENT.get()
+    if sp is not None and not sp.ended:
+        sp.attributes[key] = value
+
+
+# =======================
+# Exportador a archivo (hilo en segundo plano)
+# =======================
+
+class FileSpanExporter:
+    """
+    Encola spans terminados y un hilo daemon los escribe por lotes en
+    `TRACE_DIR/spans-AAAAMMDD.jsonl`: una línea por lote con la forma de un
+    ExportTraceServiceRequest de OTLP/JSON (`resourceSpans`).
+    """
+
+    def __init__(self, directory: str = TRACE_DIR, flush_seconds: float = TRACE_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+
+    def submit(self, sp: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(sp)
+
+    def _run(self) -> None:
+        while True:
+            batch: list[Span] = []
+            try:
+                item = self._queue.get(timeout=self.flush_seconds)
+                if item is None:
+                    return
+                batch.append(item)
+                while True:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        self._write(batch)
+                        return
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[Span]) -> None:
+        doc = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attr("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "pacho.tracing"},
+                            "spans": [sp.to_otlp() for sp in batch]}],
+        }]}
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"spans-{day}.jsonl"), "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(doc, ensure_ascii=False, default=str) + "\n")
+            self.exported += len(batch)
+        except Exception as e:
+            logger.error(f"[TRACING] No se pudieron escribir {len(batch)} spans: {e}")
+
+    def shutdown(self) -> None:
+        """Escribe lo pendiente y detiene el hilo."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+EXPORTER = FileSpanExporter()
+atexit.register(EXPORTER.shutdown)
+
+
+def _export(sp: Span) -> None:
+    EXPORTER.submit(sp)
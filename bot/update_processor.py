@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import db_budget
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[int]:
+    """Clave de serialización de un update: el chat y, si no hay chat, el usuario."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Procesa updates de forma concurrente entre chats distintos, pero en serie
+    dentro de un mismo chat (cola FIFO por chat), para que los callbacks de la
+    encuesta de un usuario nunca se adelanten entre sí.
+
+    Args:
+        max_concurrent_updates (int): Handlers ejecutándose a la vez (todos los chats).
+        max_pending_updates (int): Updates aceptados (en ejecución + en espera) antes
+            de que PTB deje de despachar nuevos.
+    """
+
+    __slots__ = ("_concurrency", "_workers", "_chat_locks", "_chat_waiters")
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = 1024):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates debe ser un entero positivo")
+        # El semáforo de la clase base acota los updates pendientes; el nuestro acota
+        # los que realmente se ejecutan. Así un chat con muchos updates en cola no
+        # ocupa huecos de ejecución mientras espera su turno.
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._concurrency = max_concurrent_updates
+        self._workers: Optional[asyncio.Semaphore] = None
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_waiters: dict[int, int] = {}
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    @property
+    def active_chats(self) -> int:
+        """Chats con al menos un update en ejecución o en cola."""
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        self._workers = asyncio.Semaphore(self._concurrency)
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+        self._chat_waiters.clear()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self._workers is None:
+            await self.initialize()
+
+        key = update_key(update)
+        scope = {"update_id": getattr(update, "update_id", None)}
+        if key is None:
+            async with self._workers:
+                with db_budget.track("update", **scope):
+                    await coroutine
+            return
+
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._workers:
+                    with db_budget.track("update", chat_id=key, **scope):
+                        await coroutine
+        finally:
+            remaining = self._chat_waiters[key] - 1
+            if remaining:
+                self._chat_waiters[key] = remaining
+            else:
+                # último update del chat: liberar el lock para no acumular uno por usuario
+                del self._chat_waiters[key]
+                self._chat_locks.pop(key, None)
@@ -0,0 +1,140 @@
+"""
+Calibra el umbral de la cascada CNN del bot (CNN_CASCADE_THRESHOLD): el modelo rápido
+responde cuando su probabilidad top alcanza el umbral y, si no, la imagen pasa al modelo
+completo. Sobre un conjunto etiquetado (val por defecto) se elige el umbral con menor
+tiempo de CPU medio por imagen cuya precisión no caiga más de --tolerance respecto al
+modelo completo solo.
+
+Uso:
+    python calibrate_cascade.py --fast alumno_elegido.keras --full ModeloFinal4.keras
+    python calibrate_cascade.py --fast rapido.keras --full completo.keras --split val --tolerance 0.005
+    python calibrate_cascade.py --fast rapido.keras --full completo.keras --packed DatasetPacked/index.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from cnn_pipeline import build_dataset, build_record_dataset, load_serving_model
+
+DATA_DIR = "DatasetSplitHibrido"
+BATCH_SIZE = 16
+NUM_CLASSES = 3
+
+
+def predict_split(model, ds) -> tuple[np.ndarray, np.ndarray]:
+    """(probabilidades, etiquetas) de todo el split."""
+    probs, labels = [], []
+    for x, y in ds:
+        probs.append(np.asarray(model.predict_on_batch(tf.cast(x, tf.uint8))))
+        labels.append(np.argmax(y, axis=-1))
+    return np.concatenate(probs), np.concatenate(labels)
+
+
+def cpu_ms_per_image(model, images: np.ndarray, samples: int = 50) -> float:
+    """CPU (todos los hilos del proceso) por imagen con lotes de 1, como una foto en el bot."""
+    for x in images[:3]:
+        model.predict(x[None], verbose=0)
+    n = min(samples, len(images))
+    t0 = time.process_time()
+    for x in images[:n]:
+        model.predict(x[None], verbose=0)
+    return (time.process_time() - t0) * 1000 / n
+
+
+def sweep(fast_probs: np.ndarray, full_probs: np.ndarray, labels: np.ndarray,
+          fast_ms: float, full_ms: float, thresholds) -> list[dict]:
+    fast_conf = fast_probs.max(axis=1)
+    fast_ok = fast_probs.argmax(axis=1) == labels
+    full_ok = full_probs.argmax(axis=1) == labels
+    rows = []
+    for t in thresholds:
+        escalate = fast_conf < t
+        rows.append({
+            "threshold": float(t),
+            "escalated": float(escalate.mean()),
+            "accuracy": float(np.where(escalate, full_ok, fast_ok).mean()),
+            "cpu_ms": fast_ms + float(escalate.mean()) * full_ms,
+        })
+    return rows
+
+
+def choose(rows: list[dict], full_accuracy: float, tolerance: float) -> dict:
+    """Umbral más barato dentro de la tolerancia; a igual coste, el más alto (más prudente)."""
+    ok = [r for r in rows if r["accuracy"] >= full_accuracy - tolerance]
+    return min(ok, key=lambda r: (r["cpu_ms"], -r["threshold"]))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Calibra CNN_CASCADE_THRESHOLD (modelo rápido -> completo).")
+    p.add_argument("--fast", required=True, help="modelo rápido (CNN_CASCADE_FAST_MODEL_PATH)")
+    p.add_argument("--full", required=True, help="modelo completo (LECHUGA_MODEL_PATH)")
+    p.add_argument("--legacy-scale", choices=("unit", "mobilenet"),
+                   default=os.getenv("CNN_LEGACY_PREPROCESS", "mobilenet"),
+                   help="normalización de modelos sin capa 'preprocess' (la misma que usa el bot)")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--packed", default=None, help="index.json de pack_dataset.py en lugar de las carpetas")
+    p.add_argument("--split", default="val")
+    p.add_argument("--tolerance", type=float, default=0.01, help="pérdida de precisión aceptable")
+    p.add_argument("--timing-samples", type=int, default=50)
+    p.add_argument("--json", default=None, help="guardar el barrido completo")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    tf.config.set_visible_devices([], 'GPU')
+    fast = load_serving_model(args.fast, args.legacy_scale)
+    full = load_serving_model(args.full, args.legacy_scale)
+    img_size = full.input_shape[1]
+    if fast.input_shape[1] != img_size:
+        raise SystemExit(f"Entradas distintas: rápido {fast.input_shape[1]}px, completo {img_size}px "
+                         f"(el bot envía la misma imagen a los dos)")
+
+    if args.packed:
+        ds, classes, _ = build_record_dataset(args.packed, args.split, BATCH_SIZE, NUM_CLASSES, cache="memory")
+    else:
+        ds, classes, _ = build_dataset(os.path.join(args.data_dir, args.split), img_size, BATCH_SIZE,
+                                       NUM_CLASSES, cache="memory")
+    fast_probs, labels = predict_split(fast, ds)
+    full_probs, _ = predict_split(full, ds)
+    images = np.concatenate([tf.cast(x, tf.uint8).numpy() for x, _ in ds.take(-(-args.timing_samples // BATCH_SIZE))])
+    fast_ms = cpu_ms_per_image(fast, images, args.timing_samples)
+    full_ms = cpu_ms_per_image(full, images, args.timing_samples)
+
+    # umbrales candidatos: cada confianza observada (óptimo exacto) más una rejilla legible
+    grid = np.round(np.arange(0.50, 1.0, 0.05), 2)
+    candidates = np.unique(np.concatenate([[0.0, 1.01], grid, fast_probs.max(axis=1)]))
+    rows = sweep(fast_probs, full_probs, labels, fast_ms, full_ms, candidates)
+    full_acc = float((full_probs.argmax(axis=1) == labels).mean())
+    fast_acc = float((fast_probs.argmax(axis=1) == labels).mean())
+    best = choose(rows, full_acc, args.tolerance)
+
+    print(f"\n=== {args.split}: {len(labels)} imágenes · clases {classes} ===")
+    print(f"Rápido:   acc={fast_acc:.4f}  CPU {fast_ms:.1f} ms/img")
+    print(f"Completo: acc={full_acc:.4f}  CPU {full_ms:.1f} ms/img")
+    print(f"\n{'umbral':>8}{'escaladas':>11}{'acc':>9}{'CPU ms/img':>12}")
+    for r in sweep(fast_probs, full_probs, labels, fast_ms, full_ms, grid):
+        print(f"{r['threshold']:>8.2f}{r['escalated']:>11.1%}{r['accuracy']:>9.4f}{r['cpu_ms']:>12.1f}")
+    print(f"\n✅ Umbral elegido: {best['threshold']:.4f} — escala {best['escalated']:.1%}, "
+          f"acc {best['accuracy']:.4f} (completo {full_acc:.4f}, tolerancia {args.tolerance}), "
+          f"CPU {best['cpu_ms']:.1f} ms/img ({best['cpu_ms'] / full_ms:.0%} del completo)")
+    if best["cpu_ms"] >= full_ms:
+        print("⚠️ La cascada no ahorra CPU frente al modelo completo solo: deja CNN_CASCADE_FAST_MODEL_PATH vacío")
+    else:
+        print(f"   CNN_CASCADE_FAST_MODEL_PATH={args.fast}")
+        print(f"   CNN_CASCADE_THRESHOLD={best['threshold']:.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"split": args.split, "images": int(len(labels)), "fast_ms": fast_ms, "full_ms": full_ms,
+                       "fast_accuracy": fast_acc, "full_accuracy": full_acc, "tolerance": args.tolerance,
+                       "chosen": best, "sweep": rows}, fh, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
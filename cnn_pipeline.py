@@ -0,0 +1,605 @@
+"""
+Entrada de datos para TrainCNN.py con tf.data: decodificación JPEG en paralelo,
+caché de las imágenes ya redimensionadas (uint8), barajado, aumentos vectorizados
+por lote con una capa de Keras y prefetch AUTOTUNE. Sustituye a
+`ImageDataGenerator.flow_from_directory`, que decodifica y aumenta imagen por
+imagen en un solo hilo de Python.
+
+También guarda en caché las características del backbone congelado (fase 1 de
+TrainCNN.py) en un .npy mapeado en memoria, para entrenar la cabeza densa sin
+volver a pasar las imágenes por MobileNet en cada época, e instrumenta el entrenamiento
+(`TrainingMonitor`: imágenes/s, espera de datos vs. cómputo, memoria y profiler).
+
+La normalización vive dentro del modelo (capa "preprocess", ver `preprocessing_layer`):
+el pipeline entrega píxeles en 0–255 y el modelo exportado recibe uint8 directamente,
+así entrenamiento y bot comparten una sola definición.
+
+Comparación de imágenes/s contra el generador:
+    python cnn_pipeline.py bench DatasetSplitHibrido/train
+    python cnn_pipeline.py bench DatasetSplitHibrido/train --steps 100 --cache /tmp/lechuga.cache
+
+Los conjuntos empaquetados con pack_dataset.py (TFRecord por fragmentos + índice) se
+leen con `build_record_dataset`.
+
+Integrar la normalización en un modelo antiguo (entrada uint8):
+    python cnn_pipeline.py wrap modelo_antiguo.keras modelo_uint8.keras --scale unit
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+AUTOTUNE = tf.data.AUTOTUNE
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Nombre de la capa de normalización; el bot la busca para decidir si envía uint8 sin tocar
+PREPROCESS_LAYER = "preprocess"
+# Escalas conocidas: (multiplicador, desplazamiento)
+SCALES = {"unit": (1. / 255, 0.0), "mobilenet": (1. / 127.5, -1.0)}
+
+
+def preprocessing_layer(scale: str = "unit") -> layers.Layer:
+    """Normalización de píxeles 0–255; "unit" -> [0, 1] (la de TrainCNN.py), "mobilenet" -> [-1, 1]."""
+    factor, offset = SCALES[scale]
+    return layers.Rescaling(factor, offset=offset, name=PREPROCESS_LAYER)
+
+
+def _graph_layers(model: keras.Model) -> list:
+    # Sequential no lista su InputLayer; un modelo funcional cargado de disco sí
+    return [l for l in model.layers if not isinstance(l, keras.layers.InputLayer)]
+
+
+def float_input_model(model: keras.Model) -> keras.Model:
+    """Misma red con entrada float32 (0–255), para usarla sobre lotes aumentados al entrenar."""
+    inp = keras.Input(model.input_shape[1:], name="image_float")
+    x = inp
+    for layer in _graph_layers(model):
+        x = layer(x)
+    return keras.Model(inp, x, name=model.name)
+
+
+def serving_model(model: keras.Model, input_size: int = None) -> keras.Model:
+    """
+    Copia de `model` (que ya empieza por la capa "preprocess") con entrada uint8, lista para
+    el bot. Con `input_size` distinto del tamaño del modelo se añade un Resizing al inicio.
+    Las capas se comparten: no duplica pesos.
+    """
+    height, width, channels = model.input_shape[1:]
+    size = input_size or height
+    inp = keras.Input((size, size, channels), dtype="uint8", name="image")
+    x = inp
+    if size != height:
+        x = layers.Resizing(height, width, name="resize")(x)
+    for layer in _graph_layers(model):
+        x = layer(x)
+    return keras.Model(inp, x, name=model.name)
+
+
+def wrap_legacy_model(model: keras.Model, scale: str = "unit", input_size: int = None) -> keras.Model:
+    """Antepone la capa "preprocess" a un modelo entrenado con normalización externa."""
+    if any(l.name == PREPROCESS_LAYER for l in model.layers):
+        raise ValueError(f"{model.name} ya tiene la capa '{PREPROCESS_LAYER}'")
+    inner = keras.Sequential([keras.Input(model.input_shape[1:]), preprocessing_layer(scale), model],
+                             name=model.name)
+    return serving_model(inner, input_size)
+
+
+def load_serving_model(path: str, legacy_scale: str = "unit") -> keras.Model:
+    """Carga un .keras con entrada uint8 y capa "preprocess"; los modelos antiguos se envuelven."""
+    model = keras.models.load_model(path)
+    if not any(l.name == PREPROCESS_LAYER for l in model.layers):
+        print(f"⚠️ {path} no tiene capa '{PREPROCESS_LAYER}'; se envuelve con escala '{legacy_scale}'")
+        model = wrap_legacy_model(model, legacy_scale)
+    return model
+
+
+def list_image_files(directory: str) -> tuple[list[str], np.ndarray, list[str]]:
+    """
+    Rutas, etiquetas y clases de un directorio `clase/imagen.jpg`. Las clases se ordenan
+    alfabéticamente, igual que en flow_from_directory, para que los índices coincidan.
+    """
+    class_names = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    paths, labels = [], []
+    for idx, name in enumerate(class_names):
+        class_dir = os.path.join(directory, name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, fname))
+                    labels.append(idx)
+    return paths, np.asarray(labels, dtype=np.int32), class_names
+
+
+def _load_image(path, img_size: int):
+    # decode_image no fija la forma; expand_animations=False garantiza un tensor 3D
+    raw = tf.io.read_file(path)
+    img = tf.io.decode_image(raw, channels=3, expand_animations=False)
+    img = tf.image.resize(img, (img_size, img_size), method="nearest")
+    # uint8 en la caché: 4 veces menos memoria que float32
+    return tf.cast(img, tf.uint8)
+
+
+class RandomAugment(layers.Layer):
+    """
+    Aumentos del ImageDataGenerator de TrainCNN.py aplicados a un lote entero:
+    rotación ±30°, desplazamiento ±20 %, cizalla ±0.2° (el generador la toma en grados),
+    zoom 0.8–1.2 por eje, volteo horizontal y brillo ×0.8–1.2.
+
+    Las transformaciones geométricas se componen en una sola matriz por imagen y se
+    aplican con un único remuestreo (como hace el generador); encadenar RandomRotation,
+    RandomTranslation, RandomZoom… remuestrea el lote una vez por capa.
+    Trabaja sobre píxeles en 0–255 (la normalización la hace el modelo).
+    channel_shift_range=0.1 no se replica: el generador lo aplica sobre 0–255, donde
+    0.1 no cambia nada.
+    """
+
+    def __init__(self, rotation: float = 30.0, shift: float = 0.2, shear: float = 0.2,
+                 zoom: float = 0.2, brightness: tuple = (0.8, 1.2), seed: int = 42, **kwargs):
+        super().__init__(**kwargs)
+        self.rotation = np.deg2rad(rotation)
+        self.shift = shift
+        self.shear = np.deg2rad(shear)
+        self.zoom = zoom
+        self.brightness = brightness
+        self.rng = tf.random.Generator.from_seed(seed)
+
+    def _transforms(self, batch, height, width):
+        u = lambda lo, hi: self.rng.uniform((batch,), lo, hi)
+        theta, shear = u(-self.rotation, self.rotation), u(-self.shear, self.shear)
+        zx, zy = u(1 - self.zoom, 1 + self.zoom), u(1 - self.zoom, 1 + self.zoom)
+        flip = tf.where(u(0.0, 1.0) < 0.5, -1.0, 1.0)
+        tx, ty = u(-self.shift, self.shift) * width, u(-self.shift, self.shift) * height
+        cos, sin = tf.cos(theta), tf.sin(theta)
+        # M = rotación · cizalla · zoom · volteo; mapea píxel de salida -> píxel de entrada
+        m00 = cos * zx * flip
+        m01 = (-cos * tf.sin(shear) - sin * tf.cos(shear)) * zy
+        m10 = sin * zx * flip
+        m11 = (-sin * tf.sin(shear) + cos * tf.cos(shear)) * zy
+        cx, cy = (width - 1) / 2, (height - 1) / 2
+        zeros = tf.zeros_like(theta)
+        return tf.stack([m00, m01, cx - m00 * cx - m01 * cy + tx,
+                         m10, m11, cy - m10 * cx - m11 * cy + ty, zeros, zeros], axis=1)
+
+    def call(self, images, training=None):
+        if not training:
+            return images
+        shape = tf.shape(images)
+        height, width = tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32)
+        images = tf.raw_ops.ImageProjectiveTransformV3(
+            images=images, transforms=self._transforms(shape[0], height, width),
+            output_shape=shape[1:3], fill_value=0.0, interpolation="BILINEAR", fill_mode="NEAREST")
+        factor = self.rng.uniform((shape[0], 1, 1, 1), *self.brightness)
+        return tf.clip_by_value(images * factor, 0.0, 255.0)
+
+
+def build_dataset(directory: str, img_size: int, batch_size: int, num_classes: int,
+                  training: bool = False, cache: str = "memory", seed: int = 42,
+                  shuffle_buffer: int = 0) -> tuple[tf.data.Dataset, list[str], np.ndarray]:
+    """
+    Dataset de (imágenes float32 en 0–255, etiquetas one-hot) listo para model.fit; el
+    modelo normaliza con su capa "preprocess".
+
+    `cache`: "memory", una ruta de archivo (caché en disco, se reutiliza entre ejecuciones)
+    o "" para no cachear. Con training=True se baraja en cada época y se aumentan los lotes.
+    Devuelve también las clases y el número de imágenes por clase (pesos balanceados).
+    """
+    paths, labels, class_names = list_image_files(directory)
+    if not paths:
+        raise ValueError(f"No hay imágenes en {directory}")
+    counts = np.bincount(labels, minlength=num_classes)
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(lambda p, y: (_load_image(p, img_size), tf.one_hot(y, num_classes)),
+                num_parallel_calls=AUTOTUNE, deterministic=not training)
+    return _batched(ds, len(paths), batch_size, training, cache, seed, shuffle_buffer), class_names, counts
+
+
+def _batched(ds: tf.data.Dataset, n: int, batch_size: int, training: bool, cache: str,
+             seed: int, shuffle_buffer: int) -> tf.data.Dataset:
+    """Caché, barajado, lotes, aumentos y prefetch sobre (imagen uint8, etiqueta one-hot)."""
+    if cache == "memory":
+        ds = ds.cache()
+    elif cache:
+        ds = ds.cache(cache)
+    if training:
+        # después de la caché: el orden cambia cada época sin volver a decodificar
+        ds = ds.shuffle(shuffle_buffer or n, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=AUTOTUNE)
+    if training:
+        aug = RandomAugment(seed=seed)
+        ds = ds.map(lambda x, y: (aug(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+# =======================
+# Conjuntos empaquetados en TFRecord (pack_dataset.py)
+# =======================
+
+RECORD_FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "label": tf.io.FixedLenFeature([], tf.int64),
+}
+
+
+def load_index(index_path: str) -> dict:
+    with open(index_path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def record_shards(index_path: str, split: str) -> list[str]:
+    """
+    Rutas de los fragmentos de `split`. Comprueba que existan y que su tamaño coincida con
+    el índice (copia incompleta); la suma SHA-256 completa la revisa `pack_dataset.py verify`.
+    """
+    index = load_index(index_path)
+    base = os.path.dirname(os.path.abspath(index_path))
+    shards = []
+    for shard in index["splits"][split]["shards"]:
+        path = os.path.join(base, shard["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != shard["bytes"]:
+            raise ValueError(f"Fragmento ausente o incompleto: {path}")
+        shards.append(path)
+    return shards
+
+
+def _parse_record(serialized, img_size: int, encoding: str):
+    ex = tf.io.parse_single_example(serialized, RECORD_FEATURES)
+    if encoding == "raw":
+        img = tf.reshape(tf.io.decode_raw(ex["image"], tf.uint8), (img_size, img_size, 3))
+    else:
+        img = tf.ensure_shape(tf.io.decode_jpeg(ex["image"], channels=3), (img_size, img_size, 3))
+    return img, ex["label"]
+
+
+def build_record_dataset(index_path: str, split: str, batch_size: int, num_classes: int,
+                         training: bool = False, cache: str = "memory", seed: int = 42,
+                         shuffle_buffer: int = 0) -> tuple[tf.data.Dataset, list[str], np.ndarray]:
+    """
+    Como `build_dataset`, pero leyendo los fragmentos TFRecord de `split` con lecturas
+    intercaladas en paralelo (las imágenes ya vienen redimensionadas al tamaño del índice).
+    """
+    index = load_index(index_path)
+    info = index["splits"][split]
+    img_size, encoding = index["img_size"], index["encoding"]
+    shards = record_shards(index_path, split)
+    counts = np.zeros(num_classes, dtype=np.int64)
+    for name, c in info["class_counts"].items():
+        counts[index["classes"].index(name)] = c
+
+    files = tf.data.Dataset.from_tensor_slices(shards)
+    if training:
+        files = files.shuffle(len(shards), seed=seed, reshuffle_each_iteration=True)
+    ds = files.interleave(tf.data.TFRecordDataset, cycle_length=min(len(shards), 8),
+                          num_parallel_calls=AUTOTUNE, deterministic=not training)
+    ds = ds.map(lambda r: _parse_record(r, img_size, encoding), num_parallel_calls=AUTOTUNE,
+                deterministic=not training)
+    ds = ds.map(lambda x, y: (x, tf.one_hot(y, num_classes)))
+    ds = ds.apply(tf.data.experimental.assert_cardinality(info["count"]))
+    return (_batched(ds, info["count"], batch_size, training, cache, seed, shuffle_buffer),
+            list(index["classes"]), counts)
+
+
+# =======================
+# Características del backbone en caché (fase 1 con la base congelada)
+# =======================
+
+def split_frozen_model(model: keras.Sequential) -> tuple[keras.Model, keras.Model]:
+    """
+    Parte un Sequential [preprocess, base, pooling, cabeza...] en extractor (hasta el
+    GlobalAveragePooling2D inclusive) y cabeza. Las capas se comparten: entrenar la
+    cabeza actualiza los pesos de `model`.
+    """
+    names = [type(l).__name__ for l in model.layers]
+    backbone_layers = names.index("GlobalAveragePooling2D") + 1
+    extractor = keras.Sequential([keras.Input(model.input_shape[1:]), *model.layers[:backbone_layers]],
+                                 name="extractor")
+    dim = extractor.output_shape[-1]
+    inp = keras.Input((dim,), name="features")
+    x = inp
+    for layer in model.layers[backbone_layers:]:
+        x = layer(x)
+    return extractor, keras.Model(inp, x, name="cabeza")
+
+
+def _fingerprint(source) -> tuple[int, str]:
+    """
+    (número de imágenes, huella) de una carpeta de imágenes o de un split empaquetado
+    `(index.json, split)`; la huella cambia si cambia cualquier imagen o fragmento.
+    """
+    h = hashlib.sha1()
+    if isinstance(source, tuple):
+        index_path, split = source
+        info = load_index(index_path)["splits"][split]
+        for shard in info["shards"]:
+            h.update(shard["sha256"].encode())
+        return info["count"], h.hexdigest()[:12]
+    paths, _, _ = list_image_files(source)
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{os.path.relpath(p, source)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return len(paths), h.hexdigest()[:12]
+
+
+def cache_features(extractor: keras.Model, batches, source, path: str,
+                   passes: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    `source` es la carpeta de imágenes o `(index.json, split)` de un conjunto empaquetado.
+    Pasa `passes` veces el conjunto por el extractor y guarda (características, etiquetas)
+    en `path` + ".features.npy" / ".labels.npy" (float16, mapeado en memoria). Con un
+    dataset de entrenamiento aumentado cada pasada es una versión distinta de cada imagen.
+    Si ya existe una caché del mismo conjunto, extractor y número de pasadas, se reutiliza.
+    """
+    n, digest = _fingerprint(source)
+    meta = {"digest": digest, "extractor": "/".join(l.name for l in extractor.layers),
+            "passes": passes, "dim": int(extractor.output_shape[-1])}
+    feat_path, label_path, meta_path = (f"{path}.features.npy", f"{path}.labels.npy", f"{path}.json")
+    if os.path.exists(meta_path) and os.path.exists(feat_path) and os.path.exists(label_path):
+        with open(meta_path, encoding="utf-8") as fh:
+            if json.load(fh) == meta:
+                print(f"✓ Características en caché: {feat_path}")
+                return np.load(feat_path, mmap_mode="r"), np.load(label_path)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    steps = len(batches)
+    features = np.lib.format.open_memmap(feat_path, mode="w+", dtype=np.float16, shape=(n * passes, meta["dim"]))
+    labels = None
+    extract = tf.function(lambda x: extractor(x, training=False), reduce_retracing=True)
+    row = 0
+    t0 = time.perf_counter()
+    for p in range(passes):
+        it = iter(batches)
+        for _ in range(steps):   # el generador antiguo no termina: se cortan `steps` lotes
+            x, y = next(it)
+            f = extract(x).numpy()
+            if labels is None:
+                labels = np.zeros((n * passes, np.shape(y)[-1]), dtype=np.float32)
+            features[row:row + len(f)] = f
+            labels[row:row + len(f)] = y
+            row += len(f)
+        print(f"  pasada {p + 1}/{passes}: {row} vectores ({time.perf_counter() - t0:.1f} s)")
+    features.flush()
+    np.save(label_path, labels[:row])
+    with open(meta_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    del features
+    return np.load(feat_path, mmap_mode="r")[:row], labels[:row]
+
+
+class ModelCheckpointFor(keras.callbacks.ModelCheckpoint):
+    """ModelCheckpoint que siempre guarda `model` (el completo) aunque se entrene solo la cabeza."""
+
+    def __init__(self, model: keras.Model, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._target = model
+
+    def set_model(self, model):
+        super().set_model(self._target)
+
+
+def _memory_mb() -> tuple[float, float]:
+    """(RSS actual, pico de RSS) del proceso en MB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            status = dict(line.split(":", 1) for line in fh if ":" in line)
+        return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KB en Linux
+        return peak, peak
+
+
+class TrainingMonitor(keras.callbacks.Callback):
+    """
+    Rendimiento por época de un `fit`: imágenes/s, tiempo de paso separado en espera de
+    datos y cómputo, y memoria del proceso; una fila por época en `log_path` (CSV).
+
+    La espera solo se mide en datasets pasados por `wrap`: un map después del último
+    prefetch anota cuándo el lote llegó al paso. Con arrays (fase 1 sobre la caché de
+    características) o ImageDataGenerator se informa solo el tiempo de paso.
+
+    Con `profile_steps=(inicio, fin)` captura una traza del profiler de TF de esos pasos
+    del fit en `profile_dir` (TensorBoard, pestaña Profile).
+    """
+
+    FIELDS = ("phase", "epoch", "steps", "images", "seconds", "images_per_second", "step_ms_mean",
+              "step_ms_p50", "data_wait_ms_mean", "compute_ms_mean", "data_wait_pct", "rss_mb", "peak_rss_mb")
+
+    def __init__(self, phase: str, batch_size: int, log_path: str, profile_dir: str = None,
+                 profile_steps: tuple[int, int] = None, input_bound: float = 0.2):
+        super().__init__()
+        self.phase = phase
+        self.batch_size = batch_size
+        self.log_path = log_path
+        self.profile_dir = profile_dir
+        self.profile_steps = profile_steps
+        self.input_bound = input_bound
+        self._ready = None   # marca de tiempo y tamaño del último lote entregado (solo con `wrap`)
+        self._rows = None
+        self._step = 0
+        self._profiling = False
+
+    def wrap(self, ds):
+        """Devuelve `ds` con la marca de llegada de cada lote; otras entradas pasan sin cambios."""
+        if not isinstance(ds, tf.data.Dataset):
+            return ds
+        self._ready = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+        self._rows = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+        def stamp(x, y):
+            with tf.control_dependencies([self._ready.assign(tf.timestamp()),
+                                          self._rows.assign(tf.shape(x, out_type=tf.int64)[0])]):
+                return tf.identity(x), tf.identity(y)
+
+        return ds.map(stamp)
+
+    def on_train_begin(self, logs=None):
+        self._step = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps, self._waits, self._images = [], [], 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.profile_steps and self._step == self.profile_steps[0] and self.profile_dir:
+            tf.profiler.experimental.start(self.profile_dir)
+            self._profiling = True
+        self._t0 = time.time()
+
+    def on_train_batch_end(self, batch, logs=None):
+        step = time.time() - self._t0
+        self._step += 1
+        if self._profiling and self._step >= self.profile_steps[1]:
+            self._stop_profiler()
+        if self._step == 1:   # el primer paso traza el grafo: no es representativo
+            return
+        self._steps.append(step)
+        if self._ready is not None:
+            self._waits.append(min(step, max(0.0, float(self._ready.numpy()) - self._t0)))
+            self._images += int(self._rows.numpy())
+        else:
+            self._images += self.batch_size
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self._steps:
+            return
+        steps = np.asarray(self._steps) * 1000
+        seconds = steps.sum() / 1000
+        rss, peak = _memory_mb()
+        row = {
+            "phase": self.phase, "epoch": epoch + 1, "steps": len(steps), "images": self._images,
+            "seconds": round(seconds, 3), "images_per_second": round(self._images / seconds, 2),
+            "step_ms_mean": round(float(steps.mean()), 2), "step_ms_p50": round(float(np.median(steps)), 2),
+            "data_wait_ms_mean": None, "compute_ms_mean": None, "data_wait_pct": None,
+            "rss_mb": round(rss, 1), "peak_rss_mb": round(peak, 1),
+        }
+        line = f"  ⏱️ [{self.phase}] época {epoch + 1}: {row['images_per_second']:.1f} img/s · paso {row['step_ms_mean']:.0f} ms"
+        if self._waits:
+            waits = np.asarray(self._waits) * 1000
+            share = waits.sum() / steps.sum()
+            row.update(data_wait_ms_mean=round(float(waits.mean()), 2),
+                       compute_ms_mean=round(float((steps - waits).mean()), 2), data_wait_pct=round(share * 100, 1))
+            line += f" (datos {row['data_wait_ms_mean']:.0f} ms / cómputo {row['compute_ms_mean']:.0f} ms)"
+            if share > self.input_bound:
+                line += " ⚠️ limitado por la entrada"
+        print(f"{line} · RSS {rss:.0f} MB (pico {peak:.0f} MB)")
+        self._write(row)
+
+    def on_train_end(self, logs=None):
+        if self._profiling:
+            self._stop_profiler()
+
+    def _stop_profiler(self):
+        tf.profiler.experimental.stop()
+        self._profiling = False
+        print(f"  🔬 Traza del profiler ({self.phase}, pasos {self.profile_steps[0]}–{self._step}): {self.profile_dir}")
+
+    def _write(self, row: dict) -> None:
+        fresh = not os.path.exists(self.log_path)
+        with open(self.log_path, "a", newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=self.FIELDS)
+            if fresh:
+                writer.writeheader()
+            writer.writerow(row)
+
+
+# =======================
+# Comparación de rendimiento
+# =======================
+
+def _legacy_generator(directory: str, img_size: int, batch_size: int):
+    """El generador de TrainCNN.py (referencia)."""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    datagen = ImageDataGenerator(
+        rotation_range=30, width_shift_range=0.2, height_shift_range=0.2,
+        shear_range=0.2, zoom_range=0.2, horizontal_flip=True, fill_mode='nearest',
+        brightness_range=[0.8, 1.2], channel_shift_range=0.1,
+    )
+    return datagen.flow_from_directory(directory, target_size=(img_size, img_size), batch_size=batch_size,
+                                       class_mode='categorical', shuffle=True, seed=42)
+
+
+def images_per_second(batches, steps: int, warmup: int = 2) -> float:
+    """Lotes por segundo * tamaño de lote, sin contar los primeros `warmup` lotes."""
+    it = iter(batches)
+    for _ in range(warmup):
+        next(it)
+    images = 0
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        x, _ = next(it)
+        images += int(x.shape[0])
+    return images / (time.perf_counter() - t0)
+
+
+def benchmark(directory: str, img_size: int = 224, batch_size: int = 16, steps: int = 50,
+              cache: str = "memory", packed: str = None) -> dict:
+    paths, _, class_names = list_image_files(directory)
+    n, num_classes = len(paths), len(class_names)
+    results = {"images": n}
+
+    gen = _legacy_generator(directory, img_size, batch_size)
+    results["generator"] = images_per_second(gen, steps)
+
+    # sin caché: lo que cuesta la primera época (decodificar + redimensionar)
+    ds, _, _ = build_dataset(directory, img_size, batch_size, num_classes, training=True, cache="")
+    results["tfdata_uncached"] = images_per_second(ds.repeat(), steps)
+
+    ds, _, _ = build_dataset(directory, img_size, batch_size, num_classes, training=True, cache=cache)
+    for _ in ds:   # una época completa llena la caché
+        pass
+    results["tfdata_cached"] = images_per_second(ds.repeat(), steps)
+
+    if packed:   # mismo split leído desde los fragmentos TFRecord, sin caché
+        split = os.path.basename(os.path.normpath(directory))
+        ds, _, _ = build_record_dataset(packed, split, batch_size, num_classes, training=True, cache="")
+        results["records_uncached"] = images_per_second(ds.repeat(), steps)
+    return results
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Utilidades de entrada de datos y exportación de la CNN.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("bench", help="imágenes/s: ImageDataGenerator vs tf.data")
+    b.add_argument("directory", help="carpeta con subcarpetas por clase (p. ej. DatasetSplitHibrido/train)")
+    b.add_argument("--img-size", type=int, default=224)
+    b.add_argument("--batch-size", type=int, default=16)
+    b.add_argument("--steps", type=int, default=50, help="lotes medidos por variante")
+    b.add_argument("--cache", default="memory", help="'memory', ruta de archivo o '' (sin caché)")
+    b.add_argument("--packed", default=None, help="index.json de pack_dataset.py: mide también los TFRecord")
+
+    w = sub.add_parser("wrap", help="integrar la normalización en un modelo antiguo (entrada uint8)")
+    w.add_argument("source")
+    w.add_argument("target")
+    w.add_argument("--scale", choices=sorted(SCALES), default="unit",
+                   help="normalización con la que se entrenó el modelo (TrainCNN.py: unit)")
+    w.add_argument("--input-size", type=int, default=None, help="añade un Resizing desde este tamaño")
+    args = p.parse_args(argv)
+
+    tf.config.set_visible_devices([], 'GPU')
+    if args.command == "wrap":
+        model = wrap_legacy_model(keras.models.load_model(args.source), args.scale, args.input_size)
+        model.save(args.target)
+        print(f"✅ {args.target}: entrada {model.input_shape} uint8, capa '{PREPROCESS_LAYER}' ({args.scale})")
+        return 0
+
+    r = benchmark(args.directory, args.img_size, args.batch_size, args.steps, args.cache, args.packed)
+    base = r["generator"]
+    print(f"\n=== {r['images']} imágenes · lote {args.batch_size} · {args.steps} lotes medidos ===")
+    for label, key in (("ImageDataGenerator", "generator"), ("tf.data (sin caché)", "tfdata_uncached"),
+                       ("tf.data (con caché)", "tfdata_cached"), ("TFRecord (sin caché)", "records_uncached")):
+        if key not in r:
+            continue
+        print(f"  {label:<22}{r[key]:>10.1f} img/s   x{r[key] / base:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
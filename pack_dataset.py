@@ -0,0 +1,171 @@
+"""
+Empaqueta DatasetSplitHibrido/{train,val,test} en fragmentos TFRecord con las imágenes
+ya redimensionadas y etiquetadas, más un index.json con clases, conteos y la suma
+SHA-256 de cada fragmento. TrainCNN.py los lee con PACKED_DATA=<salida>/index.json:
+pocos archivos grandes en lugar de miles de JPEG, fáciles de copiar entre máquinas.
+
+Uso:
+    python pack_dataset.py pack DatasetSplitHibrido DatasetPacked --img-size 224
+    python pack_dataset.py pack DatasetSplitHibrido DatasetPacked --encoding raw   # sin decodificar al leer
+    python pack_dataset.py verify DatasetPacked/index.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import tensorflow as tf
+
+from cnn_pipeline import AUTOTUNE, _load_image, list_image_files, load_index
+
+SPLITS = ("train", "val", "test")
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _example(image: bytes, label: int) -> bytes:
+    return tf.train.Example(features=tf.train.Features(feature={
+        "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[image])),
+        "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+    })).SerializeToString()
+
+
+def _encoded_images(paths: list[str], img_size: int, encoding: str, quality: int):
+    """Decodifica y redimensiona en paralelo (mismo redimensionado que el entrenamiento)."""
+    def encode(path):
+        img = _load_image(path, img_size)
+        if encoding == "raw":
+            return img
+        return tf.io.encode_jpeg(img, quality=quality, chroma_downsampling=False)
+
+    ds = tf.data.Dataset.from_tensor_slices(paths).map(encode, num_parallel_calls=AUTOTUNE)
+    for item in ds.prefetch(AUTOTUNE).as_numpy_iterator():
+        yield item.tobytes() if encoding == "raw" else item
+
+
+def pack_split(directory: str, out_dir: str, split: str, img_size: int, shard_size: int,
+               encoding: str, quality: int, classes: list[str], seed: int = 42) -> dict:
+    paths, labels, found = list_image_files(directory)
+    if found != classes:
+        raise ValueError(f"{split}: clases {found} distintas de las de train {classes}")
+    # barajado fijo: cada fragmento mezcla clases y la lectura intercalada no ve bloques de una sola
+    order = list(range(len(paths)))
+    random.Random(seed).shuffle(order)
+    paths = [paths[i] for i in order]
+    labels = [int(labels[i]) for i in order]
+
+    n_shards = max(1, -(-len(paths) // shard_size))
+    shards = []
+    writer, count = None, 0
+    for i, image in enumerate(_encoded_images(paths, img_size, encoding, quality)):
+        if i % shard_size == 0:
+            if writer:
+                writer.close()
+                shards[-1]["count"] = count
+            name = f"{split}-{len(shards):05d}-of-{n_shards:05d}.tfrecord"
+            shards.append({"file": name})
+            writer, count = tf.io.TFRecordWriter(os.path.join(out_dir, name)), 0
+        writer.write(_example(image, labels[i]))
+        count += 1
+    if writer:
+        writer.close()
+        shards[-1]["count"] = count
+    for shard in shards:
+        path = os.path.join(out_dir, shard["file"])
+        shard["bytes"] = os.path.getsize(path)
+        shard["sha256"] = sha256_file(path)
+    return {
+        "count": len(paths),
+        "class_counts": {c: labels.count(idx) for idx, c in enumerate(classes)},
+        "shards": shards,
+    }
+
+
+def pack(data_dir: str, out_dir: str, img_size: int = 224, shard_size: int = 1000,
+         encoding: str = "jpeg", quality: int = 95, splits=SPLITS) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    classes = list_image_files(os.path.join(data_dir, splits[0]))[2]
+    index = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": os.path.abspath(data_dir),
+        "img_size": img_size,
+        "encoding": encoding,
+        "classes": classes,
+        "splits": {},
+    }
+    for split in splits:
+        directory = os.path.join(data_dir, split)
+        if not os.path.isdir(directory):
+            print(f"⚠️ {directory} no existe, se omite")
+            continue
+        t0 = time.perf_counter()
+        info = pack_split(directory, out_dir, split, img_size, shard_size, encoding, quality, classes)
+        index["splits"][split] = info
+        size = sum(s["bytes"] for s in info["shards"]) / 1e6
+        print(f"✓ {split}: {info['count']} imágenes en {len(info['shards'])} fragmentos "
+              f"({size:.1f} MB, {time.perf_counter() - t0:.1f} s)")
+    index_path = os.path.join(out_dir, "index.json")
+    with open(index_path, "w", encoding="utf-8") as fh:
+        json.dump(index, fh, ensure_ascii=False, indent=2)
+    print(f"✅ Índice: {index_path}")
+    return index
+
+
+def verify(index_path: str) -> list[str]:
+    """Compara tamaño y SHA-256 de cada fragmento con el índice. Devuelve los problemas."""
+    index = load_index(index_path)
+    base = os.path.dirname(os.path.abspath(index_path))
+    problems = []
+    for split, info in index["splits"].items():
+        for shard in info["shards"]:
+            path = os.path.join(base, shard["file"])
+            if not os.path.exists(path):
+                problems.append(f"{shard['file']}: no existe")
+            elif os.path.getsize(path) != shard["bytes"]:
+                problems.append(f"{shard['file']}: {os.path.getsize(path)} bytes, se esperaban {shard['bytes']}")
+            elif sha256_file(path) != shard["sha256"]:
+                problems.append(f"{shard['file']}: suma SHA-256 distinta")
+    return problems
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Empaqueta el dataset de la CNN en fragmentos TFRecord.")
+    sub = p.add_subparsers(dest="command", required=True)
+    pk = sub.add_parser("pack", help="crear fragmentos + index.json")
+    pk.add_argument("data_dir", help="carpeta con train/val/test (p. ej. DatasetSplitHibrido)")
+    pk.add_argument("out_dir")
+    pk.add_argument("--img-size", type=int, default=224)
+    pk.add_argument("--shard-size", type=int, default=1000, help="imágenes por fragmento")
+    pk.add_argument("--encoding", choices=("jpeg", "raw"), default="jpeg",
+                    help="jpeg: ocupa mucho menos; raw: uint8 sin decodificar al leer")
+    pk.add_argument("--quality", type=int, default=95, help="calidad JPEG")
+    pk.add_argument("--splits", default=",".join(SPLITS))
+    vf = sub.add_parser("verify", help="revisar tamaños y sumas SHA-256")
+    vf.add_argument("index")
+    args = p.parse_args(argv)
+
+    tf.config.set_visible_devices([], 'GPU')
+    if args.command == "verify":
+        problems = verify(args.index)
+        for msg in problems:
+            print(f"❌ {msg}")
+        if not problems:
+            print("✅ Todos los fragmentos coinciden con el índice")
+        return 1 if problems else 0
+    pack(args.data_dir, args.out_dir, args.img_size, args.shard_size, args.encoding, args.quality,
+         tuple(s for s in args.splits.split(",") if s))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())